@@ -10,11 +10,12 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 if __name__ == '__main__':
-    from app.main import app, logger
+    from app.main import app, logger, init_worker
     from config import config
     
     logger.info("Starting Reddit Newsletter Flask App...")
     logger.info(f"OpenRouter Model: {config.OPENROUTER_MODEL}")
     logger.info(f"OpenRouter API Key configured: {config.has_openrouter_config}")
+    init_worker()
     
     app.run(host=config.FLASK_HOST, port=config.FLASK_PORT, debug=config.FLASK_DEBUG) 
\ No newline at end of file
@@ -0,0 +1,303 @@
+"""
+ASGI application: async streaming routes, everything else served by the Flask app
+"""
+
+import asyncio
+import io
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from app.core.async_pipeline import async_crew, close_async_http_client
+from app.core.cache import STALE
+from app.core.jobs import QueueFullError
+from app.core.jobstreams import FINAL_EVENTS
+from app.core.logsetup import job_context
+from app.core.reddit_newsletter import fresh_completions
+from app.main import (
+    app as flask_app, build_newsletter_record, clean_subreddit_name, finished_job_event, init_worker,
+    job_stream_event, job_streams, jobs, log_broadcaster, newsletter_cache, publish_newsletter, sse_event,
+)
+from config import config
+
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = [
+    (b"content-type", b"text/event-stream; charset=utf-8"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+
+# How often a stream attached to a running job looks for new draft chunks
+JOB_STREAM_POLL_SECONDS = 0.1
+
+# Flask routes are short request/response handlers; they run on this pool off the event loop
+_wsgi_executor = ThreadPoolExecutor(max_workers=config.ASGI_WSGI_THREADS, thread_name_prefix="wsgi")
+
+
+def query_params(scope):
+    """First value of each query string parameter"""
+    parsed = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    return {name: values[0] for name, values in parsed.items()}
+
+
+def header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def send_event_stream(receive, send, events):
+    """Send an async iterator of SSE strings, stopping early if the client goes away"""
+    await send({"type": "http.response.start", "status": 200, "headers": SSE_HEADERS})
+
+    async def pump():
+        async for chunk in events:
+            await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def wait_for_disconnect():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    pump_task = asyncio.ensure_future(pump())
+    disconnect_task = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        done, _ = await asyncio.wait({pump_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (pump_task, disconnect_task):
+            task.cancel()
+        # The generator is suspended inside the cancelled pump until it unwinds; aclose() only works after that
+        await asyncio.gather(pump_task, disconnect_task, return_exceptions=True)
+        await events.aclose()
+    if pump_task in done:
+        pump_task.result()
+
+
+async def job_events(job_id):
+    """SSE for a job run by the job queue; polls ``job_streams`` instead of holding a thread"""
+    index = 0
+    next_check = time.monotonic() + config.STATUS_POLL_INTERVAL
+    while True:
+        for event, data in job_streams.events_since(job_id, index):
+            index += 1
+            yield job_stream_event(event, data)
+            if event in FINAL_EVENTS:
+                return
+        if time.monotonic() >= next_check:
+            # No final event here: the job may be running in another worker process
+            final = finished_job_event(await asyncio.to_thread(jobs.get, job_id))
+            if final is not None:
+                yield final
+                return
+            yield ": keep-alive\n\n"
+            next_check = time.monotonic() + config.STATUS_POLL_INTERVAL
+        await asyncio.sleep(JOB_STREAM_POLL_SECONDS)
+
+
+# Pipelines running on the event loop; referenced so they are not garbage-collected mid-run
+_loop_jobs = set()
+
+
+async def run_job_on_loop(job):
+    """Generate a job's newsletter with the async pipeline, publishing its progress like a job thread"""
+    subreddit_name = job["subreddit"]
+    start_time = time.time()
+    stats = {}
+    newsletter, error = None, None
+    with job_context(job["id"], subreddit_name):
+        logger.info(f"Starting streamed newsletter generation for r/{subreddit_name}...")
+        try:
+            async for event, data in async_crew.kickoff_stream(subreddit_name, stats=stats):
+                if event != "done":
+                    job_streams.publish(job["id"], event, data)
+                    continue
+                processing_time = time.time() - start_time
+                logger.info(f"Streamed newsletter for r/{subreddit_name} completed in {processing_time:.2f} seconds")
+                newsletter = build_newsletter_record(subreddit_name, data, processing_time)
+                await asyncio.to_thread(publish_newsletter, subreddit_name, newsletter, stats)
+        except Exception as e:
+            logger.error(f"Error during streamed generation for r/{subreddit_name}: {str(e)}", exc_info=True)
+            newsletter, error = None, f"Failed to generate newsletter for r/{subreddit_name}: {str(e)}"
+        finally:
+            if newsletter is None and error is None:
+                error = "The newsletter run was cancelled"
+            try:
+                await asyncio.to_thread(jobs.finish, job, newsletter=newsletter, error=error, stats=stats)
+            finally:
+                # Streams end on this event, so it goes out even if the job record could not be saved
+                if error is None:
+                    job_streams.publish(job["id"], "done", newsletter)
+                else:
+                    job_streams.publish(job["id"], "failed", error)
+
+
+async def newsletter_stream_events(subreddit_name, force_refresh):
+    """Async counterpart of the Flask /generate-newsletter/stream generator
+
+    New runs are registered with the job manager, so they are deduplicated
+    with every other request for the subreddit and count against the job
+    queue, but the pipeline itself runs on the event loop. It runs as its
+    own task, so a client that disconnects does not cancel it for the
+    others attached. A stale newsletter is sent while a refresh job
+    revalidates it.
+    """
+    cached, cache_state = (None, None) if force_refresh else await asyncio.to_thread(newsletter_cache.get, subreddit_name)
+    if cached is not None and cache_state != STALE:
+        logger.info(f"Serving cached newsletter for r/{subreddit_name} over stream")
+        yield sse_event("done", {"newsletter": cached, "cache_hit": True})
+        return
+    if cached is not None:
+        try:
+            job, _ = await asyncio.to_thread(jobs.submit, subreddit_name, refresh=True)
+        except QueueFullError:
+            yield sse_event("done", {"newsletter": cached, "cache_hit": True, "stale": True})
+            return
+        yield sse_event("done", {"newsletter": cached, "cache_hit": True, "stale": True, "job_id": job["id"]})
+        return
+
+    try:
+        job, created = await asyncio.to_thread(jobs.start, subreddit_name, refresh=force_refresh)
+    except QueueFullError as e:
+        logger.warning(f"Rejected streamed newsletter request for r/{subreddit_name}: {e}")
+        yield sse_event("failed", {"error": str(e)})
+        return
+
+    if created:
+        task = asyncio.ensure_future(run_job_on_loop(job))
+        _loop_jobs.add(task)
+        task.add_done_callback(_loop_jobs.discard)
+    else:
+        logger.info(f"Attached stream for r/{subreddit_name} to in-flight job {job['id']}",
+                    extra={"job_id": job["id"], "subreddit": subreddit_name})
+    yield sse_event("status", {"message": f"Queued newsletter generation for r/{subreddit_name}..."})
+    async for event in job_events(job["id"]):
+        yield event
+
+
+async def log_events(subscriber):
+    """Async counterpart of the Flask /logs generator; waiting costs no thread"""
+    deadline = time.monotonic() + config.LOG_STREAM_MAX_SECONDS
+    try:
+        yield "retry: 2000\n\n"
+        while time.monotonic() < deadline and not subscriber.dropped:
+            try:
+                event_id, line = await asyncio.wait_for(
+                    subscriber.queue.get(), timeout=min(15, max(0.1, deadline - time.monotonic()))
+                )
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {event_id}\ndata: {line}\n\n"
+    finally:
+        log_broadcaster.unsubscribe(subscriber)
+
+
+def build_environ(scope, body):
+    """Translate an ASGI HTTP scope into a WSGI environ"""
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for key, value in scope.get("headers", []):
+        name = key.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE" or name == "CONTENT_LENGTH":
+            environ[name] = value
+            continue
+        name = f"HTTP_{name}"
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def call_wsgi(environ):
+    """Run the Flask app to completion and return ``(status, headers, body)``"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"] = int(status.split(" ", 1)[0])
+        response["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    result = flask_app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return response["status"], response["headers"], body
+
+
+async def serve_wsgi(scope, receive, send):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+        _wsgi_executor, call_wsgi, build_environ(scope, body)
+    )
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            logger.info("Starting Reddit Newsletter app via ASGI...")
+            init_worker()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_http_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path = scope["path"]
+    if path == "/generate-newsletter/stream":
+        params = query_params(scope)
+        subreddit_name = clean_subreddit_name(params.get("subreddit", "LocalLLaMA"))
+        force_refresh = params.get("refresh", "false").lower() in ("1", "true", "yes")
+        # The stream's tasks and threads copy this context, so only this request skips cached completions
+        with fresh_completions(force_refresh):
+            await send_event_stream(receive, send, newsletter_stream_events(subreddit_name, force_refresh))
+    elif path == "/logs":
+        params = query_params(scope)
+        subscriber = log_broadcaster.subscribe(
+            last_event_id=header(scope, b"last-event-id") or params.get("last_event_id"),
+            job_id=params.get("job_id") or None,
+            subreddit=params.get("subreddit") or None,
+            loop=asyncio.get_running_loop(),
+        )
+        try:
+            await send_event_stream(receive, send, log_events(subscriber))
+        finally:
+            log_broadcaster.unsubscribe(subscriber)
+    else:
+        await serve_wsgi(scope, receive, send)
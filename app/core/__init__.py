@@ -2,6 +2,6 @@
 Core functionality for the Reddit Newsletter Generator
 """
 
-from .reddit_newsletter import crew, get_demo_data, scrape_reddit, analyze_content, create_newsletter
+from .reddit_newsletter import crew, get_demo_data, scrape_reddit, iter_scrape_reddit, analyze_content, analyze_content_mapreduce, analyze_content_overlapped, run_analysis, scrape_and_analyze, create_newsletter, create_digest
 
-__all__ = ['crew', 'get_demo_data', 'scrape_reddit', 'analyze_content', 'create_newsletter'] 
\ No newline at end of file
+__all__ = ['crew', 'get_demo_data', 'scrape_reddit', 'iter_scrape_reddit', 'analyze_content', 'analyze_content_mapreduce', 'analyze_content_overlapped', 'run_analysis', 'scrape_and_analyze', 'create_newsletter', 'create_digest'] 
\ No newline at end of file
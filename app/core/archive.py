@@ -0,0 +1,183 @@
+"""
+Persistent archive of generated newsletters with full-text search
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+SUMMARY_COLUMNS = "id, subreddit, subreddits, model, generated_at, processing_seconds, source_urls"
+
+
+def _summary(row):
+    archive_id, subreddit, subreddits, model, generated_at, processing_seconds, source_urls = row[:7]
+    summary = {
+        "id": archive_id,
+        "subreddit": subreddit,
+        "model": model,
+        "generated_at": generated_at,
+        "processing_time": f"{processing_seconds:.2f}s" if processing_seconds is not None else None,
+        "source_urls": json.loads(source_urls),
+    }
+    if subreddits:
+        summary["subreddits"] = json.loads(subreddits)
+    return summary
+
+
+def match_query(text):
+    """Turn free text into an FTS5 query: every word must appear, prefixes allowed on the last one.
+
+    Each word is quoted, so FTS operators and punctuation in user input
+    cannot cause syntax errors. Returns None when there is nothing to search.
+    """
+    quoted = [f'"{term}"' for term in _TERM.findall(text or "")]
+    if not quoted:
+        return None
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+class NewsletterArchive:
+    """Every generated newsletter in SQLite, shared by all worker processes.
+
+    Newsletters are never overwritten: each run adds a row with its
+    subreddit, model, processing time and source post URLs. The content is
+    indexed with FTS5 (external content, so the text is stored once) for
+    ranked search. History pages use the row id as a cursor, so each page
+    is an index range scan however deep the client pages. Connections are
+    opened on first use in each process, never in a preloading master.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        # Connections must not cross threads or a fork, so keep one per thread and pid
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._create_schema(conn)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create_schema(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS newsletters ("
+            "id INTEGER PRIMARY KEY, subreddit TEXT NOT NULL, subreddits TEXT, model TEXT, "
+            "generated_at TEXT NOT NULL, processing_seconds REAL, source_urls TEXT NOT NULL, "
+            "content TEXT NOT NULL, html TEXT NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS newsletters_by_subreddit ON newsletters (subreddit COLLATE NOCASE, id)"
+        )
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS newsletters_fts USING fts5("
+            "subreddit, content, content='newsletters', content_rowid='id', tokenize='porter unicode61')"
+        )
+
+    def add(self, newsletter, model=None, source_urls=()):
+        """Archive a newsletter record (as built by the app) and return its archive id"""
+        processing_time = newsletter.get("processing_time")
+        try:
+            processing_seconds = float(str(processing_time).rstrip("s")) if processing_time else None
+        except ValueError:
+            processing_seconds = None
+        subreddits = newsletter.get("subreddits")
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = conn.execute(
+                "INSERT INTO newsletters (subreddit, subreddits, model, generated_at, processing_seconds, "
+                "source_urls, content, html) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (newsletter["subreddit"], json.dumps(subreddits) if subreddits else None, model,
+                 newsletter["generated_at"], processing_seconds, json.dumps(list(source_urls)),
+                 newsletter["content"], newsletter.get("html", "")),
+            )
+            archive_id = cursor.lastrowid
+            conn.execute(
+                "INSERT INTO newsletters_fts (rowid, subreddit, content) VALUES (?, ?, ?)",
+                (archive_id, newsletter["subreddit"], newsletter["content"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return archive_id
+
+    def get(self, archive_id):
+        """The full archived newsletter, or None if there is no such id"""
+        row = self._connection().execute(
+            f"SELECT {SUMMARY_COLUMNS}, content, html FROM newsletters WHERE id = ?", (archive_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        record = _summary(row)
+        record["content"], record["html"] = row[7], row[8]
+        return record
+
+    def history(self, subreddit=None, before=None, limit=20):
+        """Newest-first summaries older than id ``before``; returns ``(items, next_before)``"""
+        clauses, params = [], []
+        if subreddit:
+            clauses.append("subreddit = ? COLLATE NOCASE")
+            params.append(subreddit)
+        if before is not None:
+            clauses.append("id < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._connection().execute(
+            f"SELECT {SUMMARY_COLUMNS} FROM newsletters {where} ORDER BY id DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        items = [_summary(row) for row in rows[:limit]]
+        next_before = items[-1]["id"] if len(rows) > limit else None
+        return items, next_before
+
+    def search(self, query, subreddit=None, offset=0, limit=20):
+        """Best-matching summaries with a highlighted snippet; returns ``(items, next_offset)``"""
+        match = match_query(query)
+        if match is None:
+            return [], None
+        params = [match]
+        subreddit_clause = ""
+        if subreddit:
+            subreddit_clause = "AND n.subreddit = ? COLLATE NOCASE"
+            params.append(subreddit)
+        rows = self._connection().execute(
+            "SELECT n.id, n.subreddit, n.subreddits, n.model, n.generated_at, n.processing_seconds, "
+            "n.source_urls, snippet(newsletters_fts, 1, '**', '**', '…', 16) "
+            "FROM newsletters_fts JOIN newsletters n ON n.id = newsletters_fts.rowid "
+            f"WHERE newsletters_fts MATCH ? {subreddit_clause} "
+            "ORDER BY bm25(newsletters_fts), n.id DESC LIMIT ? OFFSET ?",
+            params + [limit + 1, offset],
+        ).fetchall()
+        items = []
+        for row in rows[:limit]:
+            item = _summary(row)
+            item["snippet"] = row[7]
+            items.append(item)
+        next_offset = offset + limit if len(rows) > limit else None
+        return items, next_offset
+
+    def count(self):
+        return self._connection().execute("SELECT COUNT(*) FROM newsletters").fetchone()[0]
+
+
+def create_archive(url):
+    """Build the archive from a URL such as ``sqlite:///tmp/archive.db``; an empty URL disables it"""
+    if not url:
+        return None
+    if url.startswith("sqlite://"):
+        return NewsletterArchive(url[len("sqlite://"):])
+    raise ValueError(f"Unsupported archive URL: {url}")
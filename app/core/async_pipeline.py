@@ -0,0 +1,293 @@
+"""
+Asyncio version of the newsletter pipeline for the ASGI serving mode
+"""
+
+import asyncio
+import logging
+import os
+import time
+import weakref
+import httpx
+from app.core import reddit_newsletter
+from app.core.cache import completion_key
+from app.core.dedup import condense_comments
+from app.core.metrics import stage_seconds
+from app.core.resilience import CircuitOpenError, call_with_retries_async, hedged_call_async
+from app.core.prompts import (
+    build_analysis_prompt, build_batch_summary_prompt, build_newsletter_prompt, build_reduce_prompt,
+)
+from app.core.reddit_newsletter import (
+    _fallback_newsletter, _openrouter_request_args, batch_posts, get_llm_cache, lookup_completion,
+    parse_stream_line, record_llm_call, record_sources, scrape_reddit,
+)
+
+logger = logging.getLogger(__name__)
+
+# Connection limits for the shared async client; one event loop serves many requests
+async_max_connections = int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", 100))
+async_max_keepalive = int(os.getenv("ASYNC_HTTP_MAX_KEEPALIVE", 20))
+
+_client = None
+_client_pid = None
+# event loop -> asyncio.Semaphore of LLM_CONCURRENCY slots; asyncio primitives belong to one loop
+_llm_slots = weakref.WeakKeyDictionary()
+
+
+def get_async_http_client():
+    """Return the process's shared httpx.AsyncClient, creating it on first use"""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=async_max_connections, max_keepalive_connections=async_max_keepalive),
+            timeout=httpx.Timeout(30, connect=10),
+        )
+        _client_pid = os.getpid()
+    return _client
+
+
+async def close_async_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_llm_slots():
+    """The running loop's limit on concurrent OpenRouter requests (``LLM_CONCURRENCY``)"""
+    loop = asyncio.get_running_loop()
+    slots = _llm_slots.get(loop)
+    if slots is None:
+        slots = _llm_slots[loop] = asyncio.Semaphore(max(1, reddit_newsletter.llm_concurrency))
+    return slots
+
+
+def _cache_lookup(messages, max_tokens, temperature, use_cache):
+    """Return ``(cache, cached_text)`` for a request; cache is None when disabled"""
+    cache = get_llm_cache() if use_cache else None
+    if cache is None:
+        return None, None
+    key = completion_key(reddit_newsletter.model_name, messages, max_tokens, temperature)
+    return cache, lookup_completion(cache, key)
+
+
+def _retryable(error):
+    """httpx counterpart of reddit_newsletter.openrouter_retryable"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+async def _with_retries(fn):
+    return await call_with_retries_async(
+        fn,
+        attempts=reddit_newsletter.openrouter_attempts,
+        base_delay=reddit_newsletter.retry_base_delay,
+        max_delay=reddit_newsletter.retry_max_delay,
+        breaker=reddit_newsletter.openrouter_breaker,
+        is_retryable=_retryable,
+        retry_after=reddit_newsletter.openrouter_retry_after,
+    )
+
+
+async def _with_fallback_models(attempt):
+    """Await ``attempt(model)`` for each model in the fallback chain; returns ``(model, result)`` of the first success"""
+    error = None
+    for model in [reddit_newsletter.model_name] + reddit_newsletter.fallback_models:
+        try:
+            return model, await attempt(model)
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            logger.warning(f"OpenRouter request with {model} failed: {e}")
+            error = e
+    raise error
+
+
+async def make_openrouter_request_async(messages, max_tokens=1500, temperature=0.7, use_cache=True, call="completion"):
+    """Async counterpart of make_openrouter_request, with the same retries, hedging and fallbacks"""
+    _openrouter_request_args(messages, max_tokens, temperature)
+    cache, cached = _cache_lookup(messages, max_tokens, temperature, use_cache)
+    if cached is not None:
+        return cached
+
+    async def post(headers, data):
+        response = await get_async_http_client().post(
+            f"{reddit_newsletter.base_url}/chat/completions", headers=headers, json=data,
+            timeout=reddit_newsletter.openrouter_timeout,
+        )
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def hedged_post(headers, data):
+        # A hedged copy shares the slot of the attempt it duplicates
+        async with get_llm_slots():
+            return await hedged_call_async(lambda: post(headers, data), reddit_newsletter.openrouter_hedge_after)
+
+    async def attempt(model):
+        headers, data = _openrouter_request_args(messages, max_tokens, temperature, model=model)
+        return await _with_retries(lambda: hedged_post(headers, data))
+
+    try:
+        start_time = time.time()
+        answered_by, content = await _with_fallback_models(attempt)
+    except Exception as e:
+        logger.warning(f"OpenRouter API request failed: {e}")
+        raise
+    record_llm_call(call, messages, content, time.time() - start_time)
+    if cache is not None:
+        cache.set(completion_key(answered_by, messages, max_tokens, temperature), content, time.time() - start_time)
+    return content
+
+
+async def stream_openrouter_request_async(messages, max_tokens=1500, temperature=0.7, use_cache=True, call="completion"):
+    """Async counterpart of stream_openrouter_request, yielding text deltas"""
+    _openrouter_request_args(messages, max_tokens, temperature, stream=True)
+    cache, cached = _cache_lookup(messages, max_tokens, temperature, use_cache)
+    if cached is not None:
+        yield cached
+        return
+
+    client = get_async_http_client()
+
+    async def open_stream(headers, data):
+        request = client.build_request("POST", f"{reddit_newsletter.base_url}/chat/completions",
+                                       headers=headers, json=data)
+        response = await client.send(request, stream=True)
+        try:
+            response.raise_for_status()
+        except Exception:
+            await response.aclose()
+            raise
+        return response
+
+    async def attempt(model):
+        headers, data = _openrouter_request_args(messages, max_tokens, temperature, stream=True, model=model)
+        return await _with_retries(lambda: open_stream(headers, data))
+
+    start_time = time.time()
+    parts = []
+    # The slot is held until the stream is fully read or the generator is closed
+    async with get_llm_slots():
+        answered_by, response = await _with_fallback_models(attempt)
+        try:
+            async for line in response.aiter_lines():
+                done, delta = parse_stream_line(line)
+                if done:
+                    break
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        finally:
+            await response.aclose()
+    record_llm_call(call, messages, "".join(parts), time.time() - start_time)
+    if cache is not None and parts:
+        cache.set(completion_key(answered_by, messages, max_tokens, temperature), "".join(parts), time.time() - start_time)
+
+
+async def analyze_content_async(scraped_data, subreddit_name="LocalLLaMA", stats=None):
+    prompt, prompt_tokens = build_analysis_prompt(scraped_data, subreddit_name, reddit_newsletter.model_name)
+    if stats is not None:
+        stats["analyze_prompt_tokens"] = prompt_tokens
+    try:
+        return await make_openrouter_request_async([{"role": "user", "content": prompt}], max_tokens=1500, temperature=0.7, call="analyze")
+    except Exception as e:
+        logger.warning(f"AI analysis failed: {e}")
+        return "AI analysis temporarily unavailable. Please check your OpenRouter configuration."
+
+
+async def analyze_content_mapreduce_async(scraped_data, subreddit_name="LocalLLaMA", batch_tokens=None, concurrency=None):
+    """Map-reduce analysis with the batch summaries running as concurrent coroutines"""
+    batch_tokens = reddit_newsletter.analysis_batch_tokens if batch_tokens is None else batch_tokens
+    concurrency = reddit_newsletter.analysis_concurrency if concurrency is None else concurrency
+    batches = batch_posts(scraped_data, batch_tokens)
+    if not batches:
+        return await analyze_content_async(scraped_data, subreddit_name)
+
+    limit = asyncio.Semaphore(max(1, concurrency))
+
+    async def summarize(batch):
+        async with limit:
+            try:
+                prompt = build_batch_summary_prompt(batch, subreddit_name)
+                return await make_openrouter_request_async([{"role": "user", "content": prompt}], max_tokens=600, temperature=0.3, call="batch_summary")
+            except Exception as e:
+                logger.warning(f"Batch summary failed: {e}")
+                return None
+
+    summaries = [summary for summary in await asyncio.gather(*(summarize(batch) for batch in batches)) if summary]
+    if not summaries:
+        return "AI analysis temporarily unavailable. Please check your OpenRouter configuration."
+
+    try:
+        prompt = build_reduce_prompt(summaries, subreddit_name)
+        return await make_openrouter_request_async([{"role": "user", "content": prompt}], max_tokens=1500, temperature=0.7, call="reduce")
+    except Exception as e:
+        logger.warning(f"AI analysis failed: {e}")
+        return "AI analysis temporarily unavailable. Please check your OpenRouter configuration."
+
+
+async def run_analysis_async(scraped_data, subreddit_name="LocalLLaMA", mode=None, stats=None):
+    mode = reddit_newsletter.analysis_mode if mode is None else mode
+    start_time = time.time()
+    # Scraping finishes before analysis starts here, so "overlapped" runs as map-reduce, as in run_analysis
+    if mode in ("mapreduce", "overlapped"):
+        analysis = await analyze_content_mapreduce_async(scraped_data, subreddit_name)
+    else:
+        analysis = await analyze_content_async(scraped_data, subreddit_name, stats=stats)
+    stage_seconds.labels(stage="analyze").observe(time.time() - start_time)
+    if stats is not None:
+        stats["analyze_mode"] = mode
+        stats["analyze_seconds"] = round(time.time() - start_time, 3)
+    return analysis
+
+
+async def create_newsletter_stream_async(analysis, scraped_data, subreddit_name="LocalLLaMA", stats=None):
+    prompt, prompt_tokens = build_newsletter_prompt(analysis, scraped_data, subreddit_name, reddit_newsletter.model_name)
+    if stats is not None:
+        stats["newsletter_prompt_tokens"] = prompt_tokens
+    produced = False
+    start_time = time.time()
+    try:
+        async for delta in stream_openrouter_request_async([{"role": "user", "content": prompt}], max_tokens=2000, temperature=0.8, call="newsletter"):
+            produced = True
+            yield delta
+    except Exception as e:
+        logger.warning(f"Newsletter creation failed: {e}")
+        if not produced:
+            yield _fallback_newsletter(scraped_data, subreddit_name)
+    stage_seconds.labels(stage="create").observe(time.time() - start_time)
+
+
+class AsyncNewsletter:
+    """Async newsletter generator mirroring SimpleNewsletter"""
+
+    async def kickoff_stream(self, subreddit_name="LocalLLaMA", stats=None):
+        """Async generator of ``(event, data)`` pairs, like SimpleNewsletter.kickoff_stream"""
+        start_time = time.time()
+        yield "status", f"Scraping Reddit content from r/{subreddit_name}..."
+        # praw is synchronous, so scraping runs on the default thread pool
+        scraped_data = await asyncio.to_thread(scrape_reddit, subreddit_name, stats=stats)
+        scraped_data = condense_comments(scraped_data, stats)
+        record_sources(scraped_data, stats)
+
+        yield "status", f"Analyzing {len(scraped_data)} posts with AI..."
+        analysis = await run_analysis_async(scraped_data, subreddit_name, stats=stats)
+
+        yield "status", "Writing newsletter..."
+        parts = []
+        async for delta in create_newsletter_stream_async(analysis, scraped_data, subreddit_name, stats=stats):
+            parts.append(delta)
+            yield "chunk", delta
+
+        stage_seconds.labels(stage="pipeline").observe(time.time() - start_time)
+        yield "done", "".join(parts)
+
+    async def kickoff(self, subreddit_name="LocalLLaMA", stats=None):
+        newsletter = None
+        async for event, data in self.kickoff_stream(subreddit_name, stats=stats):
+            if event == "done":
+                newsletter = data
+        return newsletter
+
+
+async_crew = AsyncNewsletter()
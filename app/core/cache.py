@@ -0,0 +1,164 @@
+"""
+Time-aware caches for generated content
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from app.core.metrics import cache_lookups
+
+# Cache lookup outcomes
+FRESH = "fresh"
+STALE = "stale"
+
+
+class TTLCache:
+    """Size-bounded LRU cache whose entries go stale after ``ttl`` seconds.
+
+    Stale entries are still returned for ``stale_ttl`` more seconds so callers
+    can serve them while a refresh runs in the background.
+    """
+
+    def __init__(self, max_entries=128, ttl=300, stale_ttl=0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return ``(value, FRESH | STALE)`` or ``(None, None)`` on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, None
+            value, stored_at = entry
+            state = self._state(stored_at)
+            if state is None:
+                del self._entries[key]
+                return None, None
+            self._entries.move_to_end(key)
+            return value, state
+
+    def set(self, key, value, stored_at=None):
+        with self._lock:
+            self._entries[key] = (value, stored_at if stored_at is not None else time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _state(self, stored_at):
+        age = time.time() - stored_at
+        if age < self.ttl:
+            return FRESH
+        if age < self.ttl + self.stale_ttl:
+            return STALE
+        return None
+
+
+class NewsletterCache:
+    """Generated newsletters keyed by (subreddit, model, prompt version).
+
+    An in-memory TTL/LRU front sits over the shared result store, so a
+    newsletter generated by one worker process is served by all of them.
+    """
+
+    def __init__(self, store, model, prompt_version, ttl=1800, stale_ttl=3600, max_entries=64):
+        self._store = store
+        self._model = model
+        self._prompt_version = prompt_version
+        self._memory = TTLCache(max_entries=max_entries, ttl=ttl, stale_ttl=stale_ttl)
+
+    def _key(self, subreddit_name):
+        return f"newsletter-cache:{subreddit_name.lower()}:{self._model}:{self._prompt_version}"
+
+    def get(self, subreddit_name):
+        """Return ``(newsletter, FRESH | STALE)`` or ``(None, None)``"""
+        newsletter, state = self._lookup(self._key(subreddit_name))
+        result = "hit" if state == FRESH else "stale" if state == STALE else "miss"
+        cache_lookups.labels(cache="newsletter", result=result).inc()
+        return newsletter, state
+
+    def _lookup(self, key):
+        newsletter, state = self._memory.get(key)
+        if state == FRESH:
+            return newsletter, state
+
+        # A stale copy may already have been refreshed by another worker, so check the store first
+        entry = self._store.get(key)
+        if entry is None:
+            return newsletter, state
+        self._memory.set(key, entry["newsletter"], stored_at=entry["cached_at"])
+        return self._memory.get(key)
+
+    def set(self, subreddit_name, newsletter):
+        key = self._key(subreddit_name)
+        now = time.time()
+        self._memory.set(key, newsletter, stored_at=now)
+        self._store.put(
+            key,
+            {"newsletter": newsletter, "cached_at": now},
+            ttl=self._memory.ttl + self._memory.stale_ttl,
+        )
+
+
+def completion_key(model, messages, max_tokens, temperature):
+    """Content address of a chat completion request"""
+    payload = json.dumps([model, messages, max_tokens, temperature], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionCache:
+    """LLM completions keyed by a hash of the request.
+
+    Entries live in a (size-bounded) result store with an in-memory LRU in
+    front. Each entry remembers how long the original call took, so hits
+    can report the latency they saved. Counters are per process.
+    """
+
+    def __init__(self, store, ttl=86400, max_entries=256):
+        self._store = store
+        self._memory = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key):
+        """Return the cached completion text, or None"""
+        entry, state = self._memory.get(key)
+        if state is None:
+            entry = self._store.get(f"completion:{key}")
+            if entry is not None:
+                self._memory.set(key, entry, stored_at=entry["cached_at"])
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += entry["seconds"]
+        return entry["content"]
+
+    def set(self, key, content, seconds):
+        entry = {"content": content, "seconds": round(seconds, 3), "cached_at": time.time()}
+        self._memory.set(key, entry, stored_at=entry["cached_at"])
+        self._store.put(f"completion:{key}", entry, ttl=self._memory.ttl)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "latency_saved_seconds": round(self.saved_seconds, 2),
+            }
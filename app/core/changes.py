@@ -0,0 +1,41 @@
+"""
+Change notification for long-polled status endpoints
+"""
+
+import threading
+import time
+
+
+class ChangeNotifier:
+    """Wakes long-poll requests when a versioned record changes.
+
+    Writers in this process call ``notify`` after saving a new version.
+    Waiters also re-read the record every ``poll_interval`` seconds, so
+    changes written by other worker processes are picked up too.
+    """
+
+    def __init__(self, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._generation = 0  # bumped by every notify
+
+    def notify(self):
+        with self._condition:
+            self._generation += 1
+            self._condition.notify_all()
+
+    def wait_for_change(self, fetch, since, timeout):
+        """Return ``fetch()`` once its ``version`` exceeds ``since``, or its latest value after ``timeout``"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                generation = self._generation
+            # fetch() reads the store, so it runs without the lock; notify() and other waiters never wait on it
+            record = fetch()
+            remaining = deadline - time.monotonic()
+            if record is None or record.get("version", 0) > since or remaining <= 0:
+                return record
+            with self._condition:
+                # A notify since the read bumped the generation, so it cannot be missed
+                if self._generation == generation:
+                    self._condition.wait(min(self.poll_interval, remaining))
@@ -0,0 +1,89 @@
+"""
+Long-lived API clients shared by all requests in a worker process
+
+praw and requests are imported when the first client is built, which keeps
+them out of worker boot (see app.core.startup for the preloading case).
+"""
+
+import os
+import threading
+import time
+
+# HTTP connection pool tuning for OpenRouter calls
+http_pool_connections = int(os.getenv("HTTP_POOL_CONNECTIONS", 4))  # distinct hosts kept warm
+http_pool_maxsize = int(os.getenv("HTTP_POOL_MAXSIZE", 16))  # keep-alive connections per host
+
+# Seconds a Reddit credential check result is reused by /api-status
+credential_check_ttl = int(os.getenv("CREDENTIAL_CHECK_TTL", 300))
+
+_lock = threading.Lock()
+_clients = {}
+_clients_pid = None
+_credential_check = {"checked_at": 0.0, "ok": None}
+
+
+def _registry():
+    """Return this process's client registry, discarding any inherited across a fork"""
+    global _clients_pid
+    if _clients_pid != os.getpid():
+        _clients.clear()
+        _credential_check.update(checked_at=0.0, ok=None)
+        _clients_pid = os.getpid()
+    return _clients
+
+
+def get_reddit_client():
+    """Return the worker's shared praw.Reddit instance, creating it on first use"""
+    with _lock:
+        clients = _registry()
+        if "reddit" not in clients:
+            import praw
+            clients["reddit"] = praw.Reddit(
+                client_id=os.getenv("REDDIT_CLIENT_ID", "demo-client-id"),
+                client_secret=os.getenv("REDDIT_CLIENT_SECRET", "demo-client-secret"),
+                user_agent=os.getenv("REDDIT_USER_AGENT", "demo-user-agent"),
+            )
+        return clients["reddit"]
+
+
+def get_http_session():
+    """Return the worker's pooled keep-alive requests.Session"""
+    with _lock:
+        clients = _registry()
+        if "http" not in clients:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=http_pool_connections, pool_maxsize=http_pool_maxsize)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            clients["http"] = session
+        return clients["http"]
+
+
+def reset_clients():
+    """Drop all clients so they are rebuilt on next use"""
+    with _lock:
+        session = _clients.pop("http", None)
+        _clients.clear()
+        _credential_check.update(checked_at=0.0, ok=None)
+    if session is not None:
+        session.close()
+
+
+def check_reddit_credentials():
+    """Probe the Reddit API with the shared client, caching the answer for a while"""
+    with _lock:
+        _registry()
+        if time.time() - _credential_check["checked_at"] < credential_check_ttl:
+            return _credential_check["ok"]
+
+    try:
+        get_reddit_client().subreddit("test").id  # Fetching the id forces an API call
+        ok = True
+    except Exception:
+        ok = False
+
+    with _lock:
+        _credential_check.update(checked_at=time.time(), ok=ok)
+    return ok
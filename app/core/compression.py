@@ -0,0 +1,54 @@
+"""
+Response body compression with a cache of compressed payloads
+"""
+
+import gzip
+import hashlib
+from app.core.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip is always available
+    brotli = None
+
+# Text formats worth compressing; images and event streams are left alone
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/css",
+    "text/html",
+    "text/javascript",
+    "text/plain",
+}
+
+
+def supported_encodings():
+    """Content codings this process can produce, most preferred first"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compress(body, encoding, level=6):
+    if encoding == "br":
+        return brotli.compress(body, quality=min(level, 11))
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class CompressionCache:
+    """Compressed bodies keyed by a hash of the uncompressed body and the coding.
+
+    Repeat responses (polled job results, pre-rendered pages) are compressed
+    once and then served from memory.
+    """
+
+    def __init__(self, level=6, max_entries=128, ttl=3600):
+        self.level = level
+        self._memory = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def compress(self, body, encoding):
+        key = (hashlib.sha1(body).hexdigest(), encoding)
+        compressed, state = self._memory.get(key)
+        if state is None:
+            compressed = compress(body, encoding, self.level)
+            self._memory.set(key, compressed)
+        return compressed
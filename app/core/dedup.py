@@ -0,0 +1,160 @@
+"""
+Near-duplicate and low-information comment removal before prompting
+"""
+
+import logging
+import os
+import random
+import re
+import zlib
+from app.core.metrics import comments_removed
+from app.core.prompts import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+comment_dedup = os.getenv("COMMENT_DEDUP", "true").lower() in ("1", "true", "yes")
+# Estimated Jaccard similarity of word shingles at which two comments count as the same
+comment_dedup_threshold = float(os.getenv("COMMENT_DEDUP_THRESHOLD", 0.6))
+# Comments with fewer distinct non-stopwords ("This!", "+1", a bare link) carry no signal
+comment_min_words = int(os.getenv("COMMENT_MIN_WORDS", 3))
+
+_URL = re.compile(r"https?://\S+|www\.\S+")
+_WORD = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset(
+    "a about all also an and any are as at be been but by can could did do does for from had has have he her "
+    "here him his how i if in into is it it's its just like me more my no not now of on one or our out so some "
+    "than that that's the their them then there these they this those to too up us very was we were what when "
+    "which who why will with would yeah yes you your".split()
+)
+
+SHINGLE_SIZE = 3  # words per shingle
+# 32 hash functions in 8 bands of 4: pairs above ~0.6 similarity share a band with high probability
+NUM_PERMUTATIONS = 32
+BANDS = 8
+ROWS = NUM_PERMUTATIONS // BANDS
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240601)  # fixed so signatures are stable across processes
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+
+def comment_words(text):
+    """Lowercased words of a comment with links removed"""
+    return _WORD.findall(_URL.sub(" ", text.lower()))
+
+
+def informative_words(text):
+    return {word for word in comment_words(text) if word not in STOPWORDS}
+
+
+def shingle_hashes(words):
+    if len(words) < SHINGLE_SIZE:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return {zlib.crc32(gram.encode("utf-8")) for gram in grams}
+
+
+def minhash(hashes):
+    """MinHash signature: per hash function, the smallest permuted shingle hash"""
+    return tuple(min((a * value + b) % _PRIME for value in hashes) for a, b in _PERMUTATIONS)
+
+
+def signature_similarity(first, second):
+    """Fraction of matching signature slots, an estimate of the shingle Jaccard similarity"""
+    return sum(1 for x, y in zip(first, second) if x == y) / NUM_PERMUTATIONS
+
+
+class CommentDeduplicator:
+    """Drops low-information comments and near-duplicates across a whole scrape.
+
+    Kept comments are indexed by LSH bands of their MinHash signature, so
+    each new comment is only compared with the few that share a band.
+    Within a post the highest-scored, most informative comments are
+    considered first, so they are the copies that survive. Posts may be fed
+    one at a time as they are scraped.
+    """
+
+    def __init__(self, threshold=None, min_words=None):
+        self.threshold = comment_dedup_threshold if threshold is None else threshold
+        self.min_words = comment_min_words if min_words is None else min_words
+        self._signatures = []
+        self._buckets = {}  # (band, band slice of a signature) -> indexes into _signatures
+        self.kept = 0
+        self.duplicates = 0
+        self.low_information = 0
+        self.tokens_saved = 0
+
+    def _is_duplicate(self, signature):
+        candidates = set()
+        for band in range(BANDS):
+            candidates.update(self._buckets.get((band, signature[band * ROWS:(band + 1) * ROWS]), ()))
+        return any(signature_similarity(signature, self._signatures[index]) >= self.threshold
+                   for index in candidates)
+
+    def _add(self, signature):
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for band in range(BANDS):
+            self._buckets.setdefault((band, signature[band * ROWS:(band + 1) * ROWS]), []).append(index)
+
+    def filter_post(self, post):
+        """Return a copy of the post without low-information and near-duplicate comments"""
+        comments = post["comments"]
+        scores = post.get("comment_scores") or []
+        score = lambda index: scores[index] if index < len(scores) else 0
+        informative = [informative_words(comment) for comment in comments]
+        order = sorted(range(len(comments)), key=lambda index: (-score(index), -len(informative[index]), index))
+
+        kept = []
+        for index in order:
+            if len(informative[index]) < self.min_words:
+                self.low_information += 1
+                self.tokens_saved += estimate_tokens(comments[index])
+                continue
+            signature = minhash(shingle_hashes(comment_words(comments[index])))
+            if self._is_duplicate(signature):
+                self.duplicates += 1
+                self.tokens_saved += estimate_tokens(comments[index])
+                continue
+            self._add(signature)
+            kept.append(index)
+
+        kept.sort()  # back to Reddit's order; ranking by score happens at prompt time
+        self.kept += len(kept)
+        condensed = dict(post, comments=[comments[index] for index in kept])
+        if "comment_scores" in post:
+            condensed["comment_scores"] = [score(index) for index in kept]
+        return condensed
+
+    def finish(self, stats=None):
+        """Report this run's counts, adding them to a pipeline ``stats`` dict if given"""
+        comments_removed.labels(reason="duplicate").inc(self.duplicates)
+        comments_removed.labels(reason="low_information").inc(self.low_information)
+        logger.info(f"Comment dedup kept {self.kept} comments, removed {self.duplicates} near-duplicates "
+                    f"and {self.low_information} low-information comments (~{self.tokens_saved} tokens)")
+        if stats is not None:
+            stats["dedup_comments_kept"] = self.kept
+            stats["dedup_duplicates_removed"] = self.duplicates
+            stats["dedup_low_information_removed"] = self.low_information
+            stats["dedup_tokens_saved"] = self.tokens_saved
+
+
+def condense_comments(scraped_data, stats=None):
+    """Remove near-duplicate and low-information comments from a finished scrape"""
+    if not comment_dedup:
+        return scraped_data
+    deduplicator = CommentDeduplicator()
+    condensed = [deduplicator.filter_post(post) for post in scraped_data]
+    deduplicator.finish(stats)
+    return condensed
+
+
+def condense_comment_stream(posts, stats=None):
+    """condense_comments for ``(position, post)`` pairs that arrive while the scrape runs"""
+    if not comment_dedup:
+        yield from posts
+        return
+    deduplicator = CommentDeduplicator()
+    for position, post in posts:
+        yield position, deduplicator.filter_post(post)
+    deduplicator.finish(stats)
@@ -0,0 +1,259 @@
+"""
+Background job execution for newsletter generation
+"""
+
+import contextvars
+import threading
+import uuid
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from app.core.logsetup import job_context
+
+logger = logging.getLogger(__name__)
+
+# Job lifecycle states
+QUEUED = "queued"
+PROCESSING = "processing"
+COMPLETED = "completed"
+ERROR = "error"
+
+FINISHED_STATES = (COMPLETED, ERROR)
+
+_current_job = contextvars.ContextVar("current_job", default=None)
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+
+def current_job():
+    """Record of the job whose runner is executing on this thread, as it started, or None"""
+    return _current_job.get()
+
+
+def current_job_id():
+    """Id of the job whose runner is executing on this thread, or None"""
+    job = _current_job.get()
+    return job["id"] if job is not None else None
+
+
+def is_finished_job(key, value):
+    """Finished jobs never change again, so they are safe to cache in memory"""
+    return key.startswith("job:") and value.get("status") in FINISHED_STATES
+
+
+class JobManager:
+    """Runs newsletter generation jobs on a bounded background thread pool.
+
+    ``runner(subreddit_name, stats)`` produces the newsletter and may fill
+    the ``stats`` dict, which is kept on the job record. Job state lives in
+    a ``ResultStore`` so any worker process can answer
+    status lookups. Requests for a subreddit that already has a queued or
+    running job are attached to that job instead of starting a new run.
+    Managers sharing a store need distinct ``key_prefix`` values so their
+    dedup keys cannot collide. Every state change bumps the record's
+    ``version`` and calls ``on_change()``, which lets status requests
+    long-poll for the next version.
+    """
+
+    def __init__(self, runner, store, max_workers=2, max_queue=20,
+                 retention_seconds=86400, stale_seconds=600, key_prefix="", on_change=None):
+        self._runner = runner
+        self._key_prefix = key_prefix
+        self._on_change = on_change
+        self._store = store
+        self._max_workers = max_workers
+        self._max_queue = max_queue
+        self._retention_seconds = retention_seconds
+        self._stale_seconds = stale_seconds
+        self._executor = None
+        self._inflight = {}  # dedup key -> job id, for jobs run by this process
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._max_workers,
+                thread_name_prefix="newsletter-job",
+            )
+        return self._executor
+
+    def _dedup_key(self, subreddit_name):
+        return f"{self._key_prefix}{subreddit_name.lower()}"
+
+    def _find_inflight(self, key):
+        """Look for a live job for the key, here or in another worker"""
+        job_id = self._inflight.get(key)
+        if job_id is None:
+            job_id = self._store.get(f"inflight:{key}")
+        if job_id is None:
+            return None
+        job = self._store.get(f"job:{job_id}")
+        if job is None or job["status"] in FINISHED_STATES:
+            return None
+        return job
+
+    def submit(self, subreddit_name, refresh=False):
+        """Queue a job for the subreddit, returning (job, created)
+
+        ``refresh`` marks a run that must not reuse cached intermediate
+        results (the runner reads it from ``current_job()``). A request
+        attached to an in-flight job shares that job's run as it is.
+        """
+        job, created = self._register(subreddit_name, refresh, QUEUED)
+        if created:
+            self._get_executor().submit(self._run, job)
+            logger.info(f"Queued job {job['id']} for r/{subreddit_name}",
+                        extra={"job_id": job["id"], "subreddit": subreddit_name})
+        return job, created
+
+    def start(self, subreddit_name, refresh=False):
+        """Register a run the caller performs itself (such as on an event loop), returning (job, created)
+
+        The job is deduplicated and counted against the queue limit like a
+        submitted one, and is visible to every worker as in flight. When
+        ``created`` is true the caller must end it with ``finish``.
+        """
+        job, created = self._register(subreddit_name, refresh, PROCESSING)
+        if created:
+            logger.info(f"Started job {job['id']} for r/{subreddit_name}",
+                        extra={"job_id": job["id"], "subreddit": subreddit_name})
+        return job, created
+
+    def finish(self, job, newsletter=None, error=None, stats=None):
+        """End a job registered with ``start``; it failed if ``error`` is given"""
+        try:
+            return self._update(
+                job,
+                status=ERROR if error else COMPLETED,
+                newsletter=newsletter,
+                error=error,
+                stats=stats or {},
+                finished_at=datetime.now().isoformat(),
+            )
+        finally:
+            with self._lock:
+                self._release(job)
+
+    def _register(self, subreddit_name, refresh, status):
+        key = self._dedup_key(subreddit_name)
+        with self._lock:
+            job = self._find_inflight(key)
+            if job is not None:
+                return job, False
+
+            if len(self._inflight) >= self._max_workers + self._max_queue:
+                raise QueueFullError("Too many newsletters are being generated, please try again shortly")
+
+            now = datetime.now().isoformat()
+            job = {
+                "id": uuid.uuid4().hex,
+                "subreddit": subreddit_name,
+                "status": status,
+                "created_at": now,
+                "started_at": now if status == PROCESSING else None,
+                "finished_at": None,
+                "newsletter": None,
+                "error": None,
+                "stats": {},
+                "refresh": refresh,
+                "version": 1,
+            }
+            self._inflight[key] = job["id"]
+            self._save(job)
+            # Expires on its own if this worker dies before finishing the job
+            self._store.put(f"inflight:{key}", job["id"], ttl=self._stale_seconds)
+
+        self._changed()
+        return job, True
+
+    def find(self, subreddit_name):
+        """The queued or running job for the subreddit, in any worker, or None"""
+        return self._find_inflight(self._dedup_key(subreddit_name))
+
+    def get(self, job_id):
+        """Return the job record, or None if it is unknown"""
+        return self._store.get(f"job:{job_id}")
+
+    def queue_depth(self):
+        """Number of jobs that are queued or running in this process"""
+        with self._lock:
+            return len(self._inflight)
+
+    def _save(self, job):
+        ttl = self._retention_seconds if job["status"] in FINISHED_STATES else self._stale_seconds
+        self._store.put(f"job:{job['id']}", job, ttl=ttl)
+
+    def _changed(self):
+        if self._on_change is not None:
+            self._on_change()
+
+    def _update(self, known, **fields):
+        """Apply ``fields`` to the stored job, bumping its version.
+
+        ``known`` is the last copy of the record this process saw. If the
+        stored record has expired or been evicted in the meantime, it is
+        recreated from that copy, so the result is not lost.
+        """
+        with self._lock:
+            job = self._store.get(f"job:{known['id']}")
+            if job is None:
+                logger.warning(f"Record of job {known['id']} for r/{known['subreddit']} is gone; recreating it")
+                job = known
+            job = dict(job)
+            job.update(fields)
+            job["version"] = job.get("version", 0) + 1
+            self._save(job)
+            if job["status"] in FINISHED_STATES:
+                self._release(job)
+        self._changed()
+        return job
+
+    def _release(self, job):
+        """Drop the job's dedup entries; call with the lock held"""
+        key = self._dedup_key(job["subreddit"])
+        # A newer job for the subreddit may already own the entries
+        if self._inflight.get(key) == job["id"]:
+            del self._inflight[key]
+        if self._store.get(f"inflight:{key}") == job["id"]:
+            self._store.delete(f"inflight:{key}")
+
+    def _run(self, job):
+        try:
+            job = self._update(job, status=PROCESSING, started_at=datetime.now().isoformat())
+            token = _current_job.set(job)
+            try:
+                # Everything the runner logs on this thread carries the job's fields for /logs filtering
+                with job_context(job["id"], job["subreddit"]):
+                    self._run_job(job)
+            finally:
+                _current_job.reset(token)
+        finally:
+            # Even if saving the final state failed, the subreddit must not stay deduplicated to this job
+            with self._lock:
+                self._release(job)
+
+    def _run_job(self, job):
+        job_id = job["id"]
+        logger.info(f"Job {job_id} started for r/{job['subreddit']}")
+        stats = {}
+        try:
+            newsletter = self._runner(job["subreddit"], stats)
+            job = self._update(
+                job,
+                status=COMPLETED,
+                newsletter=newsletter,
+                stats=stats,
+                finished_at=datetime.now().isoformat(),
+            )
+            logger.info(f"Job {job_id} completed for r/{job['subreddit']}")
+        except Exception as e:
+            logger.error(f"Job {job_id} failed for r/{job['subreddit']}: {str(e)}", exc_info=True)
+            self._update(
+                job,
+                status=ERROR,
+                error=f"Failed to generate newsletter for r/{job['subreddit']}: {str(e)}",
+                stats=stats,
+                finished_at=datetime.now().isoformat(),
+            )
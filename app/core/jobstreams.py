@@ -0,0 +1,74 @@
+"""
+Fan-out of a running job's progress events to every client streaming it
+"""
+
+import threading
+import time
+
+FINAL_EVENTS = ("done", "failed")
+
+
+class JobStreams:
+    """Progress events of the jobs running in this process, keyed by job id.
+
+    The job thread calls ``publish``; any number of stream requests read
+    the same events, each from the first one, so a client that attaches to
+    a job already in flight still gets the whole draft. A finished job's
+    events are kept for ``retention`` seconds for clients that arrive late.
+    Jobs run by other worker processes have no events here; their
+    followers fall back to the job record.
+    """
+
+    def __init__(self, retention=60):
+        self.retention = retention
+        self._streams = {}  # job id -> [events, finished_at]
+        self._condition = threading.Condition()
+
+    def publish(self, job_id, event, data):
+        if job_id is None:
+            return
+        with self._condition:
+            self._expire()
+            stream = self._streams.setdefault(job_id, [[], None])
+            stream[0].append((event, data))
+            if event in FINAL_EVENTS:
+                stream[1] = time.monotonic()
+            self._condition.notify_all()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.retention
+        for job_id in [job_id for job_id, (_, finished_at) in self._streams.items()
+                       if finished_at is not None and finished_at < cutoff]:
+            del self._streams[job_id]
+
+    def events_since(self, job_id, index):
+        """Events of the job from position ``index`` on, without waiting"""
+        with self._condition:
+            stream = self._streams.get(job_id)
+            return list(stream[0][index:]) if stream else []
+
+    def follow(self, job_id, poll_interval=1.0):
+        """Yield the job's ``(event, data)`` pairs until its final event.
+
+        Yields None after ``poll_interval`` seconds without a new event, so
+        the caller can send a keep-alive or check the job record.
+        """
+        index = 0
+        while True:
+            deadline = time.monotonic() + poll_interval
+            with self._condition:
+                while True:
+                    stream = self._streams.get(job_id)
+                    events = list(stream[0][index:]) if stream else []
+                    remaining = deadline - time.monotonic()
+                    if events or remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            if not events:
+                yield None
+                continue
+            for event, data in events:
+                index += 1
+                yield event, data
+                if event in FINAL_EVENTS:
+                    return
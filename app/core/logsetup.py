@@ -0,0 +1,174 @@
+"""
+Queue-based logging: callers enqueue records, one thread per process writes them
+"""
+
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - [job=%(job_id)s subreddit=%(subreddit)s] %(message)s"
+# The bracketed fields come before the message, so the first match is always the real one
+_FIELDS = re.compile(r" - \[job=(\S+) subreddit=(\S+)\] ")
+_UNSET = "-"
+
+_job_fields = contextvars.ContextVar("job_fields", default=(_UNSET, _UNSET))
+
+_listener = None
+_listener_pid = None
+_settings = None
+
+
+@contextmanager
+def job_context(job_id, subreddit=None):
+    """Tag every record logged inside the block with the job's id and subreddit"""
+    token = _job_fields.set((_field(job_id), _field(subreddit)))
+    try:
+        yield
+    finally:
+        _job_fields.reset(token)
+
+
+def _field(value):
+    return re.sub(r"\s+", "_", str(value)) if value else _UNSET
+
+
+def line_fields(line):
+    """``(job_id, subreddit)`` of a formatted log line, None where a field is unset"""
+    match = _FIELDS.search(line)
+    if match is None:
+        return None, None
+    return tuple(None if value == _UNSET else value for value in match.groups())
+
+
+class JobContextFilter(logging.Filter):
+    """Adds ``job_id`` and ``subreddit`` to records, unless passed explicitly via ``extra``"""
+
+    def filter(self, record):
+        job_id, subreddit = _job_fields.get()
+        record.job_id = _field(record.job_id) if hasattr(record, "job_id") else job_id
+        record.subreddit = _field(record.subreddit) if hasattr(record, "subreddit") else subreddit
+        return True
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues without ever waiting; records are dropped and counted when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RotatingLogHandler(logging.handlers.RotatingFileHandler):
+    """Rotates once the file reaches ``max_bytes`` or an ``interval`` boundary passes.
+
+    Every worker process appends to the same file. Before each write the
+    handler reopens the path if another process has already rotated it, so
+    lines never go to a renamed backup and the file is rotated only once.
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=0, interval=0):
+        self.interval = interval
+        self._identity = None
+        self._next_rollover = None
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+
+    def _open(self):
+        stream = super()._open()
+        stat = os.fstat(stream.fileno())
+        self._identity = (stat.st_dev, stat.st_ino)
+        if self.interval:
+            # Boundaries are wall-clock aligned so all workers agree on them
+            self._next_rollover = (int(time.time()) // self.interval + 1) * self.interval
+        return stream
+
+    def _reopen_if_moved(self):
+        try:
+            stat = os.stat(self.baseFilename)
+            identity = (stat.st_dev, stat.st_ino)
+        except FileNotFoundError:
+            identity = None
+        if identity != self._identity:
+            self.stream.close()
+            self.stream = self._open()
+
+    def shouldRollover(self, record):
+        if self._next_rollover is not None and time.time() >= self._next_rollover:
+            return True
+        return super().shouldRollover(record)
+
+    def emit(self, record):
+        if self.stream is not None:
+            self._reopen_if_moved()
+        super().emit(record)
+
+
+def setup_logging(log_file, level="INFO", max_bytes=0, backup_count=0, rotate_seconds=0, queue_size=10000):
+    """Route all logging through a queue to one writer thread in this process.
+
+    Logging calls only enqueue the record; the listener thread does the
+    stdout and file I/O. Calling it again in the same process is a
+    no-op. A forked child (such as a worker of a preloading gunicorn
+    master) does not inherit the listener thread, so it gets a fresh queue
+    and listener as soon as it starts.
+    """
+    global _listener, _listener_pid, _settings
+    if _listener is not None and _listener_pid == os.getpid():
+        return _listener
+    _settings = dict(log_file=log_file, level=level, max_bytes=max_bytes, backup_count=backup_count,
+                     rotate_seconds=rotate_seconds, queue_size=queue_size)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [
+        logging.StreamHandler(sys.stdout),
+        RotatingLogHandler(log_file, max_bytes=max_bytes, backup_count=backup_count, interval=rotate_seconds),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.addFilter(JobContextFilter())  # runs on the calling thread, where the context is
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level))
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    return _listener
+
+
+def stop_logging():
+    """Flush queued records and close the log file"""
+    global _listener
+    if _listener is None or _listener_pid != os.getpid():
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+def _restart_in_child():
+    # The inherited queue may have been locked by the parent's listener at fork time
+    if _settings is not None:
+        setup_logging(**_settings)
+
+
+atexit.register(stop_logging)
+os.register_at_fork(after_in_child=_restart_in_child)
@@ -0,0 +1,288 @@
+"""
+Log file tailing shared by every /logs subscriber in a worker process
+"""
+
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from collections import deque
+from app.core.logsetup import line_fields
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class PollingWaiter:
+    """Waits between reads with exponential backoff while the file is idle"""
+
+    def __init__(self, min_delay=0.05, max_delay=2.0):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self._delay = min_delay
+
+    def wait(self):
+        time.sleep(self._delay)
+        self._delay = min(self._delay * 2, self.max_delay)
+
+    def reset(self):
+        self._delay = self.min_delay
+
+    def close(self):
+        pass
+
+
+class InotifyWaiter:
+    """Sleeps until the kernel reports a change to the log file (Linux only).
+
+    The containing directory is watched, so the waiter keeps working when the
+    file is created, rotated or replaced.
+    """
+
+    def __init__(self, path, timeout=5.0):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        directory = os.path.dirname(os.path.abspath(path)) or "."
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self._fd, directory.encode(), mask) < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        self._name = os.path.basename(path).encode()
+        self._timeout = timeout
+
+    def wait(self):
+        # The timeout is a safety net; a relevant event normally wakes us first
+        deadline = time.monotonic() + self._timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            readable, _, _ = select.select([self._fd], [], [], remaining)
+            if not readable:
+                return
+            if self._drain_matches():
+                return
+
+    def _drain_matches(self):
+        """Consume pending events, reporting whether any concerned our file"""
+        matched = False
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+            start = offset + _EVENT_HEADER.size
+            name = data[start:start + name_length].rstrip(b"\0")
+            if name == self._name:
+                matched = True
+            offset = start + name_length
+        return matched
+
+    def reset(self):
+        pass
+
+    def close(self):
+        os.close(self._fd)
+
+
+class Subscriber:
+    """One /logs client: a bounded queue of ``(event_id, line)`` and optional field filters"""
+
+    def __init__(self, max_queue, job_id=None, subreddit=None):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.job_id = job_id
+        self.subreddit = subreddit.lower() if subreddit else None
+        self.dropped = False
+
+    def wants(self, fields):
+        """Match the ``(job_id, subreddit)`` a line was logged with, parsed once per line"""
+        job_id, subreddit = fields
+        if self.job_id is not None and job_id != self.job_id:
+            return False
+        return self.subreddit is None or (subreddit is not None and subreddit.lower() == self.subreddit)
+
+    def offer(self, item):
+        """Queue an item without blocking; False means the client has fallen behind"""
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+
+class AsyncSubscriber(Subscriber):
+    """Subscriber for asyncio handlers; lines are handed to its event loop thread-safely"""
+
+    def __init__(self, max_queue, loop, job_id=None, subreddit=None):
+        import asyncio  # only the ASGI server creates these, with its loop already running
+        super().__init__(max_queue, job_id=job_id, subreddit=subreddit)
+        self.queue = asyncio.Queue()
+        self.max_queue = max_queue
+        self.loop = loop
+
+    def offer(self, item):
+        if self.queue.qsize() >= self.max_queue:
+            return False
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            return False  # the event loop has shut down
+        return True
+
+
+class LogBroadcaster:
+    """Tails one log file on a single thread and fans new lines out to subscribers.
+
+    Each line gets an event id of ``<inode>-<byte offset>``. Every worker
+    process reading the same file produces the same ids, so a client can
+    resume with ``Last-Event-ID`` against whichever worker it reconnects to.
+    Recent lines are kept in a ring buffer for that. The job id and
+    subreddit fields of each line are parsed once here, so filtered
+    subscribers cost a comparison per line. Subscribers whose queue
+    fills up are dropped instead of slowing down the tailer or other clients.
+    """
+
+    def __init__(self, path, backlog=1000, max_queue=500, use_inotify=True):
+        self.path = path
+        self.max_queue = max_queue
+        self._use_inotify = use_inotify
+        self._backlog = deque(maxlen=backlog)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._file = None
+        self._inode = None
+        self._partial = b""
+
+    def subscribe(self, last_event_id=None, job_id=None, subreddit=None, loop=None):
+        """Register a subscriber, pre-loaded with any buffered lines after ``last_event_id``
+
+        Pass the running asyncio ``loop`` to get an ``AsyncSubscriber``.
+        """
+        self._ensure_running()
+        if loop is None:
+            subscriber = Subscriber(self.max_queue, job_id=job_id, subreddit=subreddit)
+        else:
+            subscriber = AsyncSubscriber(self.max_queue, loop, job_id=job_id, subreddit=subreddit)
+        with self._lock:
+            for event_id, line, fields in self._replay(last_event_id):
+                if subscriber.wants(fields) and not subscriber.offer((event_id, line)):
+                    break
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _replay(self, last_event_id):
+        if not last_event_id:
+            return []
+        try:
+            inode, offset = (int(part) for part in last_event_id.split("-", 1))
+        except ValueError:
+            return []
+        if inode != self._inode:
+            # The file was rotated since the client's last line; send everything we have
+            return list(self._backlog)
+        return [entry for entry in self._backlog if int(entry[0].split("-", 1)[1]) > offset]
+
+    def _ensure_running(self):
+        with self._lock:
+            # A thread inherited across fork is not running in this process
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._file, self._inode = None, None
+            self._thread = threading.Thread(target=self._run, name="log-tailer", daemon=True)
+            self._thread.start()
+
+    def _make_waiter(self):
+        if self._use_inotify and hasattr(select, "select"):
+            try:
+                return InotifyWaiter(self.path)
+            except (OSError, AttributeError):
+                pass
+        return PollingWaiter()
+
+    def _open(self):
+        """(Re)open the log file; on first open start near the end to seed the backlog"""
+        try:
+            handle = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        stat = os.fstat(handle.fileno())
+        first_open = self._inode is None
+        if self._file is not None:
+            self._file.close()
+        self._file, self._inode, self._partial = handle, stat.st_ino, b""
+        if first_open and stat.st_size > 64 * 1024:
+            handle.seek(stat.st_size - 64 * 1024)
+            handle.readline()  # skip the partial line we landed in
+        self._read_lines(publish=not first_open)
+        return True
+
+    def _rotated(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != self._inode or stat.st_size < self._file.tell()
+
+    def _read_lines(self, publish=True):
+        got_data = False
+        while True:
+            chunk = self._file.readline()
+            if not chunk:
+                return got_data
+            got_data = True
+            if not chunk.endswith(b"\n"):
+                # Writer is mid-line; keep it until the rest arrives
+                self._partial += chunk
+                continue
+            line = (self._partial + chunk).decode("utf-8", errors="replace").rstrip("\r\n")
+            self._partial = b""
+            event_id = f"{self._inode}-{self._file.tell()}"
+            fields = line_fields(line)
+            self._backlog.append((event_id, line, fields))
+            if publish:
+                self._publish(event_id, line, fields)
+
+    def _publish(self, event_id, line, fields):
+        with self._lock:
+            for subscriber in list(self._subscribers):
+                if not subscriber.wants(fields):
+                    continue
+                if not subscriber.offer((event_id, line)):
+                    subscriber.dropped = True
+                    self._subscribers.discard(subscriber)
+
+    def _run(self):
+        waiter = self._make_waiter()
+        try:
+            while self._pid == os.getpid():
+                if self._file is None or self._rotated():
+                    if self._file is not None:
+                        self._read_lines()  # finish the old file before switching
+                    self._open()
+                if self._file is not None and self._read_lines():
+                    waiter.reset()
+                waiter.wait()
+        finally:
+            waiter.close()
@@ -0,0 +1,217 @@
+"""
+In-process metrics rendered in the Prometheus text exposition format
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cached scrape to a slow LLM call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for a metric family with optional labels; children are created on first use"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels() if not self.labelnames else None
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(child.render(self.name, list(zip(self.labelnames, key))))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def render(self, name, labels):
+        return [f"{name}{_format_labels(labels)} {_format_value(self._value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing total; name it with a ``_total`` suffix"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self._buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labels):
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(list(self._buckets) + [float("inf")], counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels + [('le', _format_value(float(bound)))])} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Fixed-bucket histogram; observing is a bisect and an increment under a lock"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class _GaugeChild:
+    def __init__(self):
+        self._value = 0
+        self._function = None
+
+    def set(self, value):
+        self._value = value
+
+    def set_function(self, function):
+        """Read the value from ``function()`` at scrape time"""
+        self._function = function
+
+    def render(self, name, labels):
+        value = self._function() if self._function is not None else self._value
+        return [f"{name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Gauge(_Metric):
+    """Point-in-time value, either set directly or read from a callback"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def set_function(self, function):
+        self._default().set_function(function)
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text format (version 0.0.4)"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Pipeline metrics. Values are per worker process, so with several gunicorn workers each
+# scrape of /metrics reports the worker that happened to answer it.
+stage_seconds = Histogram(
+    "newsletter_stage_seconds",
+    "Duration of newsletter pipeline stages",
+    ["stage"],
+)
+llm_request_seconds = Histogram(
+    "newsletter_llm_request_seconds",
+    "Duration of OpenRouter calls, including retries, by call type",
+    ["call"],
+)
+llm_tokens = Counter(
+    "newsletter_llm_tokens_total",
+    "Estimated tokens sent to and received from OpenRouter",
+    ["direction"],
+)
+cache_lookups = Counter(
+    "newsletter_cache_lookups_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"],
+)
+comments_removed = Counter(
+    "newsletter_comments_removed_total",
+    "Scraped comments dropped before prompting, by reason",
+    ["reason"],
+)
+startup_seconds = Gauge(
+    "newsletter_startup_seconds",
+    "Worker startup time: importing the app, and process start to ready to serve",
+    ["phase"],
+)
+queue_depth = Gauge(
+    "newsletter_job_queue_depth",
+    "Generation jobs queued or running in this process",
+    ["queue"],
+)
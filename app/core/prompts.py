@@ -0,0 +1,221 @@
+"""
+Prompt assembly with local token estimates and per-model budgets
+"""
+
+import os
+import re
+
+# Word-like runs and single punctuation marks, roughly how BPE tokenizers split text
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+
+# Tokens available for the scraped content of a prompt, by model prefix. These sit
+# well below each model's context window to leave room for instructions and output.
+MODEL_PROMPT_BUDGETS = {
+    "mistralai/mistral-7b-instruct": 4000,
+    "anthropic/": 12000,
+    "openai/gpt-4o": 12000,
+    "google/gemini": 12000,
+    "meta-llama/llama-3.1": 12000,
+}
+DEFAULT_PROMPT_BUDGET = 4000
+
+# Optional global cap on content tokens, applied on top of the model budget
+prompt_token_budget = int(os.getenv("PROMPT_TOKEN_BUDGET", 0)) or None
+# Comments considered per post, and the longest comment kept before truncation
+prompt_comments_per_post = int(os.getenv("PROMPT_COMMENTS_PER_POST", 3))
+prompt_comment_max_tokens = int(os.getenv("PROMPT_COMMENT_MAX_TOKENS", 120))
+
+
+def estimate_tokens(text):
+    """Estimate the token count of text without calling a tokenizer.
+
+    Counts words and punctuation, with long words charged one extra token per
+    six characters. Close enough to BPE counts for budgeting and cost tracking.
+    """
+    return sum(1 + (len(piece) - 1) // 6 for piece in _TOKEN_PATTERN.findall(text))
+
+
+def prompt_budget(model):
+    """Content token budget for a model, honoring PROMPT_TOKEN_BUDGET when set"""
+    budget = DEFAULT_PROMPT_BUDGET
+    for prefix, model_budget in MODEL_PROMPT_BUDGETS.items():
+        if model.startswith(prefix):
+            budget = model_budget
+            break
+    if prompt_token_budget:
+        budget = min(budget, prompt_token_budget)
+    return budget
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to about ``max_tokens`` tokens, keeping its original formatting"""
+    used = 0
+    for match in _TOKEN_PATTERN.finditer(text):
+        used += 1 + (len(match.group()) - 1) // 6
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + "…"
+    return text
+
+
+def _normalize(comment):
+    return _WHITESPACE.sub(" ", comment).strip().lower()
+
+
+def ranked_comments(post, limit=None):
+    """Distinct comments of a post, highest score first, truncated to the per-comment limit"""
+    scores = post.get("comment_scores") or []
+    seen = set()
+    candidates = []
+    for index, comment in enumerate(post["comments"]):
+        key = _normalize(comment)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        # Without scores (e.g. demo data) keep Reddit's own ordering
+        score = scores[index] if index < len(scores) else 0
+        candidates.append((-score, index, comment))
+    candidates.sort()
+    comments = [truncate_to_tokens(comment, prompt_comment_max_tokens) for _, _, comment in candidates]
+    return comments if limit is None else comments[:limit]
+
+
+def format_post(post, comments=None):
+    """Render a post and its comments the way the analysis prompts expect"""
+    comments = post["comments"] if comments is None else comments
+    return f"Title: {post['title']}\nURL: {post['url']}\nComments: {' | '.join(comments)}\n\n"
+
+
+def build_content_summary(scraped_data, budget, comments_per_post=None):
+    """Fit posts and their best comments into ``budget`` tokens.
+
+    Every post title and URL is included first. Comments are then added in
+    rounds, each post's best remaining comment per round, so the most useful
+    text across all posts makes it in before anything is cut.
+    """
+    comments_per_post = prompt_comments_per_post if comments_per_post is None else comments_per_post
+    ranked = [ranked_comments(post, comments_per_post) for post in scraped_data]
+    chosen = [[] for _ in scraped_data]
+    used = sum(estimate_tokens(format_post(post, [])) for post in scraped_data)
+
+    for round_index in range(max((len(comments) for comments in ranked), default=0)):
+        for post_index, comments in enumerate(ranked):
+            if round_index >= len(comments):
+                continue
+            cost = estimate_tokens(comments[round_index]) + 1  # plus the " | " separator
+            if used + cost > budget:
+                continue
+            chosen[post_index].append(comments[round_index])
+            used += cost
+
+    return "".join(format_post(post, comments) for post, comments in zip(scraped_data, chosen))
+
+
+def build_analysis_prompt(scraped_data, subreddit_name, model):
+    """Return ``(prompt, estimated_tokens)`` for the single-shot analysis call"""
+    content_summary = build_content_summary(scraped_data, prompt_budget(model))
+    prompt = f"""
+    Analyze the following Reddit posts from r/{subreddit_name} and create a detailed report on the key trends, discussions, and insights:
+
+    {content_summary}
+
+    Please provide:
+    1. A summary of the most important topics being discussed
+    2. Key trends and themes in the r/{subreddit_name} community
+    3. Notable insights, tools, or resources mentioned
+    4. Your analysis of how these discussions reflect the community's interests and concerns
+
+    Focus on what matters most to the r/{subreddit_name} community and provide valuable insights.
+    """
+    return prompt, estimate_tokens(prompt)
+
+
+def build_newsletter_prompt(analysis, scraped_data, subreddit_name, model):
+    """Return ``(prompt, estimated_tokens)`` for the newsletter writing call"""
+    analysis = truncate_to_tokens(analysis, prompt_budget(model))
+    prompt = f"""
+    Based on this analysis of r/{subreddit_name} content, create an engaging newsletter in markdown format:
+
+    {analysis}
+
+    Original posts for reference:
+    {chr(10).join([f"- [{post['title']}]({post['url']})" for post in scraped_data[:5]])}
+
+    Create a newsletter with:
+    1. An engaging headline that mentions r/{subreddit_name}
+    2. 3-5 main sections highlighting different topics/trends
+    3. Use this exact markdown format for each section:
+
+    ## [Topic/Discussion Title](URL)
+    - Key facts and interesting details
+    - Why this matters to the r/{subreddit_name} community
+    - Your thoughts on implications for the community
+
+    Make it engaging, informative, and tailored to the r/{subreddit_name} community interests.
+    Include the actual URLs from the Reddit posts where relevant.
+    """
+    return prompt, estimate_tokens(prompt)
+
+
+def build_batch_summary_prompt(batch, subreddit_name):
+    """Map-step prompt condensing one batch of posts and their comments"""
+    content = "".join(format_post(post, ranked_comments(post)) for post in batch)
+    return f"""
+    Summarize the following Reddit posts from r/{subreddit_name}. For each post give the main point,
+    the notable opinions, tools or resources in its comments, and keep its URL.
+
+    {content}
+
+    Be concise and factual; this summary will be merged with summaries of other posts.
+    """
+
+
+def build_reduce_prompt(summaries, subreddit_name):
+    """Reduce-step prompt merging batch summaries into the analysis report"""
+    combined = "\n\n".join(f"Batch {index + 1}:\n{summary}" for index, summary in enumerate(summaries))
+    return f"""
+    The following are summaries of batches of Reddit posts from r/{subreddit_name}. Merge them into one detailed report on the key trends, discussions, and insights:
+
+    {combined}
+
+    Please provide:
+    1. A summary of the most important topics being discussed
+    2. Key trends and themes in the r/{subreddit_name} community
+    3. Notable insights, tools, or resources mentioned
+    4. Your analysis of how these discussions reflect the community's interests and concerns
+
+    Focus on what matters most to the r/{subreddit_name} community and provide valuable insights.
+    """
+
+
+def build_digest_prompt(sections, model):
+    """Return ``(prompt, estimated_tokens)`` for a newsletter covering several subreddits.
+
+    ``sections`` holds ``(subreddit, analysis, scraped_data)`` tuples; the
+    model budget is split evenly between their analyses.
+    """
+    share = prompt_budget(model) // max(1, len(sections))
+    names = ", ".join(f"r/{subreddit_name}" for subreddit_name, _, _ in sections)
+    blocks = []
+    for subreddit_name, analysis, scraped_data in sections:
+        links = "\n".join(f"- [{post['title']}]({post['url']})" for post in scraped_data[:3])
+        blocks.append(f"### r/{subreddit_name}\n{truncate_to_tokens(analysis, share)}\n\nPosts for reference:\n{links}")
+    combined = "\n\n".join(blocks)
+    prompt = f"""
+    Based on these analyses of {names}, create one engaging digest newsletter in markdown format:
+
+    {combined}
+
+    Create a newsletter with:
+    1. An engaging headline covering all of these communities
+    2. One section per subreddit with its 2-3 most important topics, using this exact markdown format:
+
+    ## [Topic/Discussion Title](URL)
+    - Key facts and interesting details
+    - Why this matters to that community
+
+    3. A closing section on themes shared across the communities
+
+    Include the actual URLs from the Reddit posts where relevant.
+    """
+    return prompt, estimate_tokens(prompt)
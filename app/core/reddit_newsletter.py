@@ -1,17 +1,89 @@
-import praw
+import contextvars
+import logging
 import time
 import os
-import requests
 import json
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from app.core.cache import CompletionCache, completion_key
+from app.core.dedup import condense_comment_stream, condense_comments
+from app.core.metrics import cache_lookups, llm_request_seconds, llm_tokens, stage_seconds
+from app.core.clients import get_reddit_client, get_http_session
+from app.core.prompts import (
+    build_analysis_prompt, build_batch_summary_prompt, build_digest_prompt, build_newsletter_prompt,
+    build_reduce_prompt, estimate_tokens, format_post, ranked_comments,
+)
+from app.core.ratelimit import TokenBucket
+from app.core.resilience import CircuitBreaker, CircuitOpenError, call_with_retries, hedged_call, parse_retry_after
+from app.core.store import create_result_store
+
+logger = logging.getLogger(__name__)
 
 # OpenRouter configuration
 model_name = os.getenv("OPENROUTER_MODEL", "mistralai/mistral-7b-instruct")
 api_key = os.getenv("OPENAI_API_KEY")  # OpenRouter key stored as OPENAI_API_KEY
-base_url = "https://openrouter.ai/api/v1"  # OpenRouter endpoint
+base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")  # OpenRouter endpoint
+# Process-wide cap on concurrent OpenRouter calls, shared by jobs, map-reduce batches and digests
+llm_concurrency = int(os.getenv("LLM_CONCURRENCY", 8))
+llm_slots = threading.BoundedSemaphore(max(1, llm_concurrency))
+# Models tried in order after OPENROUTER_MODEL when a call to it fails
+fallback_models = [m.strip() for m in os.getenv("OPENROUTER_FALLBACK_MODELS", "").split(",") if m.strip()]
+
+# Resilience: per-attempt timeout, attempts per model, and when to send a hedged duplicate (0 = never).
+# Hedging is off by default: a fixed delay far below the p95 of llm_request_seconds doubles spend
+openrouter_timeout = float(os.getenv("OPENROUTER_TIMEOUT", 30))
+openrouter_attempts = int(os.getenv("OPENROUTER_ATTEMPTS", 3))
+openrouter_hedge_after = float(os.getenv("OPENROUTER_HEDGE_AFTER", 0))
+retry_base_delay = float(os.getenv("RETRY_BASE_DELAY", 1.0))
+retry_max_delay = float(os.getenv("RETRY_MAX_DELAY", 30))
+reddit_attempts = int(os.getenv("REDDIT_ATTEMPTS", 3))
+# One breaker per upstream API; after CIRCUIT_FAILURE_THRESHOLD failures calls fail fast for CIRCUIT_RESET_SECONDS
+openrouter_breaker = CircuitBreaker(
+    "OpenRouter",
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5)),
+    reset_timeout=float(os.getenv("CIRCUIT_RESET_SECONDS", 30)),
+)
+reddit_breaker = CircuitBreaker(
+    "Reddit",
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5)),
+    reset_timeout=float(os.getenv("CIRCUIT_RESET_SECONDS", 30)),
+)
+
+# Completion cache keyed by a hash of the request; empty LLM_CACHE_URL disables it
+llm_cache_url = os.getenv("LLM_CACHE_URL", "sqlite:///tmp/llm_cache.db")
+llm_cache_ttl = int(os.getenv("LLM_CACHE_TTL", 86400))
+llm_cache_max_mb = float(os.getenv("LLM_CACHE_MAX_MB", 64))
+llm_cache_memory_entries = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", 256))
+_llm_cache = None
+# Set while regenerating on request: cached completions are not read, new ones still replace them
+_fresh_completions = contextvars.ContextVar("fresh_completions", default=False)
+
+# Reddit scraping configuration
+scrape_workers = int(os.getenv("SCRAPE_WORKERS", 4))  # threads fetching comment trees, 1 = serial
+# Reddit allows roughly 100 OAuth requests per minute; the bucket is shared by all scrape threads
+reddit_rate_limiter = TokenBucket(
+    rate=float(os.getenv("REDDIT_REQUESTS_PER_SECOND", 1.5)),
+    capacity=int(os.getenv("REDDIT_REQUEST_BURST", 10)),
+)
+
+# Per-post scrape cache; posts are refetched when their comment count changes or the entry expires
+scrape_cache_url = os.getenv("SCRAPE_CACHE_URL", "sqlite:///tmp/scrape_cache.db")  # empty disables
+scrape_cache_ttl = int(os.getenv("SCRAPE_CACHE_TTL", 21600))
+_scrape_cache = None
+
+# Analysis configuration: "single" sends one prompt, "mapreduce" summarizes batches in parallel then merges,
+# "overlapped" is map-reduce with batches summarized while the scrape is still running
+analysis_mode = os.getenv("ANALYSIS_MODE", "single")
+analysis_batch_tokens = int(os.getenv("ANALYSIS_BATCH_TOKENS", 1500))
+analysis_concurrency = int(os.getenv("ANALYSIS_CONCURRENCY", 4))
+
+# Bump whenever the analysis or newsletter prompts change so cached newsletters are regenerated
+PROMPT_VERSION = "2"
 
-def make_openrouter_request(messages, max_tokens=1500, temperature=0.7):
-    """Make a direct HTTP request to OpenRouter API"""
+def _openrouter_request_args(messages, max_tokens, temperature, stream=False, model=None):
+    """Build the headers and JSON body for a chat completion request"""
     if not api_key:
         raise ValueError("OPENAI_API_KEY environment variable is required (contains OpenRouter key)")
     
@@ -23,63 +95,389 @@ def make_openrouter_request(messages, max_tokens=1500, temperature=0.7):
     }
     
     data = {
-        "model": model_name,
+        "model": model or model_name,
         "messages": messages,
         "max_tokens": max_tokens,
         "temperature": temperature
     }
-    
+    if stream:
+        data["stream"] = True
+    return headers, data
+
+def get_llm_cache():
+    """Return the completion cache, or None when it is disabled"""
+    global _llm_cache
+    if _llm_cache is None and llm_cache_url:
+        store = create_result_store(llm_cache_url, max_bytes=int(llm_cache_max_mb * 1024 * 1024))
+        _llm_cache = CompletionCache(store, ttl=llm_cache_ttl, max_entries=llm_cache_memory_entries)
+    return _llm_cache
+
+def openrouter_retryable(error):
+    """Timeouts, connection errors, 429s and 5xx responses are worth retrying"""
+    import requests  # imported with the HTTP session, so this is just a lookup
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+def openrouter_retry_after(error):
+    response = getattr(error, "response", None)
+    return parse_retry_after(response.headers.get("Retry-After")) if response is not None else None
+
+def _call_with_fallback_models(attempt):
+    """Run ``attempt(model)`` for each model in the fallback chain; returns ``(model, result)`` of the first success"""
+    error = None
+    for model in [model_name] + fallback_models:
+        try:
+            return model, attempt(model)
+        except CircuitOpenError:
+            raise  # the endpoint itself is down; other models will not help
+        except Exception as e:
+            logger.warning(f"OpenRouter request with {model} failed: {e}")
+            error = e
+    raise error
+
+def _post_completion(headers, data):
+    """One attempt at a (non-streaming) chat completion"""
+    response = get_http_session().post(
+        f"{base_url}/chat/completions",
+        headers=headers,
+        json=data,
+        timeout=openrouter_timeout
+    )
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+def _hedged_post_completion(headers, data):
+    """One attempt, hedged after ``openrouter_hedge_after`` seconds; the hedged copy shares the attempt's slot"""
+    with llm_slots:
+        return hedged_call(lambda: _post_completion(headers, data), openrouter_hedge_after)
+
+def record_llm_call(call, messages, content, seconds):
+    """Record the duration and estimated size of a completed OpenRouter call"""
+    llm_request_seconds.labels(call=call).observe(seconds)
+    llm_tokens.labels(direction="prompt").inc(sum(estimate_tokens(m["content"]) for m in messages))
+    llm_tokens.labels(direction="completion").inc(estimate_tokens(content))
+
+@contextmanager
+def fresh_completions(enabled=True):
+    """Make completion cache lookups inside the block miss, so every prompt is answered anew
+
+    Explicit refreshes and stale revalidation run in this mode; the new
+    answers are still written to the cache.
+    """
+    token = _fresh_completions.set(enabled)
     try:
-        response = requests.post(
-            f"{base_url}/chat/completions",
-            headers=headers,
-            json=data,
-            timeout=30
+        yield
+    finally:
+        _fresh_completions.reset(token)
+
+def carry_fresh_completions(fn):
+    """Wrap ``fn`` so a worker thread runs it with the caller's ``fresh_completions`` setting"""
+    enabled = _fresh_completions.get()
+
+    def run(*args, **kwargs):
+        with fresh_completions(enabled):
+            return fn(*args, **kwargs)
+    return run
+
+def lookup_completion(cache, cache_key):
+    """Completion cache lookup that feeds the cache metrics"""
+    if _fresh_completions.get():
+        cache_lookups.labels(cache="completion", result="bypass").inc()
+        return None
+    cached = cache.get(cache_key)
+    cache_lookups.labels(cache="completion", result="miss" if cached is None else "hit").inc()
+    return cached
+
+def make_openrouter_request(messages, max_tokens=1500, temperature=0.7, use_cache=True, call="completion"):
+    """Make a direct HTTP request to OpenRouter API
+
+    Transient failures are retried with backoff, slow attempts are hedged,
+    and OPENROUTER_FALLBACK_MODELS are tried in turn if the model keeps
+    failing. Identical requests are answered from the completion cache
+    unless ``use_cache`` is False (e.g. when a fresh, non-deterministic
+    sample is wanted).
+    """
+    _openrouter_request_args(messages, max_tokens, temperature)  # fail early without an API key
+    cache = get_llm_cache() if use_cache else None
+    cache_key = completion_key(model_name, messages, max_tokens, temperature) if cache else None
+    if cache is not None:
+        cached = lookup_completion(cache, cache_key)
+        if cached is not None:
+            logger.info("OpenRouter response served from completion cache")
+            return cached
+    
+    def attempt(model):
+        headers, data = _openrouter_request_args(messages, max_tokens, temperature, model=model)
+        return call_with_retries(
+            lambda: _hedged_post_completion(headers, data),
+            attempts=openrouter_attempts,
+            base_delay=retry_base_delay,
+            max_delay=retry_max_delay,
+            breaker=openrouter_breaker,
+            is_retryable=openrouter_retryable,
+            retry_after=openrouter_retry_after,
         )
-        response.raise_for_status()
-        result = response.json()
-        return result["choices"][0]["message"]["content"]
+    
+    try:
+        start_time = time.time()
+        answered_by, content = _call_with_fallback_models(attempt)
     except Exception as e:
-        print(f"OpenRouter API request failed: {e}")
+        logger.warning(f"OpenRouter API request failed: {e}")
         raise
-
-def scrape_reddit(subreddit_name="LocalLLaMA", max_comments_per_post=7):
-    """Scrape Reddit content from specified subreddit"""
-    # Get Reddit credentials from environment variables
-    reddit_client_id = os.getenv("REDDIT_CLIENT_ID", "demo-client-id")
-    reddit_client_secret = os.getenv("REDDIT_CLIENT_SECRET", "demo-client-secret")
-    reddit_user_agent = os.getenv("REDDIT_USER_AGENT", "demo-user-agent")
     
+    record_llm_call(call, messages, content, time.time() - start_time)
+    if cache is not None:
+        # A fallback model's answer must not be served later as the primary model's
+        cache.set(completion_key(answered_by, messages, max_tokens, temperature), content, time.time() - start_time)
+    return content
+
+def parse_stream_line(line):
+    """Parse one line of an OpenRouter SSE stream into ``(done, text_delta)``"""
+    # Blank lines separate events; lines starting with ':' are keep-alive comments
+    if not line or not line.startswith("data:"):
+        return False, None
+    payload = line[len("data:"):].strip()
+    if payload == "[DONE]":
+        return True, None
+    chunk = json.loads(payload)
+    if "error" in chunk:
+        raise RuntimeError(f"OpenRouter stream error: {chunk['error']}")
+    choices = chunk.get("choices") or [{}]
+    return False, (choices[0].get("delta") or {}).get("content")
+
+def _open_completion_stream(headers, data):
+    """One attempt at opening a streamed completion; returns the response once headers arrive"""
+    # (connect, read) timeout: the read timeout applies between chunks, not to the whole completion
+    response = get_http_session().post(
+        f"{base_url}/chat/completions",
+        headers=headers,
+        json=data,
+        stream=True,
+        timeout=(10, openrouter_timeout)
+    )
     try:
-        reddit = praw.Reddit(
-            client_id=reddit_client_id,
-            client_secret=reddit_client_secret,
-            user_agent=reddit_user_agent,
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+    return response
+
+def stream_openrouter_request(messages, max_tokens=1500, temperature=0.7, use_cache=True, call="completion"):
+    """Stream a completion from OpenRouter, yielding text deltas as they arrive
+
+    Opening the stream is retried and falls back through the model chain
+    like make_openrouter_request; once text has been yielded a failure is
+    raised to the caller. A cached completion is yielded as a single delta;
+    a streamed one is cached only if it was read to the end.
+    """
+    _openrouter_request_args(messages, max_tokens, temperature, stream=True)  # fail early without an API key
+    cache = get_llm_cache() if use_cache else None
+    cache_key = completion_key(model_name, messages, max_tokens, temperature) if cache else None
+    if cache is not None:
+        cached = lookup_completion(cache, cache_key)
+        if cached is not None:
+            logger.info("OpenRouter response served from completion cache")
+            yield cached
+            return
+    
+    def attempt(model):
+        headers, data = _openrouter_request_args(messages, max_tokens, temperature, stream=True, model=model)
+        return call_with_retries(
+            lambda: _open_completion_stream(headers, data),
+            attempts=openrouter_attempts,
+            base_delay=retry_base_delay,
+            max_delay=retry_max_delay,
+            breaker=openrouter_breaker,
+            is_retryable=openrouter_retryable,
+            retry_after=openrouter_retry_after,
         )
-        subreddit = reddit.subreddit(subreddit_name)
-        scraped_data = []
+    
+    start_time = time.time()
+    parts = []
+    # The slot is held until the stream is fully read or the generator is closed
+    with llm_slots:
+        try:
+            answered_by, response = _call_with_fallback_models(attempt)
+        except Exception as e:
+            logger.warning(f"OpenRouter API request failed: {e}")
+            raise
+        
+        with response:
+            response.encoding = "utf-8"
+            for line in response.iter_lines(decode_unicode=True):
+                done, delta = parse_stream_line(line)
+                if done:
+                    break
+                if delta:
+                    parts.append(delta)
+                    yield delta
+    
+    record_llm_call(call, messages, "".join(parts), time.time() - start_time)
+    if cache is not None and parts:
+        cache.set(completion_key(answered_by, messages, max_tokens, temperature), "".join(parts), time.time() - start_time)
 
-        for post in subreddit.hot(limit=12):
-            post_data = {"title": post.title, "url": post.url, "comments": []}
+def reddit_retryable(error):
+    """Network errors, 429s and Reddit server errors are worth retrying"""
+    import prawcore
+    return isinstance(error, (prawcore.exceptions.RequestException, prawcore.exceptions.ServerError,
+                              prawcore.exceptions.TooManyRequests))
 
-            try:
-                post.comments.replace_more(limit=0)  # Load top-level comments only
-                comments = post.comments.list()
-                if max_comments_per_post is not None:
-                    comments = comments[:max_comments_per_post]
+def reddit_retry_after(error):
+    return parse_retry_after(getattr(error, "retry_after", None))
 
-                for comment in comments:
-                    post_data["comments"].append(comment.body)
+def reddit_call(fn):
+    """Call the Reddit API through the rate limiter, retries and the Reddit circuit breaker"""
+    def rate_limited():
+        reddit_rate_limiter.acquire()
+        return fn()
+    return call_with_retries(
+        rate_limited,
+        attempts=reddit_attempts,
+        base_delay=retry_base_delay,
+        max_delay=retry_max_delay,
+        breaker=reddit_breaker,
+        is_retryable=reddit_retryable,
+        retry_after=reddit_retry_after,
+    )
 
-                scraped_data.append(post_data)
+def _load_comments(post):
+    post.comments.replace_more(limit=0)  # Load top-level comments only
+    return post.comments.list()
+
+def _fetch_post(post, max_comments_per_post):
+    """Fetch one post's comment tree, returning (post_data or None, seconds taken)"""
+    from praw.exceptions import APIException
+    start_time = time.time()
+    post_data = {"title": post.title, "url": post.url, "comments": []}
+
+    try:
+        comments = reddit_call(lambda: _load_comments(post))
+        if max_comments_per_post is not None:
+            comments = comments[:max_comments_per_post]
+
+        post_data["comment_scores"] = []
+        for comment in comments:
+            post_data["comments"].append(comment.body)
+            post_data["comment_scores"].append(getattr(comment, "score", 0))
+
+        return post_data, time.time() - start_time
+
+    except APIException as e:
+        # Skip the post instead of stalling the request; its next scrape will try again
+        logger.warning(f"API Exception: {e}")
+        return None, time.time() - start_time
+
+def _get_scrape_cache():
+    """Return the per-post scrape cache, or None when it is disabled"""
+    global _scrape_cache
+    if _scrape_cache is None and scrape_cache_url:
+        _scrape_cache = create_result_store(scrape_cache_url)
+    return _scrape_cache
+
+def _cached_post(cache, post, max_comments_per_post):
+    """Return cached post data if it is still current for this listing entry"""
+    entry = cache.get(f"post:{post.id}")
+    if entry is None:
+        return None
+    if entry["num_comments"] != post.num_comments or entry["max_comments"] != max_comments_per_post:
+        return None
+    return {
+        "title": post.title,
+        "url": post.url,
+        "comments": entry["comments"],
+        "comment_scores": entry.get("comment_scores", []),
+    }
+
+def _cache_post(cache, post, post_data, max_comments_per_post):
+    cache.put(f"post:{post.id}", {
+        "title": post_data["title"],
+        "url": post_data["url"],
+        "comments": post_data["comments"],
+        "comment_scores": post_data["comment_scores"],
+        "num_comments": post.num_comments,
+        "max_comments": max_comments_per_post,
+        "fetched_at": time.time(),
+    }, ttl=scrape_cache_ttl)
+
+def iter_scrape_reddit(subreddit_name="LocalLLaMA", max_comments_per_post=7, workers=None, stats=None):
+    """Yield ``(position, post_data)`` for a subreddit's hot posts as each one becomes available
+
+    Cached posts come first, then fetched posts in the order their comment
+    trees arrive; ``position`` is the post's place in the hot listing.
+    Errors propagate to the caller, which decides on a fallback.
+    """
+    workers = scrape_workers if workers is None else workers
+    start_time = time.time()
+    subreddit = get_reddit_client().subreddit(subreddit_name)
+    posts = reddit_call(lambda: list(subreddit.hot(limit=12)))
 
-            except praw.exceptions.APIException as e:
-                print(f"API Exception: {e}")
-                time.sleep(60)  # Sleep for 1 minute before retrying
+    cache = _get_scrape_cache()
+    cached, to_fetch = [], []
+    for position, post in enumerate(posts):
+        post_data = _cached_post(cache, post, max_comments_per_post) if cache is not None else None
+        if post_data is not None:
+            cached.append((position, post_data))
+        else:
+            to_fetch.append((position, post))
 
-        return scraped_data
+    def fetch(item):
+        position, post = item
+        return (position, post) + _fetch_post(post, max_comments_per_post)
+
+    post_seconds = []
+    executor = None
+    if workers > 1 and len(to_fetch) > 1:
+        # Start every fetch before handing out the cached posts
+        executor = ThreadPoolExecutor(max_workers=min(workers, len(to_fetch)), thread_name_prefix="reddit-scrape")
+        futures = [executor.submit(fetch, item) for item in to_fetch]
+        fetched = (future.result() for future in as_completed(futures))
+    else:
+        fetched = (fetch(item) for item in to_fetch)
+    try:
+        yield from cached
+        for position, post, post_data, seconds in fetched:
+            post_seconds.append(round(seconds, 3))
+            if post_data is None:
+                continue
+            if cache is not None:
+                _cache_post(cache, post, post_data, max_comments_per_post)
+            yield position, post_data
+    finally:
+        if executor is not None:
+            # A consumer that stops early should not leave fetches running
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    total_seconds = time.time() - start_time
+    for seconds in post_seconds:
+        stage_seconds.labels(stage="scrape_post").observe(seconds)
+    stage_seconds.labels(stage="scrape").observe(total_seconds)
+    cache_lookups.labels(cache="scrape", result="hit").inc(len(posts) - len(to_fetch))
+    cache_lookups.labels(cache="scrape", result="miss").inc(len(to_fetch))
+    logger.info(f"Fetched {len(to_fetch)} of {len(posts)} posts from r/{subreddit_name} in {total_seconds:.2f}s "
+                f"({sum(post_seconds):.2f}s of comment fetching, {workers} workers, "
+                f"{len(posts) - len(to_fetch)} from cache)")
+
+    if stats is not None:
+        stats["scrape_workers"] = workers
+        stats["scrape_post_seconds"] = post_seconds
+        stats["scrape_cached_posts"] = len(posts) - len(to_fetch)
+        stats["scrape_seconds"] = round(total_seconds, 3)
+
+def scrape_reddit(subreddit_name="LocalLLaMA", max_comments_per_post=7, workers=None, stats=None):
+    """Scrape Reddit content from specified subreddit
+
+    Posts whose comment count has not changed since they were cached are
+    served from the scrape cache; only new or changed posts have their
+    comment trees fetched, on up to ``workers`` threads (``SCRAPE_WORKERS``
+    by default, 1 means serial). Post order is preserved. If a ``stats``
+    dict is given, per-post and total fetch timings are recorded in it.
+    """
+    try:
+        results = dict(iter_scrape_reddit(subreddit_name, max_comments_per_post, workers, stats))
+        return [results[position] for position in sorted(results)]
     except Exception as e:
-        print(f"Reddit scraping failed for r/{subreddit_name}: {e}")
+        logger.warning(f"Reddit scraping failed for r/{subreddit_name}: {e}")
         # Return demo data if Reddit fails
         return get_demo_data(subreddit_name)
 
@@ -147,78 +545,299 @@ def get_demo_data(subreddit_name="LocalLLaMA"):
             }
         ]
 
-def analyze_content(scraped_data, subreddit_name="LocalLLaMA"):
+def analyze_content(scraped_data, subreddit_name="LocalLLaMA", stats=None):
     """Analyze scraped Reddit content using AI"""
-    content_summary = ""
+    prompt, prompt_tokens = build_analysis_prompt(scraped_data, subreddit_name, model_name)
+    logger.info(f"Analysis prompt: ~{prompt_tokens} tokens")
+    if stats is not None:
+        stats["analyze_prompt_tokens"] = prompt_tokens
+
+    try:
+        return make_openrouter_request([{"role": "user", "content": prompt}], max_tokens=1500, temperature=0.7, call="analyze")
+    except Exception as e:
+        logger.warning(f"AI analysis failed: {e}")
+        return f"AI analysis temporarily unavailable. Please check your OpenRouter configuration."
+
+def batch_posts(scraped_data, batch_tokens):
+    """Group posts, in order, into batches whose formatted text fits the token budget"""
+    batches = []
+    current, current_tokens = [], 0
     for post in scraped_data:
-        content_summary += f"Title: {post['title']}\nURL: {post['url']}\n"
-        content_summary += f"Comments: {' | '.join(post['comments'][:3])}\n\n"
-    
-    prompt = f"""
-    Analyze the following Reddit posts from r/{subreddit_name} and create a detailed report on the key trends, discussions, and insights:
+        post_tokens = estimate_tokens(format_post(post, ranked_comments(post)))
+        if current and current_tokens + post_tokens > batch_tokens:
+            batches.append(current)
+            current, current_tokens = [], 0
+        # A post larger than the budget still gets a batch of its own
+        current.append(post)
+        current_tokens += post_tokens
+    if current:
+        batches.append(current)
+    return batches
 
-    {content_summary}
+def _summarize_batch(batch, subreddit_name):
+    """Map step: condense one batch of posts and all of their comments"""
+    prompt = build_batch_summary_prompt(batch, subreddit_name)
+    return make_openrouter_request([{"role": "user", "content": prompt}], max_tokens=600, temperature=0.3, call="batch_summary")
 
-    Please provide:
-    1. A summary of the most important topics being discussed
-    2. Key trends and themes in the r/{subreddit_name} community
-    3. Notable insights, tools, or resources mentioned
-    4. Your analysis of how these discussions reflect the community's interests and concerns
+def _try_summarize_batch(batch, subreddit_name):
+    try:
+        return _summarize_batch(batch, subreddit_name)
+    except Exception as e:
+        logger.warning(f"Batch summary failed: {e}")
+        return None
 
-    Focus on what matters most to the r/{subreddit_name} community and provide valuable insights.
-    """
+def _reduce_summaries(summaries, subreddit_name):
+    """Reduce step: merge the batch summaries into one analysis"""
+    if not summaries:
+        return f"AI analysis temporarily unavailable. Please check your OpenRouter configuration."
+
+    prompt = build_reduce_prompt(summaries, subreddit_name)
 
     try:
-        return make_openrouter_request([{"role": "user", "content": prompt}], max_tokens=1500, temperature=0.7)
+        return make_openrouter_request([{"role": "user", "content": prompt}], max_tokens=1500, temperature=0.7, call="reduce")
     except Exception as e:
-        print(f"AI analysis failed: {e}")
+        logger.warning(f"AI analysis failed: {e}")
         return f"AI analysis temporarily unavailable. Please check your OpenRouter configuration."
 
-def create_newsletter(analysis, scraped_data, subreddit_name="LocalLLaMA"):
+def analyze_content_mapreduce(scraped_data, subreddit_name="LocalLLaMA", batch_tokens=None, concurrency=None):
+    """Analyze large scrapes by summarizing token-budgeted batches in parallel, then merging them"""
+    batch_tokens = analysis_batch_tokens if batch_tokens is None else batch_tokens
+    concurrency = analysis_concurrency if concurrency is None else concurrency
+    batches = batch_posts(scraped_data, batch_tokens)
+    if not batches:
+        return analyze_content(scraped_data, subreddit_name)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches))), thread_name_prefix="analysis-map") as executor:
+        summaries = [summary for summary in executor.map(carry_fresh_completions(lambda batch: _try_summarize_batch(batch, subreddit_name)), batches) if summary]
+
+    return _reduce_summaries(summaries, subreddit_name)
+
+def analyze_content_overlapped(posts, subreddit_name="LocalLLaMA", batch_tokens=None, concurrency=None, stats=None):
+    """Map-reduce analysis that summarizes batches while posts are still being scraped
+
+    ``posts`` yields ``(position, post_data)`` pairs as iter_scrape_reddit
+    does. Each batch goes to the model as soon as it fills its token budget,
+    so only the last batch and the reduce call wait for the final post.
+    Returns ``(scraped_data, analysis)`` with posts in listing order.
+    """
+    batch_tokens = analysis_batch_tokens if batch_tokens is None else batch_tokens
+    concurrency = analysis_concurrency if concurrency is None else concurrency
+    received = {}
+    pending = []  # (position of the batch's first post, future)
+    current, current_tokens = [], 0
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="analysis-map") as executor:
+        def submit(batch):
+            pending.append((min(position for position, _ in batch),
+                            executor.submit(carry_fresh_completions(_try_summarize_batch), [post for _, post in batch], subreddit_name)))
+
+        for position, post in posts:
+            received[position] = post
+            post_tokens = estimate_tokens(format_post(post, ranked_comments(post)))
+            if current and current_tokens + post_tokens > batch_tokens:
+                submit(current)
+                current, current_tokens = [], 0
+            current.append((position, post))
+            current_tokens += post_tokens
+        scraped_at = time.time()
+        if current:
+            submit(current)
+        summaries = [future.result() for _, future in sorted(pending, key=lambda item: item[0])]
+
+    scraped_data = [received[position] for position in sorted(received)]
+    analysis = _reduce_summaries([summary for summary in summaries if summary], subreddit_name)
+    if stats is not None:
+        stats["analyze_batches"] = len(pending)
+        # Time spent on analysis after the last post arrived; the rest overlapped the scrape
+        stats["analyze_tail_seconds"] = round(time.time() - scraped_at, 3)
+    return scraped_data, analysis
+
+def run_analysis(scraped_data, subreddit_name="LocalLLaMA", mode=None, stats=None):
+    """Analyze with the configured mode ("single" or "mapreduce"), timing the stage"""
+    mode = analysis_mode if mode is None else mode
+    start_time = time.time()
+    # Already-scraped posts leave nothing to overlap, so "overlapped" runs as map-reduce here
+    if mode in ("mapreduce", "overlapped"):
+        analysis = analyze_content_mapreduce(scraped_data, subreddit_name)
+    else:
+        analysis = analyze_content(scraped_data, subreddit_name, stats=stats)
+    analyze_seconds = time.time() - start_time
+    stage_seconds.labels(stage="analyze").observe(analyze_seconds)
+    logger.info(f"Analysis ({mode}) of {len(scraped_data)} posts took {analyze_seconds:.2f}s")
+
+    if stats is not None:
+        stats["analyze_mode"] = mode
+        stats["analyze_seconds"] = round(analyze_seconds, 3)
+    return analysis
+
+def _newsletter_prompt(analysis, scraped_data, subreddit_name, stats=None):
+    prompt, prompt_tokens = build_newsletter_prompt(analysis, scraped_data, subreddit_name, model_name)
+    logger.info(f"Newsletter prompt: ~{prompt_tokens} tokens")
+    if stats is not None:
+        stats["newsletter_prompt_tokens"] = prompt_tokens
+    return prompt
+
+def _fallback_newsletter(scraped_data, subreddit_name):
+    return f"# r/{subreddit_name} Newsletter - {datetime.now().strftime('%B %d, %Y')}\n\nNewsletter generation temporarily unavailable. Please check your OpenRouter configuration.\n\n## Recent Posts\n" + "\n".join([f"- [{post['title']}]({post['url']})" for post in scraped_data[:5]])
+
+def create_newsletter(analysis, scraped_data, subreddit_name="LocalLLaMA", stats=None):
     """Create a formatted newsletter from the analysis"""
-    newsletter_prompt = f"""
-    Based on this analysis of r/{subreddit_name} content, create an engaging newsletter in markdown format:
+    newsletter_prompt = _newsletter_prompt(analysis, scraped_data, subreddit_name, stats)
 
-    {analysis}
+    with stage_seconds.labels(stage="create").time():
+        try:
+            return make_openrouter_request([{"role": "user", "content": newsletter_prompt}], max_tokens=2000, temperature=0.8, call="newsletter")
+        except Exception as e:
+            logger.warning(f"Newsletter creation failed: {e}")
+            return _fallback_newsletter(scraped_data, subreddit_name)
 
-    Original posts for reference:
-    {chr(10).join([f"- [{post['title']}]({post['url']})" for post in scraped_data[:5]])}
+def create_newsletter_stream(analysis, scraped_data, subreddit_name="LocalLLaMA", stats=None):
+    """Like create_newsletter, but yields the newsletter text in chunks as the model writes it"""
+    newsletter_prompt = _newsletter_prompt(analysis, scraped_data, subreddit_name, stats)
+    produced = False
 
-    Create a newsletter with:
-    1. An engaging headline that mentions r/{subreddit_name}
-    2. 3-5 main sections highlighting different topics/trends
-    3. Use this exact markdown format for each section:
+    with stage_seconds.labels(stage="create").time():
+        try:
+            for delta in stream_openrouter_request([{"role": "user", "content": newsletter_prompt}], max_tokens=2000, temperature=0.8, call="newsletter"):
+                produced = True
+                yield delta
+        except Exception as e:
+            logger.warning(f"Newsletter creation failed: {e}")
+            if not produced:
+                yield _fallback_newsletter(scraped_data, subreddit_name)
 
-    ## [Topic/Discussion Title](URL)
-    - Key facts and interesting details
-    - Why this matters to the r/{subreddit_name} community
-    - Your thoughts on implications for the community
+def _iter_scrape_with_fallback(subreddit_name, stats=None):
+    """iter_scrape_reddit, with scrape_reddit's demo data fallback when no post could be scraped
 
-    Make it engaging, informative, and tailored to the r/{subreddit_name} community interests.
-    Include the actual URLs from the Reddit posts where relevant.
+    A failure after some posts arrived keeps those posts.
     """
-
+    produced = False
     try:
-        return make_openrouter_request([{"role": "user", "content": newsletter_prompt}], max_tokens=2000, temperature=0.8)
+        for item in iter_scrape_reddit(subreddit_name, stats=stats):
+            produced = True
+            yield item
     except Exception as e:
-        print(f"Newsletter creation failed: {e}")
-        return f"# r/{subreddit_name} Newsletter - {datetime.now().strftime('%B %d, %Y')}\n\nNewsletter generation temporarily unavailable. Please check your OpenRouter configuration.\n\n## Recent Posts\n" + "\n".join([f"- [{post['title']}]({post['url']})" for post in scraped_data[:5]])
+        logger.warning(f"Reddit scraping failed for r/{subreddit_name}: {e}")
+        if not produced:
+            yield from enumerate(get_demo_data(subreddit_name))
+
+def record_sources(scraped_data, stats=None):
+    """Keep the URLs of the posts a newsletter was written from with its stats"""
+    if stats is not None:
+        stats["source_urls"] = [post["url"] for post in scraped_data]
+
+def scrape_and_analyze(subreddit_name="LocalLLaMA", stats=None):
+    """Scrape and analyze a subreddit, returning ``(scraped_data, analysis)``
+
+    Near-duplicate and low-information comments are dropped in between
+    (see app.core.dedup). In the "overlapped" analysis mode batch summaries start while later
+    posts are still being fetched, so the two stages take about as long as
+    the slower of them instead of their sum.
+    """
+    if analysis_mode != "overlapped":
+        scraped_data = condense_comments(scrape_reddit(subreddit_name, stats=stats), stats)
+        record_sources(scraped_data, stats)
+        return scraped_data, run_analysis(scraped_data, subreddit_name, stats=stats)
+
+    start_time = time.time()
+    posts = condense_comment_stream(_iter_scrape_with_fallback(subreddit_name, stats), stats)
+    scraped_data, analysis = analyze_content_overlapped(posts, subreddit_name, stats=stats)
+    record_sources(scraped_data, stats)
+    total_seconds = time.time() - start_time
+    stage_seconds.labels(stage="scrape_analyze").observe(total_seconds)
+    logger.info(f"Scrape and overlapped analysis of {len(scraped_data)} posts took {total_seconds:.2f}s")
+    if stats is not None:
+        stats["analyze_mode"] = "overlapped"
+        stats["scrape_analyze_seconds"] = round(total_seconds, 3)
+    return scraped_data, analysis
+
+def _digest_section(subreddit_name, stats=None):
+    """Scrape and analyze one subreddit of a digest; returns ``(subreddit, analysis, scraped)``"""
+    start_time = time.time()
+    scraped_data, analysis = scrape_and_analyze(subreddit_name, stats=stats)
+    if stats is not None:
+        stats["seconds"] = round(time.time() - start_time, 3)
+    return subreddit_name, analysis, scraped_data
+
+def create_digest(sections, stats=None):
+    """Write one combined newsletter from ``(subreddit, analysis, scraped)`` sections"""
+    prompt, prompt_tokens = build_digest_prompt(sections, model_name)
+    logger.info(f"Digest prompt: ~{prompt_tokens} tokens")
+    if stats is not None:
+        stats["digest_prompt_tokens"] = prompt_tokens
+
+    with stage_seconds.labels(stage="create_digest").time():
+        try:
+            return make_openrouter_request([{"role": "user", "content": prompt}], max_tokens=2500, temperature=0.8, call="digest")
+        except Exception as e:
+            logger.warning(f"Digest creation failed: {e}")
+            return "\n\n".join(_fallback_newsletter(scraped_data, subreddit_name) for subreddit_name, _, scraped_data in sections)
 
 class SimpleNewsletter:
     """Simple newsletter generator without CrewAI"""
     
-    def kickoff(self, subreddit_name="LocalLLaMA"):
-        """Generate the newsletter for specified subreddit"""
-        print(f"🔍 Scraping Reddit content from r/{subreddit_name}...")
-        scraped_data = scrape_reddit(subreddit_name)
+    def kickoff(self, subreddit_name="LocalLLaMA", stats=None):
+        """Generate the newsletter for specified subreddit
+
+        Pass a ``stats`` dict to collect pipeline timings.
+        """
+        with stage_seconds.labels(stage="pipeline").time():
+            logger.info(f"🔍 Scraping and analyzing r/{subreddit_name} content with AI...")
+            scraped_data, analysis = scrape_and_analyze(subreddit_name, stats=stats)
+            
+            logger.info("📰 Creating newsletter...")
+            newsletter = create_newsletter(analysis, scraped_data, subreddit_name, stats=stats)
         
-        print("🤖 Analyzing content with AI...")
-        analysis = analyze_content(scraped_data, subreddit_name)
+        return newsletter
+
+    def kickoff_stream(self, subreddit_name="LocalLLaMA", stats=None):
+        """Generate the newsletter, yielding ``(event, data)`` pairs as it progresses
+
+        Emits ``("status", message)`` between stages, ``("chunk", text)`` while
+        the newsletter is written, and finally ``("done", newsletter)``.
+        """
+        start_time = time.time()
+        if analysis_mode == "overlapped":
+            yield "status", f"Scraping and analyzing r/{subreddit_name} content..."
+            scraped_data, analysis = scrape_and_analyze(subreddit_name, stats=stats)
+        else:
+            yield "status", f"Scraping Reddit content from r/{subreddit_name}..."
+            scraped_data = condense_comments(scrape_reddit(subreddit_name, stats=stats), stats)
+            record_sources(scraped_data, stats)
+            
+            yield "status", f"Analyzing {len(scraped_data)} posts with AI..."
+            analysis = run_analysis(scraped_data, subreddit_name, stats=stats)
         
-        print("📰 Creating newsletter...")
-        newsletter = create_newsletter(analysis, scraped_data, subreddit_name)
+        yield "status", "Writing newsletter..."
+        parts = []
+        for delta in create_newsletter_stream(analysis, scraped_data, subreddit_name, stats=stats):
+            parts.append(delta)
+            yield "chunk", delta
         
-        return newsletter
+        stage_seconds.labels(stage="pipeline").observe(time.time() - start_time)
+        yield "done", "".join(parts)
+
+    def kickoff_digest(self, subreddit_names, stats=None):
+        """Generate one newsletter covering several subreddits
+
+        Each subreddit is scraped and analyzed on its own thread, so the wall
+        time is close to the slowest subreddit; OpenRouter calls still share
+        the process-wide ``LLM_CONCURRENCY`` limit.
+        """
+        start_time = time.time()
+        section_stats = {name: {} for name in subreddit_names}
+        logger.info(f"🔍 Scraping and analyzing {len(subreddit_names)} subreddits in parallel...")
+        with ThreadPoolExecutor(max_workers=max(1, len(subreddit_names)), thread_name_prefix="digest") as executor:
+            sections = list(executor.map(carry_fresh_completions(lambda name: _digest_section(name, section_stats[name])), subreddit_names))
+        
+        logger.info("📰 Creating digest...")
+        digest = create_digest(sections, stats=stats)
+        
+        stage_seconds.labels(stage="digest").observe(time.time() - start_time)
+        if stats is not None:
+            stats["subreddits"] = section_stats
+            stats["digest_seconds"] = round(time.time() - start_time, 3)
+        return digest
 
 # Create a simple crew-like interface
 crew = SimpleNewsletter()
@@ -0,0 +1,73 @@
+"""
+Server-side rendering of newsletter markdown to sanitized HTML
+"""
+
+import html
+import re
+
+_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+_BULLET = re.compile(r"^\s*[-*•]\s+(.*)$")
+_BOLD = re.compile(r"\*\*(.+?)\*\*")
+# A markdown link, or a bare URL outside one; both are matched on already-escaped text
+_LINK = re.compile(r"\[([^\]]+)\]\(([^)\s]+)\)|(https?://[^\s<>\"']+)")
+_SAFE_URL = re.compile(r"^https?://", re.IGNORECASE)
+
+
+def _anchor(url, text):
+    return f'<a href="{url}" target="_blank" rel="noopener noreferrer">{text}</a>'
+
+
+def _link(match):
+    text, url, bare = match.groups()
+    if bare is not None:
+        return _anchor(bare, bare)
+    if not _SAFE_URL.match(url):
+        return text  # javascript:, data: and relative links keep only their text
+    return _anchor(url, text)
+
+
+def render_inline(text):
+    """Escape one line and render bold text and links"""
+    escaped = html.escape(text, quote=True)
+    escaped = _BOLD.sub(r"<strong>\1</strong>", escaped)
+    return _LINK.sub(_link, escaped)
+
+
+def render_newsletter_html(markdown):
+    """Render the markdown subset the newsletter prompts produce.
+
+    Headings, bullet lists, paragraphs, bold text and links are supported.
+    All text is HTML-escaped before any tag is added and only http(s) links
+    become anchors, so model output cannot inject markup or scripts.
+    """
+    blocks = []
+    paragraph = []
+    items = []
+
+    def flush():
+        if paragraph:
+            blocks.append("<p>" + "<br>".join(paragraph) + "</p>")
+            paragraph.clear()
+        if items:
+            blocks.append("<ul>" + "".join(f"<li>{item}</li>" for item in items) + "</ul>")
+            items.clear()
+
+    for line in (markdown or "").splitlines():
+        heading = _HEADING.match(line)
+        bullet = _BULLET.match(line)
+        if heading:
+            flush()
+            level = len(heading.group(1))
+            blocks.append(f"<h{level}>{render_inline(heading.group(2).strip())}</h{level}>")
+        elif bullet:
+            if paragraph:
+                flush()
+            items.append(render_inline(bullet.group(1).strip()))
+        elif line.strip():
+            if items:
+                flush()
+            paragraph.append(render_inline(line.strip()))
+        else:
+            flush()
+    flush()
+    return "\n".join(blocks)
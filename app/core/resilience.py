@@ -0,0 +1,229 @@
+"""
+Retries, hedged requests and circuit breakers for calls to external APIs
+"""
+
+import email.utils
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an endpoint whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Fails fast once an endpoint has failed ``failure_threshold`` times in a row.
+
+    After ``reset_timeout`` seconds one trial call is let through; its
+    success closes the circuit again, its failure re-opens it.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        return self._state
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go ahead now"""
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(f"{self.name} is unavailable; failing fast for another {remaining:.0f}s")
+                self._state = HALF_OPEN
+                self._trial_running = False
+            if self._state == HALF_OPEN:
+                if self._trial_running:
+                    raise CircuitOpenError(f"{self.name} is being probed after failures; failing fast")
+                self._trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {"state": self._state, "consecutive_failures": self._failures}
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0, retry_after=None):
+    """Full-jitter exponential backoff; a server's Retry-After is a lower bound"""
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _next_delay(error, attempt, attempts, base_delay, max_delay, breaker, is_retryable, retry_after):
+    """Record a failed attempt and return the delay before the next one, or None to give up"""
+    retryable = is_retryable(error)
+    if breaker is not None:
+        # A non-retryable error (e.g. a 400) still means the endpoint answered
+        if retryable:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+    if not retryable or attempt == attempts - 1:
+        return None
+    wait_hint = retry_after(error)
+    if wait_hint is not None and wait_hint > max_delay:
+        return None  # the server wants a longer pause than this call can afford
+    return backoff_delay(attempt, base_delay, max_delay, wait_hint)
+
+
+def call_with_retries(fn, attempts=3, base_delay=1.0, max_delay=30.0, breaker=None,
+                      is_retryable=lambda error: True, retry_after=lambda error: None):
+    """Call ``fn()`` up to ``attempts`` times with jittered exponential backoff.
+
+    Only errors accepted by ``is_retryable`` are retried. ``retry_after(error)``
+    may return the server's requested wait in seconds. With a ``breaker``,
+    calls fail fast with CircuitOpenError while its circuit is open.
+    """
+    for attempt in range(attempts):
+        if breaker is not None:
+            breaker.allow()
+        try:
+            result = fn()
+        except Exception as e:
+            delay = _next_delay(e, attempt, attempts, base_delay, max_delay, breaker, is_retryable, retry_after)
+            if delay is None:
+                raise
+            logger.warning(f"Attempt {attempt + 1}/{attempts} failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+async def call_with_retries_async(fn, attempts=3, base_delay=1.0, max_delay=30.0, breaker=None,
+                                  is_retryable=lambda error: True, retry_after=lambda error: None):
+    """Async counterpart of call_with_retries; ``fn()`` returns an awaitable"""
+    import asyncio  # already loaded under the ASGI server; kept out of WSGI worker boot
+    for attempt in range(attempts):
+        if breaker is not None:
+            breaker.allow()
+        try:
+            result = await fn()
+        except Exception as e:
+            delay = _next_delay(e, attempt, attempts, base_delay, max_delay, breaker, is_retryable, retry_after)
+            if delay is None:
+                raise
+            logger.warning(f"Attempt {attempt + 1}/{attempts} failed ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        if breaker is not None:
+            breaker.record_success()
+        return result
+
+
+# Threads for hedged calls; the copy that loses a race finishes in the background
+hedge_workers = int(os.getenv("HEDGE_WORKERS", 32))
+_hedge_executor = None
+_hedge_pid = None
+
+
+def _get_hedge_executor():
+    global _hedge_executor, _hedge_pid
+    if _hedge_executor is None or _hedge_pid != os.getpid():
+        _hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix="hedge")
+        _hedge_pid = os.getpid()
+    return _hedge_executor
+
+
+def hedged_call(fn, hedge_after):
+    """Call ``fn()``; if it has not returned after ``hedge_after`` seconds, race a second copy.
+
+    The first successful result wins. Hedging is off when ``hedge_after`` is falsy.
+    """
+    if not hedge_after:
+        return fn()
+    executor = _get_hedge_executor()
+    first = executor.submit(fn)
+    done, _ = wait([first], timeout=hedge_after)
+    if done:
+        return first.result()
+    logger.info(f"No response after {hedge_after}s; sending a hedged request")
+    pending = {first, executor.submit(fn)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def hedged_call_async(fn, hedge_after):
+    """Async counterpart of hedged_call; the losing copy is cancelled"""
+    import asyncio
+    if not hedge_after:
+        return await fn()
+    first = asyncio.ensure_future(fn())
+    done, _ = await asyncio.wait({first}, timeout=hedge_after)
+    if done:
+        return first.result()
+    logger.info(f"No response after {hedge_after}s; sending a hedged request")
+    pending = {first, asyncio.ensure_future(fn())}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+    raise error
@@ -0,0 +1,129 @@
+"""
+Scheduled pre-generation of newsletters for the predefined subreddits
+"""
+
+import fcntl
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class PregenerationScheduler:
+    """Regenerates newsletters for a fixed list of subreddits every ``interval`` seconds.
+
+    Cycles start ``interval`` seconds apart, however long each one takes, so
+    an interval shorter than the newsletter cache TTL refreshes every
+    subreddit before its cached copy expires.
+
+    ``generate(subreddit_name)`` must block until that subreddit's newsletter
+    has been produced and published. At most ``concurrency`` subreddits are
+    generated at once, and each start is delayed by up to ``jitter`` seconds
+    so runs do not hit Reddit and OpenRouter in one burst. When several worker
+    processes start a scheduler, an exclusive lock on ``lock_path`` lets only
+    one of them run each cycle.
+    """
+
+    def __init__(self, subreddits, generate, interval=1500, concurrency=2, jitter=30, lock_path=None):
+        self.subreddits = list(subreddits)
+        self._generate = generate
+        self.interval = interval
+        self.concurrency = concurrency
+        self.jitter = jitter
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Run cycles on a daemon thread until ``stop`` is called"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name="newsletter-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _acquire_leadership(self):
+        """Hold the cross-process lock for as long as this process lives"""
+        if self.lock_path is None:
+            return True
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def run_forever(self):
+        """Run cycles on the calling thread until ``stop`` is called"""
+        # Spread the first cycle so a fresh deploy does not generate everything at boot time
+        if self._stop.wait(random.uniform(0, self.jitter)):
+            return
+        while not self._stop.is_set():
+            cycle_start = time.monotonic()
+            if self._acquire_leadership():
+                self.run_once()
+            elapsed = time.monotonic() - cycle_start
+            if elapsed > self.interval:
+                logger.warning(f"Pre-generation cycle took {elapsed:.0f}s, longer than the {self.interval}s interval")
+            self._stop.wait(max(0, self.interval - elapsed))
+
+    def _generate_one(self, subreddit_name):
+        if self._stop.wait(random.uniform(0, self.jitter)):
+            return False
+        start_time = time.time()
+        try:
+            self._generate(subreddit_name)
+            logger.info(f"Pre-generated r/{subreddit_name} in {time.time() - start_time:.2f} seconds")
+            return True
+        except Exception as e:
+            logger.error(f"Pre-generation failed for r/{subreddit_name}: {str(e)}")
+            return False
+
+    def run_once(self):
+        """Generate every subreddit once; returns how many succeeded"""
+        logger.info(f"Pre-generating newsletters for {len(self.subreddits)} subreddits")
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency), thread_name_prefix="pregenerate") as executor:
+            succeeded = sum(executor.map(self._generate_one, self.subreddits))
+        logger.info(f"Pre-generation cycle finished: {succeeded}/{len(self.subreddits)} "
+                    f"succeeded in {time.time() - start_time:.2f} seconds")
+        return succeeded
+
+
+def wait_for_job(jobs, job_id, poll_interval=1.0):
+    """Block until a job finishes, raising if it failed"""
+    while True:
+        job = jobs.get(job_id)
+        if job is None:
+            raise RuntimeError(f"Job {job_id} disappeared")
+        if job["status"] == "completed":
+            return job
+        if job["status"] == "error":
+            raise RuntimeError(job["error"])
+        time.sleep(poll_interval)
+
+
+# Run pre-generation from the command line (e.g. from cron) instead of inside the web workers
+if __name__ == "__main__":
+    import argparse
+    from app.main import scheduler
+
+    parser = argparse.ArgumentParser(description="Pre-generate newsletters for the predefined subreddits")
+    parser.add_argument("--once", action="store_true", help="run a single cycle and exit")
+    args = parser.parse_args()
+
+    if args.once:
+        scheduler.run_once()
+    else:
+        scheduler.run_forever()
@@ -0,0 +1,51 @@
+"""
+Startup timing and copy-on-write friendly preloading for forking servers
+"""
+
+import gc
+import importlib
+import logging
+import os
+from app.core.metrics import startup_seconds
+
+logger = logging.getLogger(__name__)
+
+# Client libraries that are otherwise imported on first use. A preloading master imports
+# them once before fork so every worker shares the pages instead of importing them again.
+HEAVY_MODULES = ("requests", "praw", "prawcore")
+
+
+def process_age():
+    """Seconds since this process was started (or forked), or None off Linux"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22 of the full line
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def record_startup(phase, seconds):
+    """Publish one startup phase duration as a gauge and a log line"""
+    if seconds is None:
+        return
+    startup_seconds.labels(phase=phase).set(round(seconds, 4))
+    logger.info(f"Startup: {phase} took {seconds:.3f}s")
+
+
+def import_heavy_modules():
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+
+
+def freeze_for_fork():
+    """Keep the garbage collector away from objects created before fork.
+
+    A collection in a worker writes to every object it inspects, which
+    copies the shared page. Frozen objects are never inspected.
+    """
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,233 @@
+"""
+Keyed result storage shared between worker processes
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultStore:
+    """Interface for a keyed store of JSON-serializable values"""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def update(self, key, fn, ttl=None):
+        """Atomically replace the value with ``fn(current)`` (None if missing) and return it"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class MemoryResultStore(ResultStore):
+    """Process-local store, suitable for a single worker or tests"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            return json.loads(value)
+
+    def put(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (json.dumps(value), expires_at)
+
+    def update(self, key, fn, ttl=None):
+        with self._lock:
+            entry = self._data.get(key)
+            current = None
+            if entry is not None and (entry[1] is None or entry[1] >= time.time()):
+                current = json.loads(entry[0])
+            value = fn(current)
+            self._data[key] = (json.dumps(value), time.time() + ttl if ttl else None)
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteResultStore(ResultStore):
+    """File-backed store that every worker process on the host can share.
+
+    With ``max_bytes`` set, the oldest-written rows are evicted once the
+    stored values grow past that size. Nothing is opened until first use,
+    so a store built in a preloading gunicorn master hands no SQLite
+    connection to the workers it forks.
+    """
+
+    PURGE_EVERY = 100  # writes between expired-row cleanups
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _connection(self):
+        # Connections must not cross threads or a fork, so keep one per thread and pid
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "updated_at REAL NOT NULL, expires_at REAL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT value, expires_at FROM results WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            return None
+        return json.loads(value)
+
+    def put(self, key, value, ttl=None):
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO results (key, value, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now + ttl if ttl else None),
+        )
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self.purge_expired()
+            self.enforce_size_limit()
+
+    def update(self, key, fn, ttl=None):
+        conn = self._connection()
+        # The write lock is taken before the read, so concurrent updates from any process serialize
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+            current = None
+            if row is not None and (row[1] is None or row[1] >= time.time()):
+                current = json.loads(row[0])
+            value = fn(current)
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, updated_at, expires_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now + ttl if ttl else None),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def delete(self, key):
+        self._connection().execute("DELETE FROM results WHERE key = ?", (key,))
+
+    def purge_expired(self):
+        """Remove rows whose TTL has passed"""
+        self._connection().execute(
+            "DELETE FROM results WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),)
+        )
+
+    def enforce_size_limit(self):
+        """Evict the oldest-written rows until the values fit in ``max_bytes``"""
+        if not self.max_bytes:
+            return
+        conn = self._connection()
+        total = conn.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Go a little below the limit so the next few writes do not trigger another pass
+        target = self.max_bytes * 0.9
+        evict = []
+        for key, size in conn.execute("SELECT key, LENGTH(value) FROM results ORDER BY updated_at"):
+            if total <= target:
+                break
+            evict.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM results WHERE key = ?", evict)
+
+
+class CachedResultStore(ResultStore):
+    """In-memory LRU front for another store.
+
+    Only values accepted by ``cache_if(key, value)`` are kept in memory, so
+    entries that other workers may still change are always read through.
+    """
+
+    def __init__(self, backend, max_entries=256, cache_if=None):
+        self.backend = backend
+        self._max_entries = max_entries
+        self._cache_if = cache_if or (lambda key, value: False)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        value = self.backend.get(key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    def put(self, key, value, ttl=None):
+        self.backend.put(key, value, ttl=ttl)
+        with self._lock:
+            self._cache.pop(key, None)
+        self._remember(key, value)
+
+    def update(self, key, fn, ttl=None):
+        value = self.backend.update(key, fn, ttl=ttl)
+        with self._lock:
+            self._cache.pop(key, None)
+        self._remember(key, value)
+        return value
+
+    def delete(self, key):
+        self.backend.delete(key)
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def _remember(self, key, value):
+        if not self._cache_if(key, value):
+            return
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._max_entries:
+                self._cache.popitem(last=False)
+
+
+def create_result_store(url, max_bytes=None):
+    """Build a store from a URL such as ``sqlite:///tmp/state.db`` or ``memory://``"""
+    if url.startswith("sqlite://"):
+        return SQLiteResultStore(url[len("sqlite://"):], max_bytes=max_bytes)
+    if url.startswith("memory://"):
+        return MemoryResultStore()
+    raise ValueError(f"Unsupported result store URL: {url}")
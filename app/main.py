@@ -1,119 +1,702 @@
-from flask import Flask, jsonify, render_template, Response, request
+from flask import Flask, jsonify, make_response, render_template, Response, request, url_for
 import os
+import hashlib
 import time
 import logging
-import sys
 import json
+import queue
+import threading
 from datetime import datetime
-from app.core.reddit_newsletter import crew
+from app.core.reddit_newsletter import crew, fresh_completions, get_llm_cache, openrouter_breaker, reddit_breaker, PROMPT_VERSION
+from app.core.archive import create_archive
+from app.core.cache import NewsletterCache, STALE
+from app.core.changes import ChangeNotifier
+from app.core.compression import COMPRESSIBLE_MIMETYPES, CompressionCache, supported_encodings
+from app.core.clients import check_reddit_credentials
+from app.core.logsetup import setup_logging
+from app.core.logstream import LogBroadcaster
+from app.core.metrics import queue_depth, render_metrics
+from app.core.render import render_newsletter_html
+from app.core.jobs import COMPLETED, ERROR, JobManager, QueueFullError, current_job, current_job_id, is_finished_job
+from app.core.jobstreams import JobStreams
+from app.core.scheduler import PregenerationScheduler, wait_for_job
+from app.core.startup import freeze_for_fork, import_heavy_modules, process_age, record_startup
+from app.core.store import CachedResultStore, create_result_store
 from config import config
 
-# Configure logging
-logging.basicConfig(
-    level=getattr(logging, config.LOG_LEVEL),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler(config.LOG_FILE)
-    ]
+# Configure logging: request threads only enqueue records, a listener thread writes them
+setup_logging(
+    config.LOG_FILE,
+    level=config.LOG_LEVEL,
+    max_bytes=config.LOG_MAX_BYTES,
+    backup_count=config.LOG_BACKUP_COUNT,
+    rotate_seconds=config.LOG_ROTATE_SECONDS,
+    queue_size=config.LOG_QUEUE_SIZE,
 )
 logger = logging.getLogger(__name__)
 
+# One tailer per worker process feeds every /logs client
+log_broadcaster = LogBroadcaster(
+    config.LOG_FILE,
+    backlog=config.LOG_STREAM_BACKLOG,
+    max_queue=config.LOG_STREAM_QUEUE_SIZE,
+)
+
 app = Flask(__name__)
 app.secret_key = config.SECRET_KEY
 
-# Global variable to store the latest newsletter
-latest_newsletter = None
-newsletter_status = "ready"  # ready, processing, completed, error
+compression_cache = CompressionCache(level=config.COMPRESS_LEVEL)
+
+# Static file path -> content fingerprint, computed once per process
+asset_fingerprints = {}
+
+def asset_fingerprint(filename):
+    fingerprint = asset_fingerprints.get(filename)
+    if fingerprint is None:
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            fingerprint = hashlib.sha1(f.read()).hexdigest()[:12]
+        asset_fingerprints[filename] = fingerprint
+    return fingerprint
+
+@app.template_global()
+def static_url(filename):
+    """URL of a static file that changes whenever the file does, so it can be cached forever"""
+    return url_for('static', filename=filename, v=asset_fingerprint(filename))
+
+@app.after_request
+def cache_and_compress(response):
+    """Far-future caching for fingerprinted assets; gzip/brotli for large text responses"""
+    if request.endpoint == 'static' and response.status_code == 200:
+        filename = request.view_args.get('filename')
+        if request.args.get('v') == asset_fingerprint(filename):
+            response.cache_control.no_cache = None
+            response.cache_control.public = True
+            response.cache_control.max_age = config.STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        # Read the (small) file into memory so it can be compressed below
+        response.direct_passthrough = False
+        response.make_sequence()
+    
+    if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    encoding = request.accept_encodings.best_match(supported_encodings())
+    if len(body) < config.COMPRESS_MIN_BYTES or encoding is None:
+        return response
+    
+    response.set_data(compression_cache.compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    etag, _ = response.get_etag()
+    if etag:
+        # The bytes differ from the uncompressed body; a weak ETag still matches If-None-Match
+        response.set_etag(etag, weak=True)
+    return response
+
+# Shared job/result state, visible to every worker process
+result_store = CachedResultStore(
+    create_result_store(config.RESULT_STORE_URL),
+    max_entries=config.RESULT_CACHE_SIZE,
+    cache_if=is_finished_job,
+)
+
+# Every generated newsletter, kept for history and search after the caches expire
+archive = create_archive(config.ARCHIVE_URL)
+
+# Recently generated newsletters, served without re-running the pipeline
+newsletter_cache = NewsletterCache(
+    result_store,
+    model=config.OPENROUTER_MODEL,
+    prompt_version=PROMPT_VERSION,
+    ttl=config.NEWSLETTER_CACHE_TTL,
+    stale_ttl=config.NEWSLETTER_CACHE_STALE_TTL,
+    max_entries=config.NEWSLETTER_CACHE_SIZE,
+)
+
+# Rendered HTML and its ETag by page key; only pages with a fixed set of keys are kept
+rendered_pages = {}
+
+def render_page(key, template, **context):
+    page = rendered_pages.get(key)
+    if page is None:
+        html = render_template(template, **context)
+        page = (html, hashlib.sha1(html.encode('utf-8')).hexdigest())
+        if key is not None:
+            rendered_pages[key] = page
+    return page
+
+def page_response(key, template, **context):
+    """An HTML page served with an ETag, from the rendered page cache when it is there"""
+    html, etag = render_page(key, template, **context)
+    response = make_response(html)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+def prerender_pages():
+    """Render the home page and the predefined subreddits' pages, and compress them ahead of the first visit"""
+    with app.test_request_context():
+        pages = [render_page("index", "index.html", predefined_subreddits=config.predefined_subreddits)]
+        for subreddit_name in config.predefined_subreddits:
+            pages.append(render_page(f"newsletter:{subreddit_name.lower()}", "newsletter.html", subreddit=subreddit_name))
+    for html, _ in pages:
+        body = html.encode('utf-8')
+        if len(body) >= config.COMPRESS_MIN_BYTES:
+            for encoding in supported_encodings():
+                compression_cache.compress(body, encoding)
+    logger.info(f"Pre-rendered {len(pages)} pages")
 
 @app.route('/')
 def index():
     logger.info("Index page accessed")
-    return render_template("index.html", predefined_subreddits=config.predefined_subreddits)
+    return page_response("index", "index.html", predefined_subreddits=config.predefined_subreddits)
 
-@app.route('/generate-newsletter')
-def generate_newsletter():
-    global latest_newsletter, newsletter_status
-    
-    # Get subreddit from query parameter, default to LocalLLaMA
-    subreddit_name = request.args.get('subreddit', 'LocalLLaMA')
-    
+def conditional_json(payload):
+    """JSON response with an ETag; a client that already has this body gets a 304"""
+    response = jsonify(payload)
+    response.add_etag()
+    response.headers["Cache-Control"] = "no-cache"  # Cache, but revalidate on every request
+    return response.make_conditional(request)
+
+def clean_subreddit_name(subreddit_name):
+    """Normalize a user-supplied subreddit name, defaulting to LocalLLaMA"""
     # Basic validation for subreddit name
     if not subreddit_name or len(subreddit_name.strip()) == 0:
-        subreddit_name = 'LocalLLaMA'
+        return 'LocalLLaMA'
     
     # Clean the subreddit name (remove r/ prefix if present)
     subreddit_name = subreddit_name.strip()
     if subreddit_name.startswith('r/'):
         subreddit_name = subreddit_name[2:]
-    
+    return subreddit_name
+
+# Wakes /newsletter-status long-polls when a job or the latest newsletter changes
+status_changes = ChangeNotifier(poll_interval=config.STATUS_POLL_INTERVAL)
+# Each waiting long-poll holds a gthread, so only this many may wait at once
+long_poll_slots = threading.BoundedSemaphore(max(1, config.STATUS_LONG_POLL_MAX))
+
+def update_latest(status, newsletter):
+    """Replace the latest-newsletter record, bumping its version for long-polling clients"""
+    # Atomic read-modify-write: concurrent jobs in any worker must never publish the same version
+    result_store.update("newsletter:latest", lambda latest: {
+        "status": status,
+        "newsletter": newsletter,
+        "version": (latest or {}).get("version", 0) + 1
+    })
+    status_changes.notify()
+
+# Drafts of the newsletters being written by this process, for /generate-newsletter/stream
+job_streams = JobStreams()
+
+def refreshing():
+    """True inside a job submitted as a refresh; its LLM calls skip the completion cache"""
+    job = current_job()
+    return bool(job and job.get("refresh"))
+
+def run_newsletter_pipeline(subreddit_name, stats=None):
+    """Run the full newsletter pipeline; executed on a background job thread
+
+    Progress and draft chunks are published to ``job_streams`` under the
+    job's id, so every stream request attached to the job sees them.
+    """
     logger.info(f"Starting Reddit newsletter generation for r/{subreddit_name}...")
-    newsletter_status = "processing"
+    job_id = current_job_id()
+    latest = result_store.get("newsletter:latest") or {}
+    update_latest("processing", latest.get("newsletter"))
     
     try:
-        logger.info("Starting CrewAI processing...")
         start_time = time.time()
         
-        result = crew.kickoff(subreddit_name)
+        with fresh_completions(refreshing()):
+            for event, data in crew.kickoff_stream(subreddit_name, stats=stats):
+                if event == "done":
+                    result = data
+                else:
+                    job_streams.publish(job_id, event, data)
         
         processing_time = time.time() - start_time
         logger.info(f"CrewAI processing completed in {processing_time:.2f} seconds")
         
-        latest_newsletter = {
-            "content": str(result),
-            "generated_at": datetime.now().isoformat(),
-            "processing_time": f"{processing_time:.2f}s",
+        newsletter = build_newsletter_record(subreddit_name, result, processing_time)
+        publish_newsletter(subreddit_name, newsletter, stats)
+    except Exception as e:
+        # Streams end on the final event, so send it before anything else here can fail
+        job_streams.publish(job_id, "failed", f"Failed to generate newsletter for r/{subreddit_name}: {str(e)}")
+        update_latest("error", latest.get("newsletter"))
+        raise
+    
+    job_streams.publish(job_id, "done", newsletter)
+    return newsletter
+
+def build_newsletter_record(subreddit_name, content, processing_time):
+    """Newsletter record with its markdown rendered to sanitized HTML once, at creation"""
+    return {
+        "content": str(content),
+        "html": render_newsletter_html(str(content)),
+        "generated_at": datetime.now().isoformat(),
+        "processing_time": f"{processing_time:.2f}s",
+        "subreddit": subreddit_name
+    }
+
+def archive_newsletter(newsletter, stats=None):
+    """Add a finished newsletter to the archive and note its ``archive_id`` on the record"""
+    if archive is None:
+        return
+    stats = stats or {}
+    # Digests keep each subreddit's sources in its section stats
+    source_urls = stats.get("source_urls") or [
+        url for section in stats.get("subreddits", {}).values() for url in section.get("source_urls", [])
+    ]
+    try:
+        newsletter["archive_id"] = archive.add(newsletter, model=config.OPENROUTER_MODEL, source_urls=source_urls)
+    except Exception as e:
+        # Losing the archive copy should not lose the newsletter the user is waiting for
+        logger.warning(f"Could not archive newsletter for r/{newsletter['subreddit']}: {str(e)}")
+
+def publish_newsletter(subreddit_name, newsletter, stats=None):
+    """Archive a finished newsletter, make it the latest one and cache it for repeat requests"""
+    archive_newsletter(newsletter, stats)
+    update_latest("completed", newsletter)
+    newsletter_cache.set(subreddit_name, newsletter)
+
+jobs = JobManager(
+    run_newsletter_pipeline,
+    result_store,
+    max_workers=config.JOB_WORKERS,
+    max_queue=config.JOB_QUEUE_SIZE,
+    retention_seconds=config.JOB_RETENTION_SECONDS,
+    stale_seconds=config.JOB_STALE_SECONDS,
+    on_change=status_changes.notify,
+)
+
+def run_digest_pipeline(digest_name, stats=None):
+    """Generate one newsletter for a ``+``-joined list of subreddits on a background job thread"""
+    subreddit_names = digest_name.split('+')
+    logger.info(f"Starting digest generation for {len(subreddit_names)} subreddits: r/{digest_name}")
+    start_time = time.time()
+    
+    with fresh_completions(refreshing()):
+        result = crew.kickoff_digest(subreddit_names, stats=stats)
+    
+    processing_time = time.time() - start_time
+    logger.info(f"Digest for r/{digest_name} completed in {processing_time:.2f} seconds")
+    newsletter = build_newsletter_record(digest_name, result, processing_time)
+    newsletter["subreddits"] = subreddit_names
+    archive_newsletter(newsletter, stats)
+    newsletter_cache.set(f"digest:{digest_name}", newsletter)
+    return newsletter
+
+# Digests are keyed by their subreddit list, joined with "+" like a Reddit multireddit
+digest_jobs = JobManager(
+    run_digest_pipeline,
+    result_store,
+    max_workers=config.JOB_WORKERS,
+    max_queue=config.JOB_QUEUE_SIZE,
+    retention_seconds=config.JOB_RETENTION_SECONDS,
+    stale_seconds=config.JOB_STALE_SECONDS,
+    key_prefix="digest:",
+    on_change=status_changes.notify,
+)
+
+queue_depth.labels(queue="newsletter").set_function(jobs.queue_depth)
+queue_depth.labels(queue="digest").set_function(digest_jobs.queue_depth)
+
+def pregenerate_newsletter(subreddit_name):
+    """Generate through the job queue so user requests for the same subreddit share the run
+
+    It replaces a cached newsletter, so it runs as a refresh.
+    """
+    job, _ = jobs.submit(subreddit_name, refresh=True)
+    wait_for_job(jobs, job["id"])
+
+# Keeps newsletters for the predefined subreddits warm in the cache; by default each
+# cycle starts well inside the TTL, so the cached copy is replaced before it expires
+scheduler = PregenerationScheduler(
+    config.predefined_subreddits,
+    pregenerate_newsletter,
+    interval=config.PREGEN_INTERVAL or max(1, config.NEWSLETTER_CACHE_TTL * 3 // 4),
+    concurrency=config.PREGEN_CONCURRENCY,
+    jitter=config.PREGEN_JITTER,
+    lock_path=config.PREGEN_LOCK_FILE,
+)
+
+def start_background_services():
+    """Start per-process background threads; call once the worker process is running"""
+    if not rendered_pages:  # a preloading master has already rendered them
+        prerender_pages()
+    if config.PREGEN_INTERVAL > 0:
+        logger.info(f"Pre-generating {len(config.predefined_subreddits)} subreddits every {config.PREGEN_INTERVAL}s")
+        if config.PREGEN_INTERVAL >= config.NEWSLETTER_CACHE_TTL:
+            logger.warning(f"PREGEN_INTERVAL ({config.PREGEN_INTERVAL}s) is not shorter than NEWSLETTER_CACHE_TTL "
+                           f"({config.NEWSLETTER_CACHE_TTL}s); cached newsletters will expire between runs")
+        scheduler.start()
+
+def preload():
+    """Warm the gunicorn master before it forks workers (GUNICORN_PRELOAD)
+
+    Only work whose result is safe to share is done here: imports and
+    rendered pages. Threads, sockets and API clients are created per worker
+    by ``init_worker`` after fork.
+    """
+    import_heavy_modules()
+    prerender_pages()
+    freeze_for_fork()
+
+worker_pid = None
+
+def init_worker():
+    """Per-process start-up; runs once per process, after fork when preloading"""
+    global worker_pid
+    if worker_pid == os.getpid():
+        return
+    worker_pid = os.getpid()
+    start_background_services()
+    record_startup("ready", process_age())
+
+@app.route('/generate-newsletter', methods=['GET', 'POST'])
+def generate_newsletter():
+    """Serve a cached newsletter or queue generation and return the job id immediately"""
+    subreddit_name = clean_subreddit_name(request.values.get('subreddit', 'LocalLLaMA'))
+    force_refresh = request.values.get('refresh', 'false').lower() in ('1', 'true', 'yes')
+    
+    cached, cache_state = (None, None) if force_refresh else newsletter_cache.get(subreddit_name)
+    if cached is not None and cache_state != STALE:
+        logger.info(f"Serving cached newsletter for r/{subreddit_name}")
+        return conditional_json({
+            "success": True,
+            "cache_hit": True,
+            "stale": False,
+            "newsletter": cached,
             "subreddit": subreddit_name
-        }
-        
-        newsletter_status = "completed"
-        
+        })
+    
+    try:
+        # Revalidating a stale newsletter is a refresh too
+        job, created = jobs.submit(subreddit_name, refresh=force_refresh or cached is not None)
+    except QueueFullError as e:
+        if cached is not None:
+            # Stale content is better than an error when we cannot refresh right now
+            return jsonify({
+                "success": True,
+                "cache_hit": True,
+                "stale": True,
+                "newsletter": cached,
+                "subreddit": subreddit_name
+            })
+        logger.warning(f"Rejected newsletter request for r/{subreddit_name}: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "subreddit": subreddit_name
+        }), 503
+    
+    if not created:
+        logger.info(f"Attached request for r/{subreddit_name} to in-flight job {job['id']}",
+                    extra={"job_id": job['id'], "subreddit": subreddit_name})
+    
+    if cached is not None:
+        # Stale-while-revalidate: answer now, the job refreshes the cache
+        logger.info(f"Serving stale newsletter for r/{subreddit_name} while job {job['id']} refreshes it",
+                    extra={"job_id": job['id'], "subreddit": subreddit_name})
         return jsonify({
             "success": True,
-            "newsletter": latest_newsletter,
-            "processing_time": f"{processing_time:.2f}s",
+            "cache_hit": True,
+            "stale": True,
+            "newsletter": cached,
+            "job_id": job["id"],
+            "status_url": f"/jobs/{job['id']}",
             "subreddit": subreddit_name
         })
-        
-    except Exception as e:
-        logger.error(f"Error during newsletter generation for r/{subreddit_name}: {str(e)}", exc_info=True)
-        newsletter_status = "error"
+    
+    return jsonify({
+        "success": True,
+        "cache_hit": False,
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "deduplicated": not created,
+        "subreddit": subreddit_name
+    }), 202
+
+def parse_subreddit_list(values):
+    """Clean a list of subreddit names, dropping blanks and case-insensitive repeats"""
+    names = []
+    for value in values:
+        for part in str(value).replace('+', ',').split(','):
+            if not part.strip():
+                continue
+            name = clean_subreddit_name(part)
+            if name.lower() not in (existing.lower() for existing in names):
+                names.append(name)
+    return names
+
+@app.route('/generate-digest', methods=['GET', 'POST'])
+def generate_digest():
+    """Queue one combined newsletter for several subreddits (``subreddits=a,b,c``)"""
+    body = request.get_json(silent=True) or {}
+    requested = body.get('subreddits') or request.values.getlist('subreddits')
+    if isinstance(requested, str):
+        requested = [requested]
+    subreddit_names = parse_subreddit_list(requested)
+    
+    if not subreddit_names:
+        return jsonify({"success": False, "error": "Provide at least one subreddit in 'subreddits'"}), 400
+    if len(subreddit_names) > config.DIGEST_MAX_SUBREDDITS:
         return jsonify({
             "success": False,
-            "error": f"Failed to generate newsletter for r/{subreddit_name}: {str(e)}",
-            "subreddit": subreddit_name
-        }), 500
+            "error": f"A digest can cover at most {config.DIGEST_MAX_SUBREDDITS} subreddits"
+        }), 400
+    
+    digest_name = '+'.join(subreddit_names)
+    force_refresh = str(body.get('refresh', request.values.get('refresh', 'false'))).lower() in ('1', 'true', 'yes')
+    cached, cache_state = (None, None) if force_refresh else newsletter_cache.get(f"digest:{digest_name}")
+    if cached is not None and cache_state != STALE:
+        logger.info(f"Serving cached digest for r/{digest_name}")
+        return conditional_json({
+            "success": True,
+            "cache_hit": True,
+            "newsletter": cached,
+            "subreddits": subreddit_names
+        })
+    
+    try:
+        job, created = digest_jobs.submit(digest_name, refresh=force_refresh or cached is not None)
+    except QueueFullError as e:
+        logger.warning(f"Rejected digest request for r/{digest_name}: {e}")
+        return jsonify({"success": False, "error": str(e), "subreddits": subreddit_names}), 503
+    
+    return jsonify({
+        "success": True,
+        "cache_hit": False,
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "deduplicated": not created,
+        "subreddits": subreddit_names
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Report the status and, once finished, the result of a job"""
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    return conditional_json(job)
+
+def sse_event(event, data):
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def job_stream_event(event, data):
+    """SSE for one event published to ``job_streams``"""
+    if event == "status":
+        return sse_event("status", {"message": data})
+    if event == "chunk":
+        return sse_event("chunk", {"text": data})
+    if event == "done":
+        return sse_event("done", {"newsletter": data, "cache_hit": False})
+    return sse_event("failed", {"error": data})
+
+def finished_job_event(job):
+    """Final SSE for a job that ended without its events reaching this process, else None"""
+    if job is None:
+        return sse_event("failed", {"error": "The newsletter job expired before it finished"})
+    if job["status"] == COMPLETED:
+        return sse_event("done", {"newsletter": job["newsletter"], "cache_hit": False})
+    if job["status"] == ERROR:
+        return sse_event("failed", {"error": job["error"]})
+    return None
+
+# Sync newsletter streams each hold a gthread until their job ends
+stream_slots = threading.BoundedSemaphore(max(1, config.STREAM_MAX_CLIENTS))
+
+@app.route('/generate-newsletter/stream')
+def generate_newsletter_stream():
+    """Stream the newsletter as it is written (SSE)
+
+    Generation runs as a regular job, so concurrent requests for one
+    subreddit (streamed or not) share a single run and its draft, and the
+    job queue limit applies. A fresh cached newsletter is sent right away;
+    a stale one is sent while the job refreshes it.
+    
+    An open stream pins a server thread, so only STREAM_MAX_CLIENTS run at
+    once per process; further clients get a 503 with ``Retry-After``. The
+    ASGI app streams on the event loop without this limit.
+    """
+    if not stream_slots.acquire(blocking=False):
+        response = jsonify({
+            "success": False,
+            "error": "Too many newsletter streams are open, please retry shortly"
+        })
+        response.status_code = 503
+        response.headers["Retry-After"] = str(config.STREAM_RETRY_AFTER)
+        return response
+    
+    subreddit_name = clean_subreddit_name(request.args.get('subreddit', 'LocalLLaMA'))
+    force_refresh = request.args.get('refresh', 'false').lower() in ('1', 'true', 'yes')
+    
+    def generate_events():
+        cached, cache_state = (None, None) if force_refresh else newsletter_cache.get(subreddit_name)
+        if cached is not None and cache_state != STALE:
+            logger.info(f"Serving cached newsletter for r/{subreddit_name} over stream")
+            yield sse_event("done", {"newsletter": cached, "cache_hit": True})
+            return
+        
+        try:
+            job, created = jobs.submit(subreddit_name, refresh=force_refresh or cached is not None)
+        except QueueFullError as e:
+            if cached is not None:
+                yield sse_event("done", {"newsletter": cached, "cache_hit": True, "stale": True})
+                return
+            logger.warning(f"Rejected streamed newsletter request for r/{subreddit_name}: {e}")
+            yield sse_event("failed", {"error": str(e)})
+            return
+        
+        if cached is not None:
+            # Stale-while-revalidate, as for /generate-newsletter
+            yield sse_event("done", {"newsletter": cached, "cache_hit": True, "stale": True, "job_id": job["id"]})
+            return
+        
+        if not created:
+            logger.info(f"Attached stream for r/{subreddit_name} to in-flight job {job['id']}",
+                        extra={"job_id": job['id'], "subreddit": subreddit_name})
+        yield sse_event("status", {"message": f"Queued newsletter generation for r/{subreddit_name}..."})
+        for item in job_streams.follow(job["id"], poll_interval=config.STATUS_POLL_INTERVAL):
+            if item is not None:
+                yield job_stream_event(*item)
+                continue
+            # No news: the job may be running in another worker process
+            final = finished_job_event(jobs.get(job["id"]))
+            if final is not None:
+                yield final
+                return
+            yield ": keep-alive\n\n"
+    
+    response = Response(generate_events(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"  # Stop reverse proxies from buffering the stream
+    })
+    response.call_on_close(stream_slots.release)
+    return response
+
+def job_status_record(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return None
+    return {
+        "job_id": job_id,
+        "subreddit": job["subreddit"],
+        "status": job["status"],
+        "newsletter": job["newsletter"],
+        "error": job["error"],
+        "version": job.get("version", 0)
+    }
+
+def latest_status_record():
+    return result_store.get("newsletter:latest") or {"status": "ready", "newsletter": None, "version": 0}
 
 @app.route('/newsletter-status')
 def newsletter_status_endpoint():
-    return jsonify({
-        "status": newsletter_status,
-        "newsletter": latest_newsletter
-    })
+    """Status of a specific job (``?job_id=``) or of the most recent newsletter
+    
+    Every state change bumps ``version``. With ``?since=<version>`` the request
+    is held until the version moves past it or STATUS_LONG_POLL_SECONDS (or a
+    shorter ``timeout``) pass; an unchanged result then matches the client's
+    ETag and is answered with an empty 304.
+    
+    A held request occupies a server thread, so at most STATUS_LONG_POLL_MAX
+    wait per process. Beyond that the current record is returned at once
+    with ``Retry-After``, and the client polls again after that delay.
+    """
+    job_id = request.args.get('job_id')
+    fetch = (lambda: job_status_record(job_id)) if job_id else latest_status_record
+    since = request.args.get('since', type=int)
+    busy = False
+    if since is None:
+        record = fetch()
+    elif long_poll_slots.acquire(blocking=False):
+        try:
+            timeout = request.args.get('timeout', config.STATUS_LONG_POLL_SECONDS, type=float)
+            timeout = max(0.0, min(timeout, config.STATUS_LONG_POLL_SECONDS))
+            record = status_changes.wait_for_change(fetch, since, timeout)
+        finally:
+            long_poll_slots.release()
+    else:
+        record = fetch()
+        busy = True
+    
+    if record is None:
+        return jsonify({"success": False, "error": "Job not found"}), 404
+    response = conditional_json(record)
+    if busy:
+        response.headers["Retry-After"] = str(max(1, round(config.STATUS_POLL_INTERVAL)))
+    return response
 
 @app.route('/newsletter-ui')
 def newsletter_ui():
     logger.info("Newsletter UI accessed")
-    return render_template("newsletter.html")
+    subreddit_name = clean_subreddit_name(request.args.get('subreddit', 'LocalLLaMA'))
+    predefined = {name.lower(): name for name in config.predefined_subreddits}
+    if subreddit_name.lower() not in predefined:
+        # Arbitrary user input is rendered per request rather than growing the page cache
+        return page_response(None, "newsletter.html", subreddit=subreddit_name)
+    subreddit_name = predefined[subreddit_name.lower()]
+    return page_response(f"newsletter:{subreddit_name.lower()}", "newsletter.html", subreddit=subreddit_name)
+
+# Sync /logs streams each hold a gthread for up to LOG_STREAM_MAX_SECONDS
+log_stream_slots = threading.BoundedSemaphore(max(1, config.LOG_STREAM_MAX_CLIENTS))
 
 @app.route('/logs')
 def logs():
-    """Stream real-time logs to the web interface"""
+    """Stream real-time logs to the web interface
+    
+    Optional ``?job_id=`` and ``?subreddit=`` limit the stream to lines
+    logged for one job or subreddit. Each stream
+    ends after LOG_STREAM_MAX_SECONDS; EventSource then reconnects and resumes
+    from its ``Last-Event-ID``, so no worker thread is held indefinitely.
+    Each stream still pins a server thread while open, so only
+    LOG_STREAM_MAX_CLIENTS run at once per process; further clients get a
+    503 with ``Retry-After``. The ASGI app serves /logs without this limit.
+    """
+    if not log_stream_slots.acquire(blocking=False):
+        response = jsonify({
+            "success": False,
+            "error": "Too many log streams are open, please retry shortly"
+        })
+        response.status_code = 503
+        response.headers["Retry-After"] = str(config.LOG_STREAM_RETRY_AFTER)
+        return response
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    job_id = request.args.get('job_id') or None
+    subreddit = request.args.get('subreddit') or None
+    subscriber = log_broadcaster.subscribe(last_event_id=last_event_id, job_id=job_id, subreddit=subreddit)
+    
     def generate_logs():
-        try:
-            with open(config.LOG_FILE, 'r') as f:
-                # Get existing logs
-                f.seek(0, 2)  # Go to end of file
-                while True:
-                    line = f.readline()
-                    if line:
-                        yield f"data: {line}\n\n"
-                    else:
-                        time.sleep(0.1)
-        except FileNotFoundError:
-            yield "data: Log file not found\n\n"
-    
-    return Response(generate_logs(), mimetype='text/event-stream')
+        deadline = time.monotonic() + config.LOG_STREAM_MAX_SECONDS
+        yield "retry: 2000\n\n"
+        # A dropped (too slow) client ends its stream and resumes from the backlog on reconnect
+        while time.monotonic() < deadline and not subscriber.dropped:
+            try:
+                event_id, line = subscriber.queue.get(timeout=min(15, max(0.1, deadline - time.monotonic())))
+            except queue.Empty:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {event_id}\ndata: {line}\n\n"
+    
+    response = Response(generate_logs(), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+    
+    # The server closes every response, even one whose generator never started
+    @response.call_on_close
+    def release():
+        log_broadcaster.unsubscribe(subscriber)
+        log_stream_slots.release()
+    
+    return response
 
 @app.route('/api-status')
 def api_status():
@@ -124,28 +707,71 @@ def api_status():
         "reddit_configured": False  # Will be true when Reddit credentials are properly set
     }
     
-    try:
-        # Test Reddit configuration by checking if we have proper credentials
-        if config.has_reddit_config:
-            import praw
-            reddit = praw.Reddit(
-                client_id=config.REDDIT_CLIENT_ID,
-                client_secret=config.REDDIT_CLIENT_SECRET, 
-                user_agent=config.REDDIT_USER_AGENT,
-            )
-            # Try to access a subreddit to test credentials
-            subreddit = reddit.subreddit("test")
-            subreddit.display_name  # This will trigger an API call
-            status["reddit_configured"] = True
-        else:
-            logger.info("Reddit credentials not configured in environment variables - using demo data")
-            status["reddit_configured"] = True  # Demo data still works
-    except Exception as e:
-        logger.warning(f"Reddit configuration test failed, will use demo data: {e}")
-        status["reddit_configured"] = True  # Demo data fallback
+    if config.has_reddit_config:
+        # Cached probe through the shared client, so this stays cheap to poll
+        status["reddit_credentials_valid"] = check_reddit_credentials()
+        if not status["reddit_credentials_valid"]:
+            logger.warning("Reddit configuration test failed, will use demo data")
+    else:
+        logger.info("Reddit credentials not configured in environment variables - using demo data")
+    status["reddit_configured"] = True  # Live data or the demo data fallback both work
+    
+    llm_cache = get_llm_cache()
+    status["completion_cache"] = llm_cache.stats() if llm_cache is not None else {"enabled": False}
+    status["circuits"] = {"openrouter": openrouter_breaker.snapshot(), "reddit": reddit_breaker.snapshot()}
     
     return jsonify(status)
 
+def archive_page_size():
+    return max(1, min(request.args.get('limit', config.ARCHIVE_PAGE_SIZE, type=int), config.ARCHIVE_MAX_PAGE_SIZE))
+
+def archive_subreddit_filter():
+    subreddit_name = request.args.get('subreddit', '').strip()
+    return clean_subreddit_name(subreddit_name) if subreddit_name else None
+
+@app.route('/archive')
+def archive_history():
+    """Archived newsletters, newest first; pass ``next_before`` back as ``?before=`` for the next page"""
+    if archive is None:
+        return jsonify({"success": False, "error": "The newsletter archive is disabled"}), 404
+    newsletters, next_before = archive.history(
+        subreddit=archive_subreddit_filter(),
+        before=request.args.get('before', type=int),
+        limit=archive_page_size(),
+    )
+    return jsonify({"success": True, "newsletters": newsletters, "next_before": next_before})
+
+@app.route('/archive/search')
+def archive_search():
+    """Full-text search over archived newsletters, best matches first; page with ``?offset=``"""
+    if archive is None:
+        return jsonify({"success": False, "error": "The newsletter archive is disabled"}), 404
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"success": False, "error": "Provide a search query in 'q'"}), 400
+    results, next_offset = archive.search(
+        query,
+        subreddit=archive_subreddit_filter(),
+        offset=max(0, request.args.get('offset', 0, type=int)),
+        limit=archive_page_size(),
+    )
+    return jsonify({"success": True, "query": query, "results": results, "next_offset": next_offset})
+
+@app.route('/archive/<int:archive_id>')
+def archived_newsletter(archive_id):
+    """One archived newsletter; it never changes, so clients may cache it"""
+    record = archive.get(archive_id) if archive is not None else None
+    if record is None:
+        return jsonify({"success": False, "error": "Newsletter not found"}), 404
+    response = conditional_json({"success": True, "newsletter": record})
+    response.headers["Cache-Control"] = "public, max-age=86400"
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Pipeline metrics for this worker process in Prometheus text format"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health')
 def health():
     """Basic health check endpoint"""
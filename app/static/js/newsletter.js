@@ -0,0 +1,263 @@
+// Reddit AI Newsletter Generator - newsletter page: generation, status and log viewer
+
+let eventSource = null;
+let isGenerating = false;
+let currentSubreddit = 'LocalLLaMA'; // Default
+
+// Get subreddit from URL parameter
+function getSubredditFromURL() {
+    const urlParams = new URLSearchParams(window.location.search);
+    return urlParams.get('subreddit') || 'LocalLLaMA';
+}
+
+// Initialize page with subreddit
+function initializePage() {
+    currentSubreddit = getSubredditFromURL();
+    const subtitle = document.getElementById('subtitle');
+    subtitle.textContent = `AI-powered newsletter from r/${currentSubreddit} content`;
+}
+
+function generateNewsletter() {
+    if (isGenerating) return;
+
+    isGenerating = true;
+    updateGenerateButton(true);
+    showStatus(`Initializing newsletter generation for r/${currentSubreddit}...`, 'processing');
+
+    if (window.EventSource) {
+        streamNewsletter();
+        return;
+    }
+
+    fetch(`/generate-newsletter?subreddit=${encodeURIComponent(currentSubreddit)}`, { method: 'POST' })
+        .then(response => response.json())
+        .then(data => {
+            if (data.success && data.cache_hit) {
+                showNewsletter(data.newsletter);
+                if (data.stale && data.job_id) {
+                    // Show the cached copy now and swap in the fresh one when it is ready
+                    showStatus(`Showing a recent r/${data.subreddit} newsletter while a fresh one is generated...`, 'processing');
+                    monitorJob(data.job_id);
+                } else {
+                    showStatus(`Newsletter for r/${data.subreddit} loaded from cache`, 'completed');
+                    finishGenerating();
+                }
+            } else if (data.success) {
+                monitorJob(data.job_id);
+            } else {
+                showStatus(`Error: ${data.error}`, 'error');
+                finishGenerating();
+            }
+        })
+        .catch(error => {
+            showStatus(`Error: ${error.message}`, 'error');
+            finishGenerating();
+        });
+}
+
+function streamNewsletter() {
+    // Render the newsletter while the model is still writing it
+    const stream = new EventSource(`/generate-newsletter/stream?subreddit=${encodeURIComponent(currentSubreddit)}`);
+    const contentDiv = document.getElementById('newsletterContent');
+    let draft = '';
+    let finished = false;
+
+    stream.addEventListener('status', event => {
+        showStatus(JSON.parse(event.data).message, 'processing');
+    });
+
+    stream.addEventListener('chunk', event => {
+        if (!draft) {
+            document.getElementById('newsletterResult').style.display = 'block';
+            showStatus(`Writing r/${currentSubreddit} newsletter...`, 'processing');
+        }
+        draft += JSON.parse(event.data).text;
+        // Model output is untrusted: show the raw draft as text until `done` brings the sanitized HTML
+        contentDiv.classList.add('draft');
+        contentDiv.textContent = draft;
+    });
+
+    stream.addEventListener('done', event => {
+        finished = true;
+        stream.close();
+        const data = JSON.parse(event.data);
+        showNewsletter(data.newsletter);
+        if (data.stale && data.job_id) {
+            showStatus(`Showing a recent r/${data.newsletter.subreddit} newsletter while a fresh one is generated...`, 'processing');
+            monitorJob(data.job_id);
+            return;
+        }
+        const source = data.cache_hit ? 'loaded from cache' : 'generated successfully!';
+        showStatus(`Newsletter for r/${data.newsletter.subreddit} ${source}`, 'completed');
+        finishGenerating();
+    });
+
+    stream.addEventListener('failed', event => {
+        finished = true;
+        stream.close();
+        showStatus(`Error: ${JSON.parse(event.data).error}`, 'error');
+        finishGenerating();
+    });
+
+    stream.onerror = function() {
+        if (finished) return;
+        // Do not let EventSource reconnect and restart the pipeline
+        stream.close();
+        showStatus('Error: connection to the server was lost', 'error');
+        finishGenerating();
+    };
+}
+
+function finishGenerating() {
+    isGenerating = false;
+    updateGenerateButton(false);
+}
+
+function monitorJob(jobId, since = 0) {
+    // Long-poll: the server answers as soon as the job moves past `since`,
+    // or at once with Retry-After when too many requests are already waiting
+    fetch(`/newsletter-status?job_id=${encodeURIComponent(jobId)}&since=${since}`)
+        .then(response => {
+            const retryAfter = Number(response.headers.get('Retry-After')) || 0;
+            return response.json().then(job => ({ job, retryAfter }));
+        })
+        .then(({ job, retryAfter }) => {
+            if (job.status === 'completed') {
+                showNewsletter(job.newsletter);
+                showStatus(`Newsletter for r/${job.subreddit} generated successfully!`, 'completed');
+                finishGenerating();
+                return;
+            }
+            if (job.status === 'error' || job.success === false) {
+                showStatus(`Error: ${job.error}`, 'error');
+                finishGenerating();
+                return;
+            }
+            if (job.status === 'processing') {
+                showStatus(`AI agents are analyzing r/${currentSubreddit} content...`, 'processing');
+            } else {
+                showStatus(`Waiting for a free worker to start r/${currentSubreddit}...`, 'processing');
+            }
+            setTimeout(() => monitorJob(jobId, job.version), retryAfter * 1000);
+        })
+        .catch(error => {
+            console.error('Status monitoring error:', error);
+            setTimeout(() => monitorJob(jobId, since), 2000);
+        });
+}
+
+function updateGenerateButton(generating) {
+    const btn = document.getElementById('generateBtn');
+    const text = document.getElementById('generateText');
+    const spinner = document.getElementById('generateSpinner');
+
+    if (generating) {
+        btn.disabled = true;
+        text.textContent = 'Generating...';
+        spinner.style.display = 'inline-block';
+    } else {
+        btn.disabled = false;
+        text.textContent = `Generate r/${currentSubreddit} Newsletter`;
+        spinner.style.display = 'none';
+    }
+}
+
+function showStatus(message, type) {
+    const statusCard = document.getElementById('statusCard');
+    const statusText = document.getElementById('statusText');
+    const progressBar = document.getElementById('progressBar');
+
+    statusCard.style.display = 'block';
+    statusCard.className = `status-card status-${type}`;
+    statusText.textContent = message;
+
+    if (type === 'processing') {
+        progressBar.style.display = 'block';
+    } else {
+        progressBar.style.display = 'none';
+    }
+}
+
+function showNewsletter(newsletter) {
+    const resultDiv = document.getElementById('newsletterResult');
+    const contentDiv = document.getElementById('newsletterContent');
+    const timeSpan = document.getElementById('generatedTime');
+    const processingSpan = document.getElementById('processingTime');
+
+    // The server renders sanitized HTML once per newsletter; older records only have markdown, shown as text
+    if (newsletter.html) {
+        contentDiv.classList.remove('draft');
+        contentDiv.innerHTML = newsletter.html;
+    } else {
+        contentDiv.classList.add('draft');
+        contentDiv.textContent = newsletter.content;
+    }
+    timeSpan.textContent = `Generated: ${new Date(newsletter.generated_at).toLocaleString()}`;
+    processingSpan.textContent = `Processing time: ${newsletter.processing_time}`;
+
+    if (newsletter.subreddit) {
+        timeSpan.textContent += ` | Subreddit: r/${newsletter.subreddit}`;
+    }
+
+    resultDiv.style.display = 'block';
+    resultDiv.scrollIntoView({ behavior: 'smooth' });
+}
+
+function toggleLogs() {
+    const logsContainer = document.getElementById('logsContainer');
+    const isVisible = logsContainer.classList.contains('show-logs');
+
+    if (isVisible) {
+        logsContainer.classList.remove('show-logs');
+        if (eventSource) {
+            eventSource.close();
+            eventSource = null;
+        }
+    } else {
+        logsContainer.classList.add('show-logs');
+        startLogStream();
+    }
+}
+
+function startLogStream() {
+    if (eventSource) return;
+
+    eventSource = new EventSource('/logs');
+    const logsDiv = document.getElementById('logs');
+
+    eventSource.onmessage = function(event) {
+        const line = document.createElement('div');
+        line.textContent = event.data;
+        logsDiv.appendChild(line);
+        logsDiv.scrollTop = logsDiv.scrollHeight;
+    };
+
+    eventSource.onerror = function(event) {
+        console.error('Log stream error:', event);
+        if (eventSource && eventSource.readyState === EventSource.CLOSED) {
+            // Refused (503 when the server has too many log streams open); EventSource does not retry that
+            eventSource = null;
+            setTimeout(() => {
+                if (document.getElementById('logsContainer').classList.contains('show-logs')) startLogStream();
+            }, 30000);
+        }
+    };
+}
+
+// Initialize page and check status on load
+window.addEventListener('load', function() {
+    initializePage();
+    updateGenerateButton(false); // Update button text with subreddit
+
+    fetch('/newsletter-status')
+        .then(response => response.json())
+        .then(data => {
+            if (data.newsletter) {
+                showNewsletter(data.newsletter);
+                showStatus('Previous newsletter available', 'completed');
+            }
+        })
+        .catch(error => {
+            console.error('Error checking newsletter status:', error);
+        });
+});
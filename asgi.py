@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+ASGI Entry Point for Reddit AI Newsletter Generator
+Run with an ASGI server, e.g. ``uvicorn asgi:app --host 0.0.0.0 --port 5000``
+"""
+
+import os
+import sys
+import time
+
+# Add the current directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import_started = time.perf_counter()
+from app.asgi import application as app
+from app.core.startup import record_startup
+from app.main import logger
+from config import config
+record_startup("import", time.perf_counter() - import_started)
+
+logger.info(f"OpenRouter Model: {config.OPENROUTER_MODEL}")
+logger.info(f"OpenRouter API Key configured: {config.has_openrouter_config}")
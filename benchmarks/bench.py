@@ -0,0 +1,408 @@
+"""
+Offline benchmark suite for the newsletter pipeline and the Flask endpoints
+
+    python -m benchmarks.bench --requests 40 --concurrency 8 --save main
+    python -m benchmarks.bench --requests 40 --concurrency 8 --compare main
+
+Reddit is replaced by an in-process praw stub and OpenRouter by the local
+stub server, both with configurable latency and payload sizes, so runs are
+repeatable without network access or API keys. Each scenario reports
+throughput, p50/p95/p99 latency and memory. ``--save NAME`` stores the run
+in ``benchmarks/baselines/NAME.json``; ``--compare NAME`` prints the change
+against that baseline and exits non-zero when a metric regressed by more
+than ``--threshold``. Timings only compare on the machine that recorded
+them, so no baseline is shipped: record your own before changing the code.
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import requests
+from benchmarks.loadtest import percentile
+from benchmarks.stub_openrouter import start_stub
+from benchmarks.stub_reddit import StubReddit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(ROOT, "benchmarks", "baselines")
+
+SCENARIOS = ("kickoff", "job", "stream", "cached", "health", "startup")
+
+# Metric -> True when a larger value is better
+COMPARED_METRICS = {
+    "throughput_rps": True,
+    "p50": False,
+    "p95": False,
+    "p99": False,
+    "import_seconds": False,
+    "peak_rss_mb": False,
+    "traced_peak_mb": False,
+}
+
+
+def configure_environment(stub_url):
+    """Point the app at the stubs; must run before ``app`` is imported"""
+    os.environ["OPENROUTER_BASE_URL"] = stub_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["RESULT_STORE_URL"] = "memory://"
+    # Benchmark newsletters must not land in the archive of a real deployment
+    os.environ["ARCHIVE_URL"] = ""
+    os.environ["PREGEN_INTERVAL"] = "0"
+    # Every request should do the full amount of work unless the caller opts into caching
+    os.environ.setdefault("LLM_CACHE_URL", "")
+    os.environ.setdefault("SCRAPE_CACHE_URL", "")
+    # The Reddit rate limiter would otherwise dominate every timing
+    os.environ.setdefault("REDDIT_REQUESTS_PER_SECOND", "1000")
+    os.environ.setdefault("REDDIT_REQUEST_BURST", "1000")
+
+
+def install_reddit_stub(stub):
+    """Make every get_reddit_client() call in this process return ``stub``"""
+    from app.core import clients
+    with clients._lock:
+        clients._registry()["reddit"] = stub
+
+
+def rss_mb():
+    """Current resident set size of this process, if the platform exposes it"""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 2 ** 10 if sys.platform != "darwin" else peak / 2 ** 20, 1)
+
+
+def run_concurrent(fn, total, concurrency):
+    """Call ``fn(index)`` ``total`` times on ``concurrency`` threads; returns (latencies, errors, elapsed)"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def timed(index):
+        start = time.perf_counter()
+        try:
+            fn(index)
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as executor:
+        list(executor.map(timed, range(total)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def summarize(latencies, errors, elapsed, total, concurrency):
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "mean": round(statistics.mean(latencies), 4) if latencies else None,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": round(max(latencies), 3) if latencies else None,
+    }
+
+
+def mean_stage_seconds(stats_list):
+    """Average each ``*_seconds`` number the pipeline recorded in its stats dicts"""
+    values = {}
+    for stats in stats_list:
+        for key, value in stats.items():
+            if key.endswith("_seconds") and isinstance(value, (int, float)):
+                values.setdefault(key, []).append(value)
+    return {key: round(statistics.mean(found), 4) for key, found in sorted(values.items())}
+
+
+def kickoff_scenario(total, concurrency):
+    """Drive SimpleNewsletter.kickoff directly, one distinct subreddit per call"""
+    from app.core.reddit_newsletter import crew
+    stats_list = []
+
+    def call(index):
+        stats = {}
+        crew.kickoff(f"bench{index}", stats=stats)
+        stats_list.append(stats)
+
+    latencies, errors, elapsed = run_concurrent(call, total, concurrency)
+    report = summarize(latencies, errors, elapsed, total, concurrency)
+    report["stages"] = mean_stage_seconds(stats_list)
+    return report
+
+
+class AppServer:
+    """The Flask app on a threaded werkzeug server in this process"""
+
+    def __init__(self):
+        from werkzeug.serving import make_server
+        from app.main import app
+        # Per-request log lines would cost more than the requests being measured
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        self._server = make_server("127.0.0.1", 0, app, threaded=True)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def shutdown(self):
+        self._server.shutdown()
+
+
+_sessions = threading.local()
+
+
+def session():
+    """One keep-alive connection per client thread"""
+    if not hasattr(_sessions, "session"):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def generate(base_url, subreddit_name, poll_interval=0.02, timeout=300):
+    """Queue a generation job and poll it to completion"""
+    response = session().post(f"{base_url}/generate-newsletter",
+                              data={"subreddit": subreddit_name, "refresh": "true"}, timeout=30)
+    response.raise_for_status()
+    job_id = response.json()["job_id"]
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = session().get(f"{base_url}/jobs/{job_id}", timeout=30).json()
+        if job["status"] == "completed":
+            return
+        if job["status"] == "error":
+            raise RuntimeError(job["error"])
+        time.sleep(poll_interval)
+    raise TimeoutError(f"Job {job_id} did not finish in {timeout}s")
+
+
+def job_request(base_url, index):
+    generate(base_url, f"benchjob{index}")
+
+
+def stream_request(base_url, index):
+    """Generate over the SSE endpoint and read the stream to its done event"""
+    with session().get(f"{base_url}/generate-newsletter/stream",
+                       params={"subreddit": f"benchstream{index}", "refresh": "true"},
+                       stream=True, timeout=300) as response:
+        response.raise_for_status()
+        for line in response.iter_lines(decode_unicode=True):
+            if line == "event: done":
+                return
+            if line == "event: failed":
+                raise RuntimeError("stream reported a failure")
+    raise RuntimeError("stream ended without a done event")
+
+
+def cached_request(base_url, index):
+    response = session().get(f"{base_url}/generate-newsletter", params={"subreddit": "benchcached"}, timeout=30)
+    response.raise_for_status()
+    if not response.json().get("cache_hit"):
+        raise RuntimeError("expected a cache hit")
+
+
+def health_request(base_url, index):
+    session().get(f"{base_url}/health", timeout=30).raise_for_status()
+
+
+ENDPOINT_REQUESTS = {
+    "job": job_request,
+    "stream": stream_request,
+    "cached": cached_request,
+    "health": health_request,
+}
+
+
+def endpoint_scenario(server, name, total, concurrency):
+    if name == "cached":
+        generate(server.base_url, "benchcached")  # warm the cache entry the scenario reads
+    request = ENDPOINT_REQUESTS[name]
+    latencies, errors, elapsed = run_concurrent(lambda index: request(server.base_url, index), total, concurrency)
+    return summarize(latencies, errors, elapsed, total, concurrency)
+
+
+def startup_scenario(total):
+    """Cold-start fresh interpreters that import the app, one at a time like worker restarts"""
+    import_seconds = []
+    code = "import time; t = time.perf_counter(); import app.main; print(time.perf_counter() - t)"
+
+    def start(index):
+        result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=os.environ,
+                                capture_output=True, text=True, timeout=60, check=True)
+        import_seconds.append(float(result.stdout.strip().splitlines()[-1]))
+
+    latencies, errors, elapsed = run_concurrent(start, total, 1)
+    report = summarize(latencies, errors, elapsed, total, 1)
+    report["import_seconds"] = round(statistics.mean(import_seconds), 4) if import_seconds else None
+    return report
+
+
+def run_scenario(name, args, server):
+    """Run one scenario and attach its memory figures"""
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        if name == "kickoff":
+            report = kickoff_scenario(args.requests, args.concurrency)
+        elif name == "startup":
+            report = startup_scenario(args.startup_runs)
+        else:
+            total = args.requests * args.fast_multiplier if name in ("cached", "health") else args.requests
+            report = endpoint_scenario(server, name, total, args.concurrency)
+        if args.trace_memory:
+            report["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+    finally:
+        if args.trace_memory:
+            tracemalloc.stop()
+    report["rss_mb"] = rss_mb()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(run, baseline, threshold):
+    """Return ``(lines, regressions)`` comparing each scenario metric with the baseline"""
+    lines, regressions = [], []
+    for name, report in run["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            lines.append(f"{name}: not in baseline")
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before.get(metric), report.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = ""
+            if worse > threshold:
+                flag = "  REGRESSION"
+                regressions.append(f"{name}.{metric}")
+            lines.append(f"{name}.{metric}: {old} -> {new} ({change:+.1%}){flag}")
+    return lines, regressions
+
+
+def baseline_path(name):
+    return name if name.endswith(".json") else os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def baseline_mismatches(run, baseline):
+    """Settings that differ between a run and its baseline, making the timings incomparable"""
+    mismatches = [key for key in ("python", "platform") if run.get(key) != baseline.get(key)]
+    parameters, before = run.get("parameters", {}), baseline.get("parameters", {})
+    mismatches += [f"--{key.replace('_', '-')}" for key in sorted(parameters)
+                   if key != "threshold" and parameters[key] != before.get(key)]
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the newsletter pipeline against local stubs")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="scenario(s) to run, default all")
+    parser.add_argument("--requests", type=int, default=20, help="pipeline runs per scenario")
+    parser.add_argument("--concurrency", type=int, default=4, help="concurrent clients")
+    parser.add_argument("--fast-multiplier", type=int, default=10,
+                        help="request multiplier for the cheap cached and health scenarios")
+    parser.add_argument("--startup-runs", type=int, default=5, help="interpreters started by the startup scenario")
+    parser.add_argument("--reddit-latency", type=float, default=0.05, help="stub seconds per Reddit request")
+    parser.add_argument("--posts", type=int, default=12, help="posts per subreddit listing")
+    parser.add_argument("--comments", type=int, default=20, help="comments per post")
+    parser.add_argument("--comment-words", type=int, default=40, help="words per comment")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stub seconds per completion")
+    parser.add_argument("--completion-words", type=int, default=300, help="approximate words per completion")
+    parser.add_argument("--chunks", type=int, default=10, help="deltas per streamed completion")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also report the tracemalloc peak (slows the run down)")
+    parser.add_argument("--save", metavar="NAME", help="save the run as benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with a saved baseline (name or path)")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative change counted as a regression when comparing")
+    args = parser.parse_args()
+    if args.compare and not os.path.exists(baseline_path(args.compare)):
+        parser.error(f"no baseline {args.compare!r}; record one on this machine first with --save {args.compare}")
+
+    stub = start_stub(latency=args.llm_latency, chunks=args.chunks, words=args.completion_words)
+    configure_environment(f"http://127.0.0.1:{stub.server_address[1]}/api/v1")
+    install_reddit_stub(StubReddit(latency=args.reddit_latency, posts=args.posts,
+                                   comments_per_post=args.comments, comment_words=args.comment_words))
+
+    scenarios = args.scenario or list(SCENARIOS)
+    server = AppServer() if any(name not in ("kickoff", "startup") for name in scenarios) else None
+    run = {
+        "created_at": datetime.now().isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("save", "compare", "scenario")},
+        "scenarios": {},
+    }
+    try:
+        for name in scenarios:
+            # Keep anything the scenario writes to stdout out of the report
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                report = run_scenario(name, args, server)
+            run["scenarios"][name] = report
+            print(f"{name}: " + ", ".join(f"{key}={value}" for key, value in report.items() if key != "stages"))
+            if report.get("stages"):
+                print("  stages: " + ", ".join(f"{key}={value}" for key, value in report["stages"].items()))
+            sys.stdout.flush()
+    finally:
+        if server is not None:
+            server.shutdown()
+        stub.shutdown()
+    print(f"stub OpenRouter requests: {stub.requests}")
+
+    if args.save:
+        path = baseline_path(args.save)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(run, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {os.path.relpath(path, ROOT)}")
+
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        lines, regressions = compare(run, baseline, args.threshold)
+        print(f"Compared with baseline from {baseline.get('created_at')} (commit {baseline.get('commit')}):")
+        mismatches = baseline_mismatches(run, baseline)
+        if mismatches:
+            print(f"  warning: baseline was recorded with a different {', '.join(mismatches)}; "
+                  f"save a new one for meaningful timings")
+        for line in lines:
+            print(f"  {line}")
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
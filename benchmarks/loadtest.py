@@ -0,0 +1,172 @@
+"""
+Load test the WSGI and ASGI serving modes against the local OpenRouter stub
+
+    python -m benchmarks.loadtest --mode wsgi --mode asgi --streams 100
+
+Each mode starts the app in a subprocess (gunicorn for WSGI, uvicorn for ASGI)
+pointed at the stub, opens ``--streams`` concurrent newsletter streams plus as
+many idle /logs streams, and measures /health latency while they are open.
+Reddit is not stubbed here; without credentials the pipeline uses demo data.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.stub_openrouter import start_stub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_COMMANDS = {
+    "wsgi": ["gunicorn", "--workers", "1", "--threads", "8", "--timeout", "120", "wsgi:app"],
+    "asgi": ["uvicorn", "--workers", "1", "--no-access-log", "asgi:app"],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, port, stub_url):
+    env = dict(os.environ)
+    env["OPENROUTER_BASE_URL"] = stub_url
+    env.setdefault("OPENAI_API_KEY", "stub")
+    env["RESULT_STORE_URL"] = "memory://"
+    env["ARCHIVE_URL"] = ""
+    env["PREGEN_INTERVAL"] = "0"
+    command = list(SERVER_COMMANDS[mode])
+    if mode == "wsgi":
+        command[1:1] = ["--bind", f"127.0.0.1:{port}"]
+    else:
+        command[1:1] = ["--host", "127.0.0.1", "--port", str(port)]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+async def wait_until_healthy(client, base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base_url}/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become healthy")
+
+
+async def newsletter_stream(client, base_url, index):
+    """Return ``(first_byte_seconds, total_seconds, completed)`` for one streamed generation"""
+    start = time.monotonic()
+    first_byte = None
+    completed = False
+    try:
+        async with client.stream("GET", f"{base_url}/generate-newsletter/stream",
+                                 params={"subreddit": f"bench{index}", "refresh": "true"}) as response:
+            async for line in response.aiter_lines():
+                if first_byte is None:
+                    first_byte = time.monotonic() - start
+                if line == "event: done":
+                    completed = True
+    except httpx.HTTPError:
+        pass
+    return first_byte, time.monotonic() - start, completed
+
+
+async def hold_log_stream(client, base_url, seconds):
+    """Keep a /logs stream open; True if the server accepted it"""
+    try:
+        async with client.stream("GET", f"{base_url}/logs") as response:
+            async def drain():
+                async for _ in response.aiter_bytes():
+                    pass
+            await asyncio.wait_for(drain(), timeout=seconds)
+    except asyncio.TimeoutError:
+        return True
+    except httpx.HTTPError:
+        return False
+    return True
+
+
+async def probe_health(client, base_url, stop):
+    latencies = []
+    while not stop.is_set():
+        start = time.monotonic()
+        try:
+            await client.get(f"{base_url}/health", timeout=30)
+            latencies.append(time.monotonic() - start)
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.1)
+    return latencies
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(fraction * len(values)))], 3)
+
+
+async def run_load(base_url, streams, log_streams, log_seconds):
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(300, connect=30)) as client:
+        await wait_until_healthy(client, base_url)
+        stop = asyncio.Event()
+        probe = asyncio.ensure_future(probe_health(client, base_url, stop))
+        start = time.monotonic()
+        logs = [asyncio.ensure_future(hold_log_stream(client, base_url, log_seconds)) for _ in range(log_streams)]
+        results = await asyncio.gather(*(newsletter_stream(client, base_url, index) for index in range(streams)))
+        elapsed = time.monotonic() - start
+        logs_held = sum(await asyncio.gather(*logs))
+        stop.set()
+        health = await probe
+
+    first_bytes = [first for first, _, _ in results if first is not None]
+    totals = [total for _, total, _ in results]
+    return {
+        "streams": streams,
+        "completed": sum(1 for _, _, completed in results if completed),
+        "elapsed_seconds": round(elapsed, 2),
+        "first_byte_p50": percentile(first_bytes, 0.5),
+        "first_byte_p95": percentile(first_bytes, 0.95),
+        "total_p50": percentile(totals, 0.5),
+        "total_p95": percentile(totals, 0.95),
+        "total_mean": round(statistics.mean(totals), 3) if totals else None,
+        "log_streams_held": f"{logs_held}/{log_streams}",
+        "health_p95": percentile(health, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the WSGI and ASGI serving modes")
+    parser.add_argument("--mode", action="append", choices=sorted(SERVER_COMMANDS), help="mode(s) to test")
+    parser.add_argument("--streams", type=int, default=100, help="concurrent newsletter streams")
+    parser.add_argument("--log-streams", type=int, default=100, help="concurrent idle /logs streams")
+    parser.add_argument("--log-seconds", type=float, default=10, help="how long each /logs stream is held")
+    parser.add_argument("--latency", type=float, default=1.0, help="stub seconds per completion")
+    args = parser.parse_args()
+
+    stub = start_stub(latency=args.latency)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}/api/v1"
+    for mode in args.mode or sorted(SERVER_COMMANDS):
+        port = free_port()
+        server = start_server(mode, port, stub_url)
+        try:
+            report = asyncio.run(run_load(f"http://127.0.0.1:{port}", args.streams, args.log_streams, args.log_seconds))
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+        print(f"{mode}: " + ", ".join(f"{key}={value}" for key, value in report.items()))
+        sys.stdout.flush()
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Local stand-in for the OpenRouter chat completions API, for load tests
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_HEADER = (
+    "# Stub Newsletter\n\n## [A stubbed discussion](https://reddit.com/r/stub)\n"
+    "- Generated by the local OpenRouter stub\n- Useful for measuring the app, not the model\n"
+)
+
+
+def stub_text(words):
+    """A completion of roughly ``words`` words"""
+    return STUB_HEADER + " ".join(["insight"] * max(0, words)) + "\n"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers POST /chat/completions after ``server.latency`` seconds.
+
+    Completions are about ``server.words`` words long. Streaming requests get
+    the text in ``server.chunks`` SSE deltas spread over the latency, the
+    way a real model emits its output gradually.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with self.server.counter_lock:
+            self.server.requests += 1
+        if body.get("stream"):
+            self._stream()
+        else:
+            time.sleep(self.server.latency)
+            payload = json.dumps({"choices": [{"message": {"role": "assistant", "content": self.server.text}}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    def _stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        text = self.server.text
+        chunks = max(1, self.server.chunks)
+        size = -(-len(text) // chunks)
+        for start in range(0, len(text), size):
+            time.sleep(self.server.latency / chunks)
+            delta = {"choices": [{"delta": {"content": text[start:start + size]}}]}
+            self.wfile.write(f"data: {json.dumps(delta)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+
+def start_stub(host="127.0.0.1", port=0, latency=1.0, chunks=10, words=50):
+    """Start the stub on a daemon thread; returns the server (see ``server.server_address``)"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.chunks = chunks
+    server.text = stub_text(words)
+    server.requests = 0
+    server.counter_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, name="openrouter-stub", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local OpenRouter stub")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds per completion")
+    parser.add_argument("--chunks", type=int, default=10, help="deltas per streamed completion")
+    parser.add_argument("--words", type=int, default=50, help="approximate words per completion")
+    args = parser.parse_args()
+
+    server = start_stub(port=args.port, latency=args.latency, chunks=args.chunks, words=args.words)
+    print(f"OpenRouter stub listening on http://127.0.0.1:{args.port}/api/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,65 @@
+"""
+In-process stand-in for praw with configurable latency and payload sizes
+"""
+
+import time
+
+
+class StubComment:
+    def __init__(self, body, score):
+        self.body = body
+        self.score = score
+
+
+class StubComments:
+    def __init__(self, post):
+        self._post = post
+
+    def replace_more(self, limit=0):
+        time.sleep(self._post.reddit.latency)  # the comment tree request
+
+    def list(self):
+        words = " ".join(["lorem"] * self._post.reddit.comment_words)
+        return [StubComment(f"{self._post.id} comment {i}: {words}", score=100 - i)
+                for i in range(self._post.num_comments)]
+
+
+class StubPost:
+    def __init__(self, reddit, subreddit_name, index):
+        self.reddit = reddit
+        self.id = f"{subreddit_name.lower()}{index}"
+        self.title = f"r/{subreddit_name} discussion {index}"
+        self.url = f"https://www.reddit.com/r/{subreddit_name}/comments/{self.id}/"
+        self.num_comments = reddit.comments_per_post
+        self.comments = StubComments(self)
+
+
+class StubSubreddit:
+    def __init__(self, reddit, name):
+        self._reddit = reddit
+        self._name = name
+
+    def hot(self, limit=12):
+        time.sleep(self._reddit.latency)  # the listing request
+        return [StubPost(self._reddit, self._name, index) for index in range(min(limit, self._reddit.posts))]
+
+    @property
+    def id(self):
+        return self._name.lower()
+
+
+class StubReddit:
+    """Mimics the parts of praw.Reddit the scraper uses.
+
+    Every listing and comment tree fetch sleeps ``latency`` seconds, like a
+    network round trip to Reddit.
+    """
+
+    def __init__(self, latency=0.1, posts=12, comments_per_post=20, comment_words=40):
+        self.latency = latency
+        self.posts = posts
+        self.comments_per_post = comments_per_post
+        self.comment_words = comment_words
+
+    def subreddit(self, name):
+        return StubSubreddit(self, name)
@@ -30,9 +30,72 @@ class Config:
     # Predefined Subreddits (Optional)
     PREDEFINED_SUBREDDITS = os.getenv("PREDEFINED_SUBREDDITS", "LocalLLaMA,MachineLearning,programming,technology,artificial,ArtificialIntelligence,singularity,OpenAI,ChatGPT")
     
+    # Background Job Settings
+    JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+    JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", 20))
+    JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", 86400))
+    JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", 900))
+    
+    # Status Long-Polling (/newsletter-status?since=<version>)
+    STATUS_LONG_POLL_SECONDS = int(os.getenv("STATUS_LONG_POLL_SECONDS", 25))
+    # How often a waiting request re-reads the store for changes made by other workers
+    STATUS_POLL_INTERVAL = float(os.getenv("STATUS_POLL_INTERVAL", 1.0))
+    # Waiting long-polls each pin a server thread; past this many per process, requests are answered at once
+    STATUS_LONG_POLL_MAX = int(os.getenv("STATUS_LONG_POLL_MAX", 4))
+    
+    # Sync /generate-newsletter/stream requests each pin a server thread until their job ends
+    STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", 2))
+    STREAM_RETRY_AFTER = int(os.getenv("STREAM_RETRY_AFTER", 10))
+    
+    # Digest Settings (one newsletter covering several subreddits)
+    DIGEST_MAX_SUBREDDITS = int(os.getenv("DIGEST_MAX_SUBREDDITS", 10))
+    
+    # Shared State Settings
+    # sqlite:///path/to/file.db is shared by all workers on a host; memory:// is per process
+    RESULT_STORE_URL = os.getenv("RESULT_STORE_URL", "sqlite:///tmp/newsletter_state.db")
+    RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 256))
+    
+    # Newsletter Archive (every generated newsletter, searchable); empty disables it
+    ARCHIVE_URL = os.getenv("ARCHIVE_URL", "sqlite:///tmp/newsletter_archive.db")
+    ARCHIVE_PAGE_SIZE = int(os.getenv("ARCHIVE_PAGE_SIZE", 20))
+    ARCHIVE_MAX_PAGE_SIZE = int(os.getenv("ARCHIVE_MAX_PAGE_SIZE", 100))
+    
+    # Newsletter Cache Settings
+    NEWSLETTER_CACHE_TTL = int(os.getenv("NEWSLETTER_CACHE_TTL", 1800))
+    # Extra seconds an expired newsletter may be served while it is regenerated
+    NEWSLETTER_CACHE_STALE_TTL = int(os.getenv("NEWSLETTER_CACHE_STALE_TTL", 3600))
+    NEWSLETTER_CACHE_SIZE = int(os.getenv("NEWSLETTER_CACHE_SIZE", 64))
+    
+    # Pre-generation Settings (PREGEN_INTERVAL=0 disables the in-process scheduler)
+    PREGEN_INTERVAL = int(os.getenv("PREGEN_INTERVAL", 0))
+    PREGEN_CONCURRENCY = int(os.getenv("PREGEN_CONCURRENCY", 2))
+    PREGEN_JITTER = int(os.getenv("PREGEN_JITTER", 30))
+    PREGEN_LOCK_FILE = os.getenv("PREGEN_LOCK_FILE", "/tmp/newsletter_scheduler.lock")
+    
+    # Response Compression and Static Asset Caching
+    COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))  # smaller bodies are sent as-is
+    COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", 6))
+    STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", 31536000))  # for fingerprinted asset URLs
+    
+    # Gunicorn: import the app once in the master and fork workers from it (see gunicorn.conf.py)
+    PRELOAD_APP = os.getenv("GUNICORN_PRELOAD", "false").lower() in ("1", "true", "yes")
+    
+    # ASGI Mode Settings (threads that run the plain Flask routes under uvicorn)
+    ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 16))
+    
     # Application Settings
-    LOG_FILE = "/tmp/app.log"
+    LOG_FILE = os.getenv("LOG_FILE", "/tmp/app.log")
     LOG_LEVEL = "INFO"
+    LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))  # rotate at this size...
+    LOG_ROTATE_SECONDS = int(os.getenv("LOG_ROTATE_SECONDS", 86400))  # ...or at this interval, 0 to disable
+    LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))  # records waiting for the writer before new ones are dropped
+    LOG_STREAM_MAX_SECONDS = int(os.getenv("LOG_STREAM_MAX_SECONDS", 300))
+    # Each sync (WSGI) /logs stream holds a server thread; ASGI mode serves them on the event loop uncapped
+    LOG_STREAM_MAX_CLIENTS = int(os.getenv("LOG_STREAM_MAX_CLIENTS", 2))
+    LOG_STREAM_RETRY_AFTER = int(os.getenv("LOG_STREAM_RETRY_AFTER", 30))
+    LOG_STREAM_BACKLOG = int(os.getenv("LOG_STREAM_BACKLOG", 1000))
+    LOG_STREAM_QUEUE_SIZE = int(os.getenv("LOG_STREAM_QUEUE_SIZE", 500))
     
     @property
     def is_development(self):
@@ -0,0 +1,26 @@
+"""
+Gunicorn settings for the production image (``gunicorn -c gunicorn.conf.py wsgi:app``)
+
+With GUNICORN_PRELOAD=true the master imports the app once and workers are
+forked from it, sharing its memory copy-on-write. Anything that must not be
+shared across fork (threads, sockets, API clients) is created by
+``init_worker`` in the post_fork hook below.
+"""
+
+import os
+# Not imported as "config", which gunicorn would read as its own setting of that name
+from config import config as app_config
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+timeout = 120
+accesslog = "-"
+errorlog = "-"
+preload_app = app_config.PRELOAD_APP
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app.main import init_worker
+        init_worker()
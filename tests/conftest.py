@@ -0,0 +1,19 @@
+"""
+Test settings, applied before any test imports the app
+"""
+
+import os
+import shutil
+import tempfile
+
+# config and app.main read these at import time; keep test runs off the shared /tmp databases and log
+_state_dir = tempfile.mkdtemp(prefix="newsletter-tests-")
+os.environ["RESULT_STORE_URL"] = "memory://"
+os.environ["ARCHIVE_URL"] = f"sqlite://{_state_dir}/archive.db"
+os.environ["LLM_CACHE_URL"] = ""
+os.environ["SCRAPE_CACHE_URL"] = ""
+os.environ["LOG_FILE"] = os.path.join(_state_dir, "app.log")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_state_dir, ignore_errors=True)
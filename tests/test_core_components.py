@@ -0,0 +1,1611 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the core newsletter pipeline components
+"""
+
+import os
+import sys
+import queue
+import threading
+import time
+import pytest
+
+# Add the parent directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.jobs import JobManager, QueueFullError, COMPLETED, ERROR, is_finished_job
+from app.core.ratelimit import TokenBucket
+from app.core.cache import TTLCache, NewsletterCache, FRESH, STALE
+from app.core.store import CachedResultStore, MemoryResultStore, SQLiteResultStore
+
+def _wait_for(manager, job_id, timeout=5):
+    """Poll a job until it reaches a finished state"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job is not None and job["status"] in (COMPLETED, ERROR):
+            return job
+        time.sleep(0.01)
+    pytest.fail(f"Job {job_id} did not finish in time")
+
+def test_job_manager_deduplicates_inflight_requests():
+    """Identical in-flight requests should share one job"""
+    release = threading.Event()
+    calls = []
+
+    def runner(subreddit_name, stats):
+        calls.append(subreddit_name)
+        release.wait(5)
+        return {"content": f"newsletter for {subreddit_name}"}
+
+    manager = JobManager(runner, MemoryResultStore(), max_workers=1, max_queue=5)
+    first, created_first = manager.submit("LocalLLaMA")
+    second, created_second = manager.submit("localllama")
+    release.set()
+
+    assert created_first is True
+    assert created_second is False
+    assert first["id"] == second["id"]
+
+    job = _wait_for(manager, first["id"])
+    assert job["status"] == COMPLETED
+    assert job["newsletter"]["content"] == "newsletter for LocalLLaMA"
+    assert calls == ["LocalLLaMA"]
+
+def test_job_manager_rejects_when_queue_full():
+    """Submissions beyond workers plus queue size should be rejected"""
+    release = threading.Event()
+    manager = JobManager(lambda name, stats: release.wait(5), MemoryResultStore(), max_workers=1, max_queue=1)
+    manager.submit("one")
+    manager.submit("two")
+    with pytest.raises(QueueFullError):
+        manager.submit("three")
+    release.set()
+
+def test_job_manager_records_errors():
+    """A failing pipeline should leave the job in the error state"""
+    def runner(subreddit_name, stats):
+        raise RuntimeError("boom")
+
+    manager = JobManager(runner, MemoryResultStore(), max_workers=1)
+    job, _ = manager.submit("programming")
+    job = _wait_for(manager, job["id"])
+    assert job["status"] == ERROR
+    assert "boom" in job["error"]
+
+def test_job_manager_survives_a_lost_record_and_always_releases_dedup():
+    """An evicted record is recreated on update; a failed final save still frees the subreddit"""
+    from app.core.jobs import current_job_id
+
+    store = MemoryResultStore()
+
+    def evicting_runner(subreddit_name, stats):
+        store.delete(f"job:{current_job_id()}")
+        return {"content": subreddit_name}
+
+    manager = JobManager(evicting_runner, store, max_workers=1)
+    job, _ = manager.submit("evicted")
+    finished = _wait_for(manager, job["id"])
+    assert finished["status"] == COMPLETED
+    assert finished["newsletter"] == {"content": "evicted"}
+    assert manager.queue_depth() == 0
+
+    class FailingStore(MemoryResultStore):
+        def put(self, key, value, ttl=None):
+            if key.startswith("job:") and value["status"] in (COMPLETED, ERROR):
+                raise OSError("disk full")
+            super().put(key, value, ttl=ttl)
+
+    manager = JobManager(lambda name, stats: {"content": name}, FailingStore(), max_workers=1)
+    first, _ = manager.submit("unsaved")
+    deadline = time.time() + 5
+    while manager.queue_depth() and time.time() < deadline:
+        time.sleep(0.01)
+    assert manager.queue_depth() == 0
+    second, created = manager.submit("unsaved")
+    assert created and second["id"] != first["id"]
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    """Two store instances on one file behave like two worker processes"""
+    path = str(tmp_path / "state.db")
+    writer = SQLiteResultStore(path)
+    reader = SQLiteResultStore(path)
+
+    writer.put("job:abc", {"status": "processing"})
+    assert reader.get("job:abc") == {"status": "processing"}
+
+    writer.put("job:expired", {"status": "completed"}, ttl=-1)
+    assert reader.get("job:expired") is None
+
+def test_store_update_is_atomic_across_instances(tmp_path):
+    """Concurrent read-modify-write updates from several "processes" never lose an increment"""
+    path = str(tmp_path / "state.db")
+    stores = [SQLiteResultStore(path) for _ in range(4)] + [MemoryResultStore()]
+
+    def bump(store):
+        for _ in range(25):
+            store.update("counter", lambda current: {"version": (current or {}).get("version", 0) + 1})
+
+    threads = [threading.Thread(target=bump, args=(store,)) for store in stores[:4] for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stores[0].get("counter") == {"version": 200}
+
+    bump(stores[4])
+    assert stores[4].get("counter") == {"version": 25}
+
+def test_cached_store_only_caches_finished_jobs():
+    """Mutable entries must always be read through to the shared backend"""
+    backend = MemoryResultStore()
+    store = CachedResultStore(backend, max_entries=2, cache_if=is_finished_job)
+
+    store.put("job:running", {"status": "processing"})
+    backend.put("job:running", {"status": "completed"})
+    assert store.get("job:running")["status"] == "completed"
+
+    store.put("job:done", {"status": "completed"})
+    backend.delete("job:done")
+    assert store.get("job:done")["status"] == "completed"
+
+def test_ttl_cache_fresh_stale_and_eviction():
+    """Entries go stale after the TTL and the least recently used is evicted"""
+    cache = TTLCache(max_entries=2, ttl=10, stale_ttl=10)
+    cache.set("a", 1)
+    cache.set("b", 2, stored_at=time.time() - 15)
+    assert cache.get("a") == (1, FRESH)
+    assert cache.get("b") == (2, STALE)
+
+    cache.set("c", 3)  # evicts "a", the least recently used after the reads above
+    assert cache.get("a") == (None, None)
+
+    cache.set("d", 4, stored_at=time.time() - 25)
+    assert cache.get("d") == (None, None)
+
+def test_newsletter_cache_is_keyed_by_model_and_prompt_version():
+    """Changing model or prompt version must not serve old newsletters"""
+    store = MemoryResultStore()
+    NewsletterCache(store, model="m1", prompt_version="1").set("LocalLLaMA", {"content": "x"})
+
+    assert NewsletterCache(store, model="m1", prompt_version="1").get("localllama") == ({"content": "x"}, FRESH)
+    assert NewsletterCache(store, model="m2", prompt_version="1").get("LocalLLaMA") == (None, None)
+    assert NewsletterCache(store, model="m1", prompt_version="2").get("LocalLLaMA") == (None, None)
+
+def test_newsletter_cache_sees_a_refresh_made_by_another_worker():
+    """A worker holding a stale copy picks up the newer newsletter another worker stored"""
+    store = MemoryResultStore()
+    first = NewsletterCache(store, model="m1", prompt_version="1", ttl=0.1, stale_ttl=60)
+    second = NewsletterCache(store, model="m1", prompt_version="1", ttl=0.1, stale_ttl=60)
+
+    first.set("python", {"v": 1})
+    assert second.get("python") == ({"v": 1}, FRESH)
+    time.sleep(0.15)
+    assert second.get("python") == ({"v": 1}, STALE)
+
+    first.set("python", {"v": 2})
+    assert second.get("python") == ({"v": 2}, FRESH)
+
+def test_token_bucket_limits_rate_across_threads():
+    """Threads sharing a bucket should not exceed burst plus refill rate"""
+    bucket = TokenBucket(rate=50, capacity=5)
+    start = time.monotonic()
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(15)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 5 tokens are available immediately, the other 10 need 0.2s of refill
+    assert time.monotonic() - start >= 0.18
+    assert bucket.acquire(timeout=0) is False
+
+def test_scrape_reddit_parallel_preserves_order(monkeypatch):
+    """Parallel comment fetching keeps hot() order and the comment limit"""
+    from app.core import reddit_newsletter
+
+    class FakeComment:
+        def __init__(self, body):
+            self.body = body
+
+    class FakeComments:
+        def __init__(self, index):
+            self.index = index
+
+        def replace_more(self, limit=0):
+            time.sleep(0.05 * (12 - self.index) / 12)  # later posts finish first
+
+        def list(self):
+            return [FakeComment(f"post {self.index} comment {i}") for i in range(10)]
+
+    class FakePost:
+        def __init__(self, index):
+            self.id = f"p{index}"
+            self.num_comments = 10
+            self.title = f"Post {index}"
+            self.url = f"https://example.com/{index}"
+            self.comments = FakeComments(index)
+
+    class FakeSubreddit:
+        def hot(self, limit=12):
+            return [FakePost(i) for i in range(limit)]
+
+    class FakeReddit:
+        def subreddit(self, name):
+            return FakeSubreddit()
+
+    monkeypatch.setattr(reddit_newsletter, "get_reddit_client", FakeReddit)
+    monkeypatch.setattr(reddit_newsletter, "reddit_rate_limiter", TokenBucket(rate=1000, capacity=100))
+    monkeypatch.setattr(reddit_newsletter, "_get_scrape_cache", MemoryResultStore)
+
+    stats = {}
+    posts = reddit_newsletter.scrape_reddit("test", max_comments_per_post=3, workers=6, stats=stats)
+    assert [post["title"] for post in posts] == [f"Post {i}" for i in range(12)]
+    assert posts[4]["comments"] == ["post 4 comment 0", "post 4 comment 1", "post 4 comment 2"]
+    assert len(stats["scrape_post_seconds"]) == 12
+    assert stats["scrape_workers"] == 6
+
+def test_http_session_is_reused_and_rebuilt_after_fork(monkeypatch):
+    """Clients are shared within a process but never across a fork"""
+    from app.core import clients
+
+    session = clients.get_http_session()
+    assert clients.get_http_session() is session
+
+    monkeypatch.setattr(clients.os, "getpid", lambda: -1)
+    assert clients.get_http_session() is not session
+
+def test_stream_openrouter_request_parses_sse(monkeypatch):
+    """Streamed completions are split into text deltas, skipping comments"""
+    from app.core import reddit_newsletter
+
+    class FakeResponse:
+        encoding = None
+
+        def raise_for_status(self):
+            pass
+
+        def iter_lines(self, decode_unicode=False):
+            yield ": OPENROUTER PROCESSING"
+            yield ""
+            yield 'data: {"choices": [{"delta": {"role": "assistant"}}]}'
+            yield 'data: {"choices": [{"delta": {"content": "# Hello"}}]}'
+            yield 'data: {"choices": [{"delta": {"content": " world"}}]}'
+            yield "data: [DONE]"
+            yield 'data: {"choices": [{"delta": {"content": "ignored"}}]}'
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+    class FakeSession:
+        def post(self, url, **kwargs):
+            assert kwargs["json"]["stream"] is True
+            return FakeResponse()
+
+    monkeypatch.setattr(reddit_newsletter, "api_key", "test-key")
+    monkeypatch.setattr(reddit_newsletter, "get_http_session", FakeSession)
+    deltas = list(reddit_newsletter.stream_openrouter_request([{"role": "user", "content": "hi"}]))
+    assert deltas == ["# Hello", " world"]
+
+def test_scrape_reddit_only_refetches_changed_posts(monkeypatch):
+    """Cached posts are reused until their comment count changes"""
+    from app.core import reddit_newsletter
+
+    fetched = []
+
+    class FakeComment:
+        def __init__(self, body):
+            self.body = body
+
+    class FakeComments:
+        def __init__(self, post):
+            self.post = post
+
+        def replace_more(self, limit=0):
+            fetched.append(self.post.id)
+
+        def list(self):
+            return [FakeComment(f"{self.post.id} comment {i}") for i in range(self.post.num_comments)]
+
+    class FakePost:
+        def __init__(self, post_id, num_comments):
+            self.id = post_id
+            self.num_comments = num_comments
+            self.title = f"Post {post_id}"
+            self.url = f"https://example.com/{post_id}"
+            self.comments = FakeComments(self)
+
+    listing = [FakePost("a", 2), FakePost("b", 3)]
+
+    class FakeSubreddit:
+        def hot(self, limit=12):
+            return listing
+
+    class FakeReddit:
+        def subreddit(self, name):
+            return FakeSubreddit()
+
+    cache = MemoryResultStore()
+    monkeypatch.setattr(reddit_newsletter, "get_reddit_client", FakeReddit)
+    monkeypatch.setattr(reddit_newsletter, "reddit_rate_limiter", TokenBucket(rate=1000, capacity=100))
+    monkeypatch.setattr(reddit_newsletter, "_get_scrape_cache", lambda: cache)
+
+    first = reddit_newsletter.scrape_reddit("test", workers=1)
+    assert sorted(fetched) == ["a", "b"]
+
+    fetched.clear()
+    listing[:] = [FakePost("c", 1), FakePost("a", 2), FakePost("b", 4)]
+    stats = {}
+    second = reddit_newsletter.scrape_reddit("test", workers=1, stats=stats)
+    assert sorted(fetched) == ["b", "c"]
+    assert [post["title"] for post in second] == ["Post c", "Post a", "Post b"]
+    assert second[1]["comments"] == first[0]["comments"]
+    assert len(second[2]["comments"]) == 4
+    assert stats["scrape_cached_posts"] == 1
+
+def test_batch_posts_respects_budget_and_order():
+    """Batches keep post order and never exceed the budget unless a post alone does"""
+    from app.core.reddit_newsletter import batch_posts
+    from app.core.prompts import estimate_tokens, format_post, ranked_comments
+
+    posts = [{"title": f"Post {i}", "url": f"https://example.com/{i}", "comments": ["x" * 200] * (i % 3 + 1)}
+             for i in range(10)]
+    posts.append({"title": "Huge", "url": "https://example.com/huge", "comments": ["y" * 5000]})
+    batches = batch_posts(posts, batch_tokens=200)
+
+    assert [post for batch in batches for post in batch] == posts
+    for batch in batches:
+        tokens = sum(estimate_tokens(format_post(post, ranked_comments(post))) for post in batch)
+        assert len(batch) == 1 or tokens <= 200
+
+def test_mapreduce_analysis_summarizes_batches_then_merges(monkeypatch):
+    """Every batch is summarized once and a single reduce call merges them"""
+    from app.core import reddit_newsletter
+
+    prompts = []
+
+    def fake_request(messages, max_tokens=1500, temperature=0.7, **kwargs):
+        prompt = messages[0]["content"]
+        prompts.append(prompt)
+        if "Merge them" in prompt:
+            return "merged report"
+        return f"summary {len(prompts)}"
+
+    monkeypatch.setattr(reddit_newsletter, "make_openrouter_request", fake_request)
+    posts = [{"title": f"Post {i}", "url": f"https://example.com/{i}", "comments": ["c" * 400] * 3}
+             for i in range(6)]
+    stats = {}
+    result = reddit_newsletter.run_analysis(posts, "test", mode="mapreduce", stats=stats)
+
+    assert result == "merged report"
+    map_calls = [p for p in prompts if "Merge them" not in p]
+    assert len(map_calls) == len(reddit_newsletter.batch_posts(posts, reddit_newsletter.analysis_batch_tokens))
+    assert sum("Merge them" in p for p in prompts) == 1
+    assert stats["analyze_mode"] == "mapreduce"
+
+def test_digest_fans_out_subreddits_under_llm_limit(monkeypatch):
+    """Subreddits are processed in parallel while OpenRouter calls respect LLM_CONCURRENCY"""
+    from app.core import reddit_newsletter
+
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+    prompts = []
+
+    class FakeResponse:
+        def __init__(self, content):
+            self.content = content
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"choices": [{"message": {"content": self.content}}]}
+
+    class FakeSession:
+        def post(self, url, json=None, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+                prompts.append(json["messages"][0]["content"])
+            time.sleep(0.1)
+            with lock:
+                active[0] -= 1
+            return FakeResponse("combined digest" if "digest" in json["messages"][0]["content"] else "analysis")
+
+    def fake_scrape(subreddit_name, stats=None):
+        time.sleep(0.2)
+        return reddit_newsletter.get_demo_data(subreddit_name)
+
+    monkeypatch.setattr(reddit_newsletter, "api_key", "test-key")
+    monkeypatch.setattr(reddit_newsletter, "get_http_session", FakeSession)
+    monkeypatch.setattr(reddit_newsletter, "llm_slots", threading.BoundedSemaphore(2))
+    monkeypatch.setattr(reddit_newsletter, "scrape_reddit", fake_scrape)
+    monkeypatch.setattr(reddit_newsletter, "analysis_mode", "single")
+
+    stats = {}
+    start = time.time()
+    result = reddit_newsletter.crew.kickoff_digest(["python", "rust", "golang", "java"], stats=stats)
+    elapsed = time.time() - start
+
+    assert result == "combined digest"
+    assert peak[0] == 2
+    # Serial would take 4 x (0.2 scrape + 0.1 analysis) + 0.1 digest = 1.3s
+    assert elapsed < 0.8
+    assert set(stats["subreddits"]) == {"python", "rust", "golang", "java"}
+    assert all(f"r/{name}" in prompts[-1] for name in ("python", "rust", "golang", "java"))
+
+def test_generate_digest_endpoint_queues_one_job():
+    """The digest endpoint validates its list and dedups repeat requests"""
+    from app.main import app, digest_jobs
+
+    client = app.test_client()
+    assert client.post('/generate-digest', json={"subreddits": []}).status_code == 400
+
+    original_runner = digest_jobs._runner
+    release = threading.Event()
+    digest_jobs._runner = lambda name, stats: release.wait(5) and {"content": name}
+    try:
+        first = client.get('/generate-digest?subreddits=r/Python,rust,python')
+        second = client.post('/generate-digest', json={"subreddits": ["python", "rust"]})
+        release.set()
+    finally:
+        digest_jobs._runner = original_runner
+
+    assert first.status_code == 202
+    assert first.get_json()["subreddits"] == ["Python", "rust"]
+    assert second.get_json()["job_id"] == first.get_json()["job_id"]
+    job = _wait_for(digest_jobs, first.get_json()["job_id"])
+    assert job["newsletter"] == {"content": "Python+rust"}
+
+def test_completion_cache_hits_and_reports_saved_latency(tmp_path, monkeypatch):
+    """Identical requests are served from the cache; use_cache=False always calls the API"""
+    from app.core import reddit_newsletter
+    from app.core.cache import CompletionCache
+    from app.core.metrics import cache_lookups
+
+    def lookups(result):
+        return cache_lookups.labels(cache="completion", result=result)._value
+
+    calls = []
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"choices": [{"message": {"content": f"answer {len(calls)}"}}]}
+
+    class FakeSession:
+        def post(self, url, **kwargs):
+            calls.append(kwargs["json"])
+            time.sleep(0.05)
+            return FakeResponse()
+
+    cache = CompletionCache(SQLiteResultStore(str(tmp_path / "llm.db")), ttl=60, max_entries=1)
+    monkeypatch.setattr(reddit_newsletter, "_llm_cache", cache)
+    monkeypatch.setattr(reddit_newsletter, "api_key", "test-key")
+    monkeypatch.setattr(reddit_newsletter, "get_http_session", FakeSession)
+    messages = [{"role": "user", "content": "hello"}]
+    hits, misses = lookups("hit"), lookups("miss")
+
+    assert reddit_newsletter.make_openrouter_request(messages) == "answer 1"
+    assert reddit_newsletter.make_openrouter_request(messages) == "answer 1"
+    assert reddit_newsletter.make_openrouter_request(messages, temperature=0.2) == "answer 2"
+    # The memory front holds one entry, so this hit is read back from SQLite
+    assert reddit_newsletter.make_openrouter_request(messages) == "answer 1"
+    assert reddit_newsletter.make_openrouter_request(messages, use_cache=False) == "answer 3"
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["hit_ratio"] == 0.5
+    assert stats["latency_saved_seconds"] >= 0.1
+    assert (lookups("hit") - hits, lookups("miss") - misses) == (2, 2)
+
+def test_sqlite_store_evicts_oldest_rows_past_size_limit(tmp_path):
+    """A size-bounded store drops its oldest writes first"""
+    store = SQLiteResultStore(str(tmp_path / "bounded.db"), max_bytes=1000)
+    for i in range(10):
+        store.put(f"k{i}", "x" * 200)
+        time.sleep(0.001)
+    store.enforce_size_limit()
+
+    assert store.get("k0") is None
+    assert store.get("k9") == "x" * 200
+    kept = [i for i in range(10) if store.get(f"k{i}") is not None]
+    assert kept == list(range(10 - len(kept), 10)) and len(kept) * 202 <= 1000
+
+def test_circuit_breaker_opens_fails_fast_and_recovers():
+    """The breaker opens after repeated failures and lets one trial through after the timeout"""
+    from app.core.resilience import CircuitBreaker, CircuitOpenError, OPEN, CLOSED
+
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.1)
+    breaker.allow()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+    time.sleep(0.15)
+    breaker.allow()  # the trial call
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # everyone else still fails fast during the trial
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+def test_retries_honor_retry_after_and_skip_permanent_errors(monkeypatch):
+    """Transient errors are retried after at least Retry-After; others are raised at once"""
+    from app.core import resilience
+
+    sleeps = []
+    monkeypatch.setattr(resilience.time, "sleep", sleeps.append)
+
+    class Transient(Exception):
+        retry_after = "2"
+
+    outcomes = [Transient(), Transient(), "ok"]
+
+    def flaky():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    result = resilience.call_with_retries(
+        flaky, attempts=3, base_delay=0.01, max_delay=5,
+        is_retryable=lambda e: isinstance(e, Transient),
+        retry_after=lambda e: resilience.parse_retry_after(e.retry_after),
+    )
+    assert result == "ok"
+    assert len(sleeps) == 2 and all(delay >= 2 for delay in sleeps)
+
+    calls = []
+
+    def permanent():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        resilience.call_with_retries(permanent, attempts=3, is_retryable=lambda e: False)
+    assert len(calls) == 1
+
+def test_hedged_call_returns_the_faster_copy():
+    """A slow first attempt is raced by a second one"""
+    from app.core.resilience import hedged_call
+
+    delays = [0.5, 0.01]
+
+    def call():
+        delay = delays.pop(0)
+        time.sleep(delay)
+        return delay
+
+    start = time.time()
+    assert hedged_call(call, hedge_after=0.05) == 0.01
+    assert time.time() - start < 0.3
+
+def test_hedged_openrouter_request_shares_its_llm_slot(monkeypatch):
+    """The hedged copy runs inside the original request's LLM_CONCURRENCY slot"""
+    from app.core import reddit_newsletter
+
+    delays = [0.5, 0.01]
+
+    class FakeResponse:
+        def __init__(self, delay):
+            self.delay = delay
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"choices": [{"message": {"content": f"after {self.delay}"}}]}
+
+    class FakeSession:
+        def post(self, url, **kwargs):
+            delay = delays.pop(0)
+            time.sleep(delay)
+            return FakeResponse(delay)
+
+    assert reddit_newsletter.openrouter_hedge_after == 0  # off unless configured
+    monkeypatch.setattr(reddit_newsletter, "api_key", "test-key")
+    monkeypatch.setattr(reddit_newsletter, "get_http_session", FakeSession)
+    monkeypatch.setattr(reddit_newsletter, "openrouter_hedge_after", 0.05)
+    monkeypatch.setattr(reddit_newsletter, "llm_slots", threading.BoundedSemaphore(1))
+
+    start = time.time()
+    assert reddit_newsletter.make_openrouter_request([{"role": "user", "content": "hi"}], use_cache=False) == "after 0.01"
+    assert time.time() - start < 0.3  # the copy did not wait for a second slot
+    assert reddit_newsletter.llm_slots.acquire(blocking=False)
+
+def test_openrouter_falls_back_through_model_chain(monkeypatch):
+    """A failing model is retried, then the next model in the chain answers"""
+    import requests
+    from app.core import reddit_newsletter
+    from app.core.resilience import CircuitBreaker
+
+    models = []
+
+    class FakeResponse:
+        def __init__(self, model):
+            self.model = model
+            self.status_code = 503 if model == "primary" else 200
+            self.headers = {}
+
+        def raise_for_status(self):
+            if self.status_code >= 400:
+                raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+        def json(self):
+            return {"choices": [{"message": {"content": f"from {self.model}"}}]}
+
+    class FakeSession:
+        def post(self, url, json=None, **kwargs):
+            models.append(json["model"])
+            return FakeResponse(json["model"])
+
+    monkeypatch.setattr(reddit_newsletter, "api_key", "test-key")
+    monkeypatch.setattr(reddit_newsletter, "get_http_session", FakeSession)
+    monkeypatch.setattr(reddit_newsletter, "model_name", "primary")
+    monkeypatch.setattr(reddit_newsletter, "fallback_models", ["backup"])
+    monkeypatch.setattr(reddit_newsletter, "retry_base_delay", 0.001)
+    monkeypatch.setattr(reddit_newsletter, "openrouter_breaker", CircuitBreaker("test", failure_threshold=10))
+
+    assert reddit_newsletter.make_openrouter_request([{"role": "user", "content": "hi"}]) == "from backup"
+    assert models == ["primary"] * reddit_newsletter.openrouter_attempts + ["backup"]
+
+def test_completion_cache_keys_fallback_answers_and_skips_reads_on_refresh(tmp_path, monkeypatch):
+    """Fallback answers are cached under the model that gave them; refreshes ignore cached answers"""
+    import requests
+    from app.core import reddit_newsletter
+    from app.core.cache import CompletionCache, completion_key
+    from app.core.resilience import CircuitBreaker
+
+    models = []
+
+    class FakeResponse:
+        def __init__(self, model):
+            self.model = model
+            self.status_code = 503 if model == "primary" else 200
+            self.headers = {}
+
+        def raise_for_status(self):
+            if self.status_code >= 400:
+                raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+        def json(self):
+            return {"choices": [{"message": {"content": f"from {self.model} #{len(models)}"}}]}
+
+    class FakeSession:
+        def post(self, url, json=None, **kwargs):
+            models.append(json["model"])
+            return FakeResponse(json["model"])
+
+    cache = CompletionCache(SQLiteResultStore(str(tmp_path / "llm.db")), ttl=60, max_entries=8)
+    monkeypatch.setattr(reddit_newsletter, "_llm_cache", cache)
+    monkeypatch.setattr(reddit_newsletter, "api_key", "test-key")
+    monkeypatch.setattr(reddit_newsletter, "get_http_session", FakeSession)
+    monkeypatch.setattr(reddit_newsletter, "model_name", "primary")
+    monkeypatch.setattr(reddit_newsletter, "fallback_models", ["backup"])
+    monkeypatch.setattr(reddit_newsletter, "openrouter_attempts", 1)
+    monkeypatch.setattr(reddit_newsletter, "openrouter_breaker", CircuitBreaker("test", failure_threshold=10))
+    messages = [{"role": "user", "content": "hi"}]
+
+    assert reddit_newsletter.make_openrouter_request(messages) == "from backup #2"
+    assert cache.get(completion_key("backup", messages, 1500, 0.7)) == "from backup #2"
+    # The primary model is asked again rather than served the backup's answer
+    assert reddit_newsletter.make_openrouter_request(messages) == "from backup #4"
+    assert models == ["primary", "backup", "primary", "backup"]
+
+    monkeypatch.setattr(reddit_newsletter, "model_name", "backup")
+    assert reddit_newsletter.make_openrouter_request(messages) == "from backup #4"
+    with reddit_newsletter.fresh_completions():
+        assert reddit_newsletter.make_openrouter_request(messages) == "from backup #5"
+    assert reddit_newsletter.make_openrouter_request(messages) == "from backup #5"
+
+def test_refresh_jobs_expose_the_flag_to_their_runner():
+    """A job submitted as a refresh lets its runner skip cached completions"""
+    from app.core.jobs import current_job
+
+    seen = []
+    manager = JobManager(lambda name, stats: seen.append(current_job()["refresh"]), MemoryResultStore())
+    for name, refresh in (("plain", False), ("forced", True)):
+        job, _ = manager.submit(name, refresh=refresh)
+        _wait_for(manager, job["id"])
+    assert seen == [False, True]
+    assert current_job() is None
+
+def test_histogram_renders_cumulative_prometheus_buckets():
+    """Histograms render cumulative buckets, sum and count per label set"""
+    from app.core.metrics import Histogram, _registry
+
+    histogram = Histogram("test_latency_seconds", "Test latency", ["stage"], buckets=(0.1, 1))
+    _registry.remove(histogram)  # keep it out of /metrics
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.labels(stage="scrape").observe(value)
+
+    lines = histogram.render()
+    assert lines[:2] == ["# HELP test_latency_seconds Test latency", "# TYPE test_latency_seconds histogram"]
+    assert 'test_latency_seconds_bucket{stage="scrape",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{stage="scrape",le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{stage="scrape",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{stage="scrape"} 4' in lines
+    assert 'test_latency_seconds_sum{stage="scrape"} 4.25' in lines
+
+def test_metrics_endpoint_reports_pipeline_stages(monkeypatch):
+    """A pipeline run shows up in /metrics as stage timings and estimated LLM sizes"""
+    from app.core import reddit_newsletter
+    from app.main import app
+
+    def fake_request(messages, max_tokens=1500, temperature=0.7, call="completion", **kwargs):
+        reddit_newsletter.record_llm_call(call, messages, "some generated text", 0.2)
+        return "some generated text"
+
+    monkeypatch.setattr(reddit_newsletter, "make_openrouter_request", fake_request)
+    monkeypatch.setattr(reddit_newsletter, "scrape_reddit",
+                        lambda name, stats=None: reddit_newsletter.get_demo_data(name))
+    reddit_newsletter.crew.kickoff("python")
+
+    response = app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    body = response.get_data(as_text=True)
+    for stage in ("analyze", "create", "pipeline"):
+        assert f'newsletter_stage_seconds_count{{stage="{stage}"}}' in body
+    assert 'newsletter_llm_request_seconds_bucket{call="analyze",le="0.25"}' in body
+    assert 'newsletter_llm_tokens_total{direction="prompt"}' in body
+    assert 'newsletter_job_queue_depth{queue="newsletter"} 0' in body
+
+def test_render_newsletter_html_structures_and_sanitizes():
+    """Server-side rendering builds headings, lists and links without passing markup through"""
+    import re
+    from app.core.render import render_newsletter_html
+
+    html = render_newsletter_html(
+        "# Weekly\n\n## [Top post](https://reddit.com/r/python/1?a=1&b=2)\n"
+        "- **Bold** point\n- see https://example.com/x\n\nClosing line"
+    )
+    assert "<h1>Weekly</h1>" in html
+    assert '<h2><a href="https://reddit.com/r/python/1?a=1&amp;b=2" target="_blank" rel="noopener noreferrer">Top post</a></h2>' in html
+    assert "<ul><li><strong>Bold</strong> point</li><li>see <a href=\"https://example.com/x\"" in html
+    assert "<p>Closing line</p>" in html
+
+    for vector in ('Check out [this link](javascript:alert("xss"))',
+                   'Visit <script>alert("xss")</script>',
+                   '[Link](data:text/html,<script>alert("xss")</script>)',
+                   '[x](https://a.com/"onmouseover="alert(1))'):
+        rendered = render_newsletter_html(vector)
+        assert "<script" not in rendered
+        assert not re.search(r'href="(?!https?://)', rendered)  # only http(s) links become anchors
+        assert '"onmouseover' not in rendered
+
+def test_result_endpoints_answer_repeat_polls_with_304(monkeypatch):
+    """Job status carries an ETag and an unchanged job is not sent again"""
+    from app import main
+
+    monkeypatch.setattr(main.jobs, "_runner", lambda name, stats: main.build_newsletter_record(name, "## Done", 0.1))
+    job, _ = main.jobs.submit("etagtest")
+    _wait_for(main.jobs, job["id"])
+
+    client = main.app.test_client()
+    first = client.get(f"/jobs/{job['id']}")
+    assert first.status_code == 200
+    assert first.get_json()["newsletter"]["html"] == "<h2>Done</h2>"
+    etag = first.headers["ETag"]
+
+    repeat = client.get(f"/jobs/{job['id']}", headers={"If-None-Match": etag})
+    assert repeat.status_code == 304
+    assert repeat.get_data() == b""
+    assert client.get(f"/jobs/{job['id']}", headers={"If-None-Match": '"other"'}).status_code == 200
+
+def test_newsletter_status_long_poll_waits_for_the_next_version(monkeypatch):
+    """?since= holds the request until the job changes; an unchanged timeout is a 304"""
+    from app import main
+
+    release = threading.Event()
+
+    def runner(name, stats):
+        release.wait(5)
+        return main.build_newsletter_record(name, "done", 0.1)
+
+    monkeypatch.setattr(main.jobs, "_runner", runner)
+    job, _ = main.jobs.submit("longpolltest")
+    client = main.app.test_client()
+    url = f"/newsletter-status?job_id={job['id']}"
+
+    deadline = time.time() + 5
+    while client.get(url).get_json()["status"] != "processing" and time.time() < deadline:
+        time.sleep(0.01)
+    current = client.get(url)
+    version = current.get_json()["version"]
+
+    start = time.time()
+    unchanged = client.get(f"{url}&since={version}&timeout=0.2", headers={"If-None-Match": current.headers["ETag"]})
+    assert unchanged.status_code == 304
+    assert time.time() - start >= 0.2
+
+    threading.Timer(0.1, release.set).start()
+    start = time.time()
+    changed = client.get(f"{url}&since={version}&timeout=5")
+    assert changed.status_code == 200
+    assert changed.get_json()["status"] == "completed"
+    assert changed.get_json()["version"] > version
+    assert time.time() - start < 2  # woken by the job, not by the timeout
+
+def test_change_notifier_reads_outside_its_lock():
+    """A slow fetch() must not block notify() or other waiters"""
+    from app.core.changes import ChangeNotifier
+
+    notifier = ChangeNotifier(poll_interval=5)
+    reading = threading.Event()
+    release = threading.Event()
+    version = [1]
+
+    def slow_fetch():
+        reading.set()
+        release.wait(5)
+        return {"version": version[0]}
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(notifier.wait_for_change(slow_fetch, 1, 5)))
+    waiter.start()
+    assert reading.wait(5)
+    start = time.time()
+    version[0] = 2
+    notifier.notify()  # lands while the waiter is still reading
+    assert time.time() - start < 0.5
+    release.set()
+    waiter.join(5)
+    assert results == [{"version": 2}]
+
+def test_newsletter_status_answers_at_once_when_long_polls_are_capped(monkeypatch):
+    """Past STATUS_LONG_POLL_MAX waiting requests, status is returned immediately with Retry-After"""
+    from app import main
+
+    monkeypatch.setattr(main, "long_poll_slots", threading.BoundedSemaphore(1))
+    client = main.app.test_client()
+    current = client.get('/newsletter-status').get_json()
+
+    assert main.long_poll_slots.acquire(blocking=False)  # another request is waiting
+    try:
+        start = time.time()
+        busy = client.get(f"/newsletter-status?since={current['version']}&timeout=5")
+        assert time.time() - start < 1
+        assert busy.status_code == 200
+        assert busy.headers["Retry-After"] == "1"
+    finally:
+        main.long_poll_slots.release()
+
+    held = client.get(f"/newsletter-status?since={current['version']}&timeout=0.2")
+    assert "Retry-After" not in held.headers
+
+def test_large_responses_are_compressed_and_revalidate(monkeypatch):
+    """Big JSON is gzipped with a weak ETag that still yields 304s; small bodies are left alone"""
+    import gzip
+    import json
+    from app import main
+
+    monkeypatch.setattr(main.jobs, "_runner",
+                        lambda name, stats: main.build_newsletter_record(name, "- point\n" * 500, 0.1))
+    job, _ = main.jobs.submit("compresstest")
+    _wait_for(main.jobs, job["id"])
+    client = main.app.test_client()
+
+    response = client.get(f"/jobs/{job['id']}", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.data))["status"] == "completed"
+    assert response.headers["ETag"].startswith('W/"')
+    repeat = client.get(f"/jobs/{job['id']}",
+                        headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+    assert repeat.status_code == 304
+
+    assert "Content-Encoding" not in client.get("/health", headers={"Accept-Encoding": "gzip"}).headers
+
+def test_pages_are_prerendered_with_fingerprinted_assets():
+    """Predefined subreddit pages come from the page cache and link assets that can be cached forever"""
+    import re
+    from app import main
+    from config import config
+
+    main.prerender_pages()
+    subreddit_name = config.predefined_subreddits[0]
+    assert f"newsletter:{subreddit_name.lower()}" in main.rendered_pages
+
+    client = main.app.test_client()
+    page = client.get(f"/newsletter-ui?subreddit={subreddit_name.lower()}").get_data(as_text=True)
+    assert f"r/{subreddit_name} content" in page
+    asset_url = re.search(r'<link rel="stylesheet" href="([^"]+)"', page).group(1)
+    assert "?v=" in asset_url
+
+    asset = client.get(asset_url)
+    assert asset.status_code == 200
+    assert asset.cache_control.immutable
+    assert asset.cache_control.max_age == config.STATIC_MAX_AGE
+    assert not client.get("/static/css/newsletter.css?v=outdated").cache_control.immutable
+
+    custom = client.get("/newsletter-ui?subreddit=<b>x</b>").get_data(as_text=True)
+    assert "<b>x</b>" not in custom  # user input is escaped by the template
+
+def test_overlapped_analysis_summarizes_while_scraping(monkeypatch):
+    """Batches are summarized as posts arrive and the posts come back in listing order"""
+    from app.core import reddit_newsletter
+
+    events = []
+
+    def slow_posts():
+        for position in (2, 0, 1, 3):
+            time.sleep(0.05)
+            events.append(("scraped", position))
+            yield position, {"title": f"Post {position}", "url": f"https://example.com/{position}",
+                             "comments": ["word " * 40]}
+
+    def fake_summarize(batch, subreddit_name):
+        events.append(("summarize", batch[0]["title"]))
+        return f"summary of {len(batch)}"
+
+    monkeypatch.setattr(reddit_newsletter, "_summarize_batch", fake_summarize)
+    monkeypatch.setattr(reddit_newsletter, "make_openrouter_request", lambda messages, **kwargs: "merged")
+    stats = {}
+    scraped, analysis = reddit_newsletter.analyze_content_overlapped(slow_posts(), "test", batch_tokens=60, stats=stats)
+
+    assert analysis == "merged"
+    assert [post["title"] for post in scraped] == ["Post 0", "Post 1", "Post 2", "Post 3"]
+    assert stats["analyze_batches"] == 4
+    # The first batch was handed to the model before the last post was scraped
+    assert events.index(("summarize", "Post 2")) < events.index(("scraped", 3))
+
+def test_overlapped_mode_falls_back_to_demo_data(monkeypatch):
+    """A scrape that fails before any post arrives still produces a newsletter input"""
+    from app.core import reddit_newsletter
+
+    def failing_scrape(*args, **kwargs):
+        raise RuntimeError("reddit is down")
+        yield
+
+    monkeypatch.setattr(reddit_newsletter, "analysis_mode", "overlapped")
+    monkeypatch.setattr(reddit_newsletter, "iter_scrape_reddit", failing_scrape)
+    monkeypatch.setattr(reddit_newsletter, "make_openrouter_request", lambda messages, **kwargs: "analysis")
+    stats = {}
+    scraped, analysis = reddit_newsletter.scrape_and_analyze("python", stats=stats)
+    assert [post["title"] for post in scraped] == [post["title"] for post in reddit_newsletter.get_demo_data("python")]
+    assert analysis == "analysis"
+    assert stats["analyze_mode"] == "overlapped"
+
+def test_comment_dedup_keeps_best_copy_and_reports_savings(monkeypatch):
+    """Near-duplicates across posts and content-free comments are dropped before prompting"""
+    from app.core import dedup
+
+    posts = [
+        {"title": "A", "url": "https://example.com/a",
+         "comments": ["This!", "https://example.com/link",
+                      "The new release makes async generators much faster in tight loops",
+                      "the new release makes async generators much faster in tight loops!!",
+                      "Packaging is still confusing for beginners coming from other languages"],
+         "comment_scores": [100, 5, 10, 30, 2]},
+        {"title": "B", "url": "https://example.com/b",
+         "comments": ["The new release makes async generators much faster in tight loops, agreed",
+                      "Type hints caught three real bugs in our codebase last month"]},
+    ]
+    stats = {}
+    condensed = dedup.condense_comments(posts, stats=stats)
+    assert condensed[0]["comments"] == [
+        "the new release makes async generators much faster in tight loops!!",
+        "Packaging is still confusing for beginners coming from other languages",
+    ]
+    assert condensed[0]["comment_scores"] == [30, 2]
+    assert condensed[1]["comments"] == ["Type hints caught three real bugs in our codebase last month"]
+    assert stats["dedup_low_information_removed"] == 2
+    assert stats["dedup_duplicates_removed"] == 2
+    assert stats["dedup_comments_kept"] == 3
+    assert stats["dedup_tokens_saved"] > 0
+    assert posts[0]["comments"][0] == "This!"  # input is not modified
+
+    streamed = list(dedup.condense_comment_stream(enumerate(posts)))
+    assert [post["comments"] for _, post in streamed] == [post["comments"] for post in condensed]
+
+    monkeypatch.setattr(dedup, "comment_dedup", False)
+    assert dedup.condense_comments(posts) is posts
+
+def test_estimate_tokens_is_close_to_word_count():
+    """The local estimator should be in the right range for English text"""
+    from app.core.prompts import estimate_tokens
+
+    text = "The quick brown fox jumps over the lazy dog, again and again."
+    assert 12 <= estimate_tokens(text) <= 18
+    assert estimate_tokens("") == 0
+
+def test_content_summary_ranks_dedups_and_fits_budget():
+    """Highest-scored distinct comments are kept first and the budget holds"""
+    from app.core.prompts import build_content_summary, estimate_tokens
+
+    posts = [
+        {"title": "A", "url": "https://example.com/a",
+         "comments": ["meh", "Great insight about quantization", "great  insight about QUANTIZATION", "long " * 400],
+         "comment_scores": [1, 50, 40, 10]},
+        {"title": "B", "url": "https://example.com/b", "comments": ["only comment"]},
+    ]
+    summary = build_content_summary(posts, budget=10_000, comments_per_post=2)
+    first_post = summary.split("\n\n")[0]
+    assert first_post.index("Great insight") < first_post.index("long")
+    assert first_post.lower().count("great insight") == 1
+    assert "meh" not in first_post  # lowest-scored distinct comment is past the per-post limit
+
+    tight = build_content_summary(posts, budget=30)
+    assert estimate_tokens(tight) <= 40
+    assert "Title: A" in tight and "Title: B" in tight
+
+def test_scheduler_bounds_concurrency_and_takes_lock(tmp_path):
+    """A cycle covers every subreddit without exceeding the concurrency limit"""
+    from app.core.scheduler import PregenerationScheduler
+
+    active, peak, done = [0], [0], []
+    lock = threading.Lock()
+
+    def generate(name):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+            done.append(name)
+
+    lock_path = str(tmp_path / "scheduler.lock")
+    leader = PregenerationScheduler(["a", "b", "c", "d", "e"], generate, concurrency=2, jitter=0, lock_path=lock_path)
+    follower = PregenerationScheduler(["a"], generate, jitter=0, lock_path=lock_path)
+
+    assert leader.run_once() == 5
+    assert sorted(done) == ["a", "b", "c", "d", "e"]
+    assert peak[0] <= 2
+    assert leader._acquire_leadership() is True
+    assert follower._acquire_leadership() is False
+
+def test_scheduler_interval_counts_from_cycle_start():
+    """A slow cycle shortens the wait before the next one instead of adding to the interval"""
+    from app.core.scheduler import PregenerationScheduler
+
+    starts = []
+
+    def generate(name):
+        starts.append(time.monotonic())
+        time.sleep(0.2)
+        if len(starts) == 3:
+            scheduler.stop()
+
+    scheduler = PregenerationScheduler(["a"], generate, interval=0.3, jitter=0)
+    runner = threading.Thread(target=scheduler.run_forever)
+    runner.start()
+    runner.join(5)
+
+    assert len(starts) == 3
+    # Counting from the end of each cycle would space them 0.5s apart
+    assert all(0.25 < later - earlier < 0.45 for earlier, later in zip(starts, starts[1:]))
+
+def _next_line(subscriber, timeout=5):
+    return subscriber.queue.get(timeout=timeout)
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_log_broadcaster_fans_out_filters_and_resumes(tmp_path, use_inotify):
+    """One tailer feeds all subscribers, filters by job id and replays after Last-Event-ID"""
+    from app.core.logstream import LogBroadcaster
+
+    job_line = "2024-01-01 00:00:00,000 - jobs - INFO - [job=job-42 subreddit=python] Job job-42 started"
+    other_line = "2024-01-01 00:00:00,001 - app - INFO - [job=- subreddit=-] mentions job-42 in passing"
+    log_path = tmp_path / "app.log"
+    log_path.write_text("old line\n")
+    broadcaster = LogBroadcaster(str(log_path), use_inotify=use_inotify)
+    everything = broadcaster.subscribe()
+    only_job = broadcaster.subscribe(job_id="job-42")
+    only_subreddit = broadcaster.subscribe(subreddit="Python")
+    time.sleep(0.2)
+
+    with open(log_path, "a") as handle:
+        handle.write(job_line + "\n")
+        handle.flush()
+        handle.write(other_line + "\n")
+
+    first_id, first = _next_line(everything)
+    assert first == job_line
+    assert _next_line(everything)[1] == other_line
+    assert _next_line(only_job)[1] == job_line
+    assert _next_line(only_subreddit)[1] == job_line
+    time.sleep(0.1)
+    assert only_job.queue.empty()  # filtering uses the structured field, not a substring match
+
+    resumed = broadcaster.subscribe(last_event_id=first_id)
+    assert resumed.queue.get_nowait()[1] == other_line
+
+def test_log_broadcaster_drops_slow_subscribers(tmp_path):
+    """A full subscriber queue drops that client without affecting others"""
+    from app.core.logstream import LogBroadcaster
+
+    log_path = tmp_path / "app.log"
+    log_path.write_text("")
+    broadcaster = LogBroadcaster(str(log_path), max_queue=2)
+    slow = broadcaster.subscribe()
+    time.sleep(0.2)
+    fast = broadcaster.subscribe()
+    fast.queue = queue.Queue()  # unbounded reader that keeps up
+
+    with open(log_path, "a") as handle:
+        handle.write("".join(f"line {i}\n" for i in range(5)))
+
+    assert [_next_line(fast)[1] for _ in range(5)] == [f"line {i}" for i in range(5)]
+    assert slow.dropped is True
+
+def test_sync_log_streams_are_capped_with_retry_after(monkeypatch):
+    """Past LOG_STREAM_MAX_CLIENTS open /logs streams, clients get a 503 until one closes"""
+    from app import main
+
+    monkeypatch.setattr(main, "log_stream_slots", threading.BoundedSemaphore(1))
+    client = main.app.test_client()
+
+    first = client.get('/logs')
+    assert first.status_code == 200
+    refused = client.get('/logs')
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == str(main.config.LOG_STREAM_RETRY_AFTER)
+
+    first.close()  # also frees a stream whose generator never started
+    again = client.get('/logs')
+    assert again.status_code == 200
+    again.close()
+    assert main.log_stream_slots.acquire(blocking=False)
+    main.log_stream_slots.release()
+
+def test_sync_newsletter_streams_are_capped_with_retry_after(monkeypatch):
+    """Past STREAM_MAX_CLIENTS open newsletter streams, clients get a 503 until one closes"""
+    from app import main
+
+    monkeypatch.setattr(main, "stream_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(main.newsletter_cache, "get", lambda subreddit: ({"content": "# Cached"}, "fresh"))
+    client = main.app.test_client()
+
+    first = client.get('/generate-newsletter/stream?subreddit=streamcap')
+    assert first.status_code == 200
+    refused = client.get('/generate-newsletter/stream?subreddit=streamcap')
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == str(main.config.STREAM_RETRY_AFTER)
+
+    first.close()
+    again = client.get('/generate-newsletter/stream?subreddit=streamcap')
+    assert again.status_code == 200
+    again.close()
+    assert main.stream_slots.acquire(blocking=False)
+    main.stream_slots.release()
+
+def test_pipeline_publishes_failed_event_when_publishing_fails(monkeypatch):
+    """A newsletter that cannot be saved still ends its streams, with a failed event"""
+    from app import main
+
+    def fake_stream(subreddit_name, stats=None):
+        yield "done", "# Unsaved"
+
+    def broken_publish(subreddit_name, newsletter, stats=None):
+        raise RuntimeError("store is down")
+
+    monkeypatch.setattr(main.crew, "kickoff_stream", fake_stream)
+    monkeypatch.setattr(main, "publish_newsletter", broken_publish)
+
+    job, _ = main.jobs.submit("publishfails")
+    events = list(main.job_streams.follow(job["id"], poll_interval=5))
+    assert events[-1][0] == "failed"
+    assert "store is down" in events[-1][1]
+    assert _wait_for(main.jobs, job["id"])["status"] == "error"
+
+def test_queue_logging_tags_job_lines_and_rotates(tmp_path):
+    """Records are written by the listener thread with job fields, and the file rotates by size"""
+    import logging
+    from app.core import logsetup
+
+    log_path = tmp_path / "app.log"
+    handler = logsetup.RotatingLogHandler(str(log_path), max_bytes=300, backup_count=5)
+    handler.setFormatter(logging.Formatter(logsetup.LOG_FORMAT))
+    log_queue = queue.Queue()
+    queue_handler = logsetup.NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(logsetup.JobContextFilter())
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    test_logger = logging.getLogger("test_queue_logging")
+    test_logger.propagate = False
+    test_logger.addHandler(queue_handler)
+    listener.start()
+    try:
+        with logsetup.job_context("job-7", "Local LLaMA"):
+            test_logger.warning("inside the job")
+        test_logger.warning("outside %s", "any job")
+        for i in range(5):
+            test_logger.warning("filler line %d", i)
+    finally:
+        listener.stop()
+        handler.close()
+        test_logger.removeHandler(queue_handler)
+
+    files = sorted(tmp_path.glob("app.log*"), reverse=True)  # oldest backup first
+    assert len(files) > 1
+    lines = [line for path in files for line in path.read_text().splitlines()]
+    assert len(lines) == 7
+    assert logsetup.line_fields(lines[0]) == ("job-7", "Local_LLaMA")
+    assert lines[0].endswith("inside the job")
+    assert logsetup.line_fields(lines[1]) == (None, None)
+    assert logsetup.line_fields("a line without fields") == (None, None)
+
+    full = logsetup.NonBlockingQueueHandler(queue.Queue(maxsize=1))
+    full.handle(logging.makeLogRecord({"msg": "kept"}))
+    full.handle(logging.makeLogRecord({"msg": "dropped"}))
+    assert full.dropped == 1
+
+def test_sqlite_connections_open_lazily_and_per_process(tmp_path, monkeypatch):
+    """Nothing is opened before first use (a preloading master), and a new pid gets a new connection"""
+    from app.core.archive import NewsletterArchive
+
+    store = SQLiteResultStore(str(tmp_path / "state.db"))
+    archive = NewsletterArchive(str(tmp_path / "archive.db"))
+    assert getattr(store._local, "conn", None) is None
+    assert getattr(archive._local, "conn", None) is None
+
+    store.put("key", {"value": 1})
+    assert archive.count() == 0
+    parent = (store._connection(), archive._connection())
+
+    pid = os.getpid()
+    monkeypatch.setattr(os, "getpid", lambda: pid + 1)  # as seen by a forked worker
+    child = (store._connection(), archive._connection())
+    assert child[0] is not parent[0] and child[1] is not parent[1]
+    assert store._local.pid == archive._local.pid == pid + 1
+    assert store.get("key") == {"value": 1}
+    assert archive.count() == 0
+
+def test_app_import_defers_client_libraries_until_preload():
+    """Workers boot without praw, requests or asyncio; preloading imports them up front"""
+    import subprocess
+
+    code = ("import sys, app.main; heavy = ('praw', 'requests', 'asyncio'); "
+            "print(sorted(m for m in heavy if m in sys.modules)); "
+            "app.main.import_heavy_modules(); print(sorted(m for m in heavy if m in sys.modules))")
+    env = dict(os.environ, RESULT_STORE_URL="memory://", PREGEN_INTERVAL="0")
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.dirname(__file__)),
+                            env=env, capture_output=True, text=True, timeout=60, check=True)
+    before, after = result.stdout.strip().splitlines()[-2:]
+    assert before == "[]"
+    assert "'praw'" in after and "'requests'" in after
+
+    from app.core.startup import process_age
+    age = process_age()
+    assert age is None or age >= 0
+
+def test_newsletter_archive_pages_history_and_searches(tmp_path, monkeypatch):
+    """Archived newsletters are paged newest first and found by full-text search"""
+    from app import main
+    from app.core.archive import NewsletterArchive, match_query
+
+    archive = NewsletterArchive(str(tmp_path / "archive.db"))
+    monkeypatch.setattr(main, "archive", archive)
+    for i, (subreddit, topic) in enumerate([("LocalLLaMA", "quantization"), ("python", "packaging"),
+                                            ("LocalLLaMA", "quantized GGUF models"), ("rust", "async")]):
+        newsletter = main.build_newsletter_record(subreddit, f"# Digest {i}\n- Talk about {topic} this week", 1.5)
+        main.archive_newsletter(newsletter, {"source_urls": [f"https://reddit.com/{i}"]})
+        assert newsletter["archive_id"] == i + 1
+
+    client = main.app.test_client()
+    first = client.get('/archive?limit=3').get_json()
+    assert [item["id"] for item in first["newsletters"]] == [4, 3, 2]
+    second = client.get(f'/archive?limit=3&before={first["next_before"]}').get_json()
+    assert [item["id"] for item in second["newsletters"]] == [1]
+    assert second["next_before"] is None
+    assert second["newsletters"][0]["source_urls"] == ["https://reddit.com/0"]
+    assert second["newsletters"][0]["processing_time"] == "1.50s"
+    only_llama = client.get('/archive?subreddit=r/localllama').get_json()["newsletters"]
+    assert [item["id"] for item in only_llama] == [3, 1]
+
+    # Stemming and a prefix on the last word match both quantization posts
+    found = client.get('/archive/search?q=quantize').get_json()
+    assert sorted(item["id"] for item in found["results"]) == [1, 3]
+    assert "**" in found["results"][0]["snippet"]
+    assert client.get('/archive/search?q=packaging&subreddit=rust').get_json()["results"] == []
+    assert client.get('/archive/search?q=" OR NEAR(').get_json()["results"] == []  # operators are quoted
+    assert client.get('/archive/search').status_code == 400
+    assert match_query("Rust's async!") == '"Rust" "s" "async"*'
+
+    full = client.get('/archive/2')
+    assert full.get_json()["newsletter"]["content"].startswith("# Digest 1")
+    assert client.get('/archive/2', headers={"If-None-Match": full.headers["ETag"]}).status_code == 304
+    assert client.get('/archive/99').status_code == 404
+
+def test_stream_requests_share_one_job_and_its_draft(monkeypatch):
+    """Concurrent streams for a subreddit run the pipeline once and all receive its chunks"""
+    import json
+    from app import main
+
+    release = threading.Event()
+    runs = []
+
+    def fake_stream(subreddit_name, stats=None):
+        runs.append(subreddit_name)
+        yield "status", "Writing newsletter..."
+        release.wait(5)
+        yield "chunk", "## Shared"
+        yield "done", "## Shared"
+
+    monkeypatch.setattr(main.crew, "kickoff_stream", fake_stream)
+    monkeypatch.setattr(main, "archive", None)
+
+    def stream(results):
+        body = main.app.test_client().get('/generate-newsletter/stream?subreddit=streamshare').get_data(as_text=True)
+        results.append([block.split("\n") for block in body.strip().split("\n\n")])
+
+    results = []
+    first = threading.Thread(target=stream, args=(results,))
+    first.start()
+    deadline = time.time() + 5
+    while not runs and time.time() < deadline:
+        time.sleep(0.01)
+    second = threading.Thread(target=stream, args=(results,))
+    second.start()
+    time.sleep(0.2)
+    release.set()
+    first.join(5)
+    second.join(5)
+
+    assert runs == ["streamshare"]
+    assert len(results) == 2
+    for events in results:
+        names = [lines[0] for lines in events if lines[0].startswith("event:")]
+        assert names[-2:] == ["event: chunk", "event: done"]
+        assert json.loads(events[-1][1][len("data: "):])["newsletter"]["html"] == "<h2>Shared</h2>"
+
+def _call_asgi(application, path, query_string=b""):
+    """Drive one HTTP request through an ASGI app; returns ``(status, body)``"""
+    import asyncio
+
+    sent = []
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query_string,
+             "headers": [], "server": ("testserver", 80), "client": ("127.0.0.1", 1)}
+
+    async def run():
+        requests = iter([{"type": "http.request", "body": b"", "more_body": False}])
+
+        async def receive():
+            try:
+                return next(requests)
+            except StopIteration:
+                await asyncio.sleep(60)  # the client never disconnects
+
+        async def send(message):
+            sent.append(message)
+
+        await application(scope, receive, send)
+
+    asyncio.run(run())
+    body = b"".join(message.get("body", b"") for message in sent if message["type"] == "http.response.body")
+    return sent[0]["status"], body.decode()
+
+def test_asgi_streams_async_pipeline_and_bridges_flask_routes(monkeypatch):
+    """The ASGI app streams from the async pipeline and hands other paths to Flask"""
+    import json
+    from app import asgi
+    from app.core import async_pipeline
+
+    async def fake_stream(self, subreddit_name="LocalLLaMA", stats=None):
+        yield "status", f"Scraping r/{subreddit_name}"
+        yield "chunk", "# Hello"
+        yield "done", "# Hello"
+
+    published = []
+    monkeypatch.setattr(async_pipeline.AsyncNewsletter, "kickoff_stream", fake_stream)
+    monkeypatch.setattr(asgi, "publish_newsletter", lambda subreddit, newsletter, stats=None: published.append(subreddit))
+
+    status, body = _call_asgi(asgi.application, "/generate-newsletter/stream", b"subreddit=r/python")
+    assert status == 200
+    events = [block.split("\n") for block in body.strip().split("\n\n")]
+    assert [lines[0] for lines in events] == ["event: status", "event: status", "event: chunk", "event: done"]
+    assert json.loads(events[3][1][len("data: "):])["newsletter"]["content"] == "# Hello"
+    assert published == ["python"]
+
+    status, body = _call_asgi(asgi.application, "/health")
+    assert status == 200
+    assert json.loads(body)["status"] == "healthy"
+
+def test_asgi_concurrent_streams_share_one_job(monkeypatch):
+    """Two ASGI streams for one subreddit run the pipeline once, through the job manager"""
+    import asyncio
+    from app import asgi
+    from app.core import async_pipeline
+
+    runs = []
+
+    async def fake_stream(self, subreddit_name="LocalLLaMA", stats=None):
+        runs.append(subreddit_name)
+        yield "status", f"Scraping r/{subreddit_name}"
+        await asyncio.sleep(0.3)
+        yield "done", "# Shared"
+
+    monkeypatch.setattr(async_pipeline.AsyncNewsletter, "kickoff_stream", fake_stream)
+    monkeypatch.setattr(asgi, "publish_newsletter", lambda subreddit, newsletter, stats=None: None)
+
+    async def stream():
+        return [event async for event in asgi.newsletter_stream_events("asgishared", True)]
+
+    async def both():
+        return await asyncio.gather(stream(), stream())
+
+    for events in asyncio.run(both()):
+        assert events[-1].startswith("event: done")
+        assert "# Shared" in events[-1]
+    assert runs == ["asgishared"]
+    assert asgi.jobs.find("asgishared") is None
+
+def test_asgi_event_stream_closes_generator_on_disconnect():
+    """A client leaving mid-stream cancels the pump and still closes the upstream generator"""
+    import asyncio
+    from app import asgi
+
+    closed = []
+
+    async def events():
+        try:
+            yield "data: first\n\n"
+            await asyncio.sleep(60)  # waiting on upstream when the client leaves
+            yield "data: never\n\n"
+        finally:
+            closed.append(True)
+
+    async def run():
+        messages = asyncio.Queue()
+        await messages.put({"type": "http.request", "body": b"", "more_body": False})
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+            if message.get("body") == b"data: first\n\n":
+                await messages.put({"type": "http.disconnect"})
+
+        await asyncio.wait_for(asgi.send_event_stream(messages.get, send, events()), timeout=5)
+        return sent
+
+    sent = asyncio.run(run())
+    assert [message.get("body") for message in sent[1:]] == [b"data: first\n\n"]
+    assert closed == [True]
+
+def test_async_openrouter_requests_share_the_llm_concurrency_limit(monkeypatch):
+    """Async completions and streams wait for one of LLM_CONCURRENCY slots on their event loop"""
+    import asyncio
+    from app.core import async_pipeline, reddit_newsletter
+
+    active = []
+    peak = []
+
+    class FakeResponse:
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {"choices": [{"message": {"content": "done"}}]}
+
+        async def aiter_lines(self):
+            yield 'data: {"choices": [{"delta": {"content": "done"}}]}'
+            yield "data: [DONE]"
+
+        async def aclose(self):
+            active.pop()
+
+    class FakeClient:
+        async def post(self, url, **kwargs):
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.05)
+            active.pop()
+            return FakeResponse()
+
+        def build_request(self, method, url, **kwargs):
+            return None
+
+        async def send(self, request, stream=False):
+            active.append(1)
+            peak.append(len(active))
+            await asyncio.sleep(0.05)
+            return FakeResponse()
+
+    monkeypatch.setattr(reddit_newsletter, "api_key", "test-key")
+    monkeypatch.setattr(reddit_newsletter, "llm_concurrency", 2)
+    monkeypatch.setattr(async_pipeline, "get_async_http_client", lambda: FakeClient())
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def stream():
+        return "".join([delta async for delta in async_pipeline.stream_openrouter_request_async(messages)])
+
+    async def main():
+        return await asyncio.gather(*(async_pipeline.make_openrouter_request_async(messages) for _ in range(3)),
+                                    *(stream() for _ in range(3)))
+
+    assert asyncio.run(main()) == ["done"] * 6
+    assert max(peak) == 2
+    assert asyncio.run(main()) == ["done"] * 6  # a new loop gets its own semaphore
+
+def test_async_overlapped_mode_runs_map_reduce(monkeypatch):
+    """ANALYSIS_MODE=overlapped must not fall back to the single-prompt analysis in the async pipeline"""
+    import asyncio
+    from app.core import async_pipeline, reddit_newsletter
+
+    calls = []
+
+    async def fake_mapreduce(scraped_data, subreddit_name="LocalLLaMA", **kwargs):
+        calls.append("mapreduce")
+        return "merged"
+
+    async def fake_single(scraped_data, subreddit_name="LocalLLaMA", stats=None):
+        calls.append("single")
+        return "single"
+
+    monkeypatch.setattr(async_pipeline, "analyze_content_mapreduce_async", fake_mapreduce)
+    monkeypatch.setattr(async_pipeline, "analyze_content_async", fake_single)
+    monkeypatch.setattr(reddit_newsletter, "analysis_mode", "overlapped")
+    stats = {}
+
+    assert asyncio.run(async_pipeline.run_analysis_async([], "test", stats=stats)) == "merged"
+    assert calls == ["mapreduce"]
+    assert stats["analyze_mode"] == "overlapped"
+
+def test_async_mapreduce_runs_batches_concurrently(monkeypatch):
+    """Async batch summaries overlap up to the concurrency limit"""
+    import asyncio
+    from app.core import async_pipeline
+
+    active = []
+    peak = []
+
+    async def fake_request(messages, max_tokens=1500, temperature=0.7, **kwargs):
+        active.append(1)
+        peak.append(len(active))
+        await asyncio.sleep(0.05)
+        active.pop()
+        return "summary"
+
+    monkeypatch.setattr(async_pipeline, "make_openrouter_request_async", fake_request)
+    posts = [{"title": f"Post {i}", "url": f"https://example.com/{i}", "comments": ["word " * 50]} for i in range(8)]
+
+    result = asyncio.run(async_pipeline.analyze_content_mapreduce_async(posts, "test", batch_tokens=60, concurrency=3))
+    assert result == "summary"
+    assert max(peak) == 3
+
+def test_benchmark_stubs_drive_pipeline_and_compare_flags_regressions(monkeypatch):
+    """The benchmark harness runs kickoff against its stubs and flags slower runs"""
+    from app.core import reddit_newsletter
+    from benchmarks import bench
+    from benchmarks.stub_openrouter import start_stub
+    from benchmarks.stub_reddit import StubReddit
+
+    stub = start_stub(latency=0.01, chunks=2, words=20)
+    reddit = StubReddit(latency=0, posts=3, comments_per_post=4, comment_words=5)
+    monkeypatch.setattr(reddit_newsletter, "base_url", f"http://127.0.0.1:{stub.server_address[1]}/api/v1")
+    monkeypatch.setattr(reddit_newsletter, "api_key", "stub")
+    monkeypatch.setattr(reddit_newsletter, "get_reddit_client", lambda: reddit)
+    monkeypatch.setattr(reddit_newsletter, "scrape_cache_url", "")
+    monkeypatch.setattr(reddit_newsletter, "_scrape_cache", None)
+    monkeypatch.setattr(reddit_newsletter, "reddit_rate_limiter", TokenBucket(rate=1000, capacity=1000))
+    try:
+        report = bench.kickoff_scenario(total=4, concurrency=2)
+    finally:
+        stub.shutdown()
+
+    assert report["errors"] == 0
+    assert report["throughput_rps"] > 0
+    assert report["p50"] <= report["p95"] <= report["p99"]
+    assert stub.requests == 8  # one analysis and one newsletter call per run
+    assert "scrape_seconds" in report["stages"]
+
+    baseline = {"scenarios": {"kickoff": dict(report, p95=report["p95"] / 2)}}
+    _, regressions = bench.compare({"scenarios": {"kickoff": report}}, baseline, threshold=0.2)
+    assert "kickoff.p95" in regressions
+    _, regressions = bench.compare({"scenarios": {"kickoff": report}}, {"scenarios": {"kickoff": report}}, 0.2)
+    assert regressions == []
+
+    run = {"python": "3.11.7", "platform": "Linux", "parameters": {"requests": 20, "threshold": 0.2}}
+    assert bench.baseline_mismatches(run, dict(run, parameters={"requests": 20, "threshold": 0.5})) == []
+    assert bench.baseline_mismatches(run, dict(run, python="3.12.1", parameters={"requests": 40})) == [
+        "python", "--requests"]
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -6,12 +6,16 @@ Production-ready entry point for Docker deployment
 
 import os
 import sys
+import time
 
 # Add the current directory to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from app.main import app, logger
+import_started = time.perf_counter()
+from app.main import app, logger, init_worker, preload
+from app.core.startup import record_startup
 from config import config
+record_startup("import", time.perf_counter() - import_started)
 
 # Configure for production
 if __name__ != '__main__':
@@ -19,12 +23,18 @@ if __name__ != '__main__':
     logger.info("Starting Reddit Newsletter Flask App via WSGI...")
     logger.info(f"OpenRouter Model: {config.OPENROUTER_MODEL}")
     logger.info(f"OpenRouter API Key configured: {config.has_openrouter_config}")
+    if config.PRELOAD_APP:
+        # This is the gunicorn master; each worker runs init_worker from the post_fork hook
+        preload()
+    else:
+        init_worker()
 
 # For direct execution (development only)
 if __name__ == '__main__':
     logger.info("Starting Reddit Newsletter Flask App in development mode...")
     logger.info(f"OpenRouter Model: {config.OPENROUTER_MODEL}")
     logger.info(f"OpenRouter API Key configured: {config.has_openrouter_config}")
+    init_worker()
     
     app.run(
         host=config.FLASK_HOST,